@@ -3,22 +3,20 @@ import sys
 import pysqlite3
 sys.modules['sqlite3'] = pysqlite3  # Replace the sqlite3 module with pysqlite3 to ensure compatibility
 
-from langchain_openai.chat_models import ChatOpenAI  # Import the chat model from LangChain and OpenAI
+import time  # Import time module to measure the response and rerun latency
+rerun_start_time = time.perf_counter()  # Streamlit re-executes this script on every interaction
+
 import streamlit as st  # Import Streamlit for the user interface
-from dotenv import load_dotenv  # Import function to load environment variables from a .env file
-from langchain_openai import OpenAIEmbeddings  # Import OpenAI embeddings function
-from langchain_chroma import Chroma  # Import Chroma for the vector database
-from langchain.prompts import PromptTemplate  # Import prompt template
-from langchain_core.runnables import RunnableSequence  # Import runnable sequence
-import os  # Import the OS module to interact with the operating system
-from openai import OpenAIError  # Import OpenAIError for error handling
+import requests  # Import requests to catch the errors of the query service
+import resources  # Import the process-wide registry of shared resources (query service, HTTP client)
+import tracing  # Import the spans and counters of every answer (turned on with TRACING=1)
+from chat_history import ConversationHistory  # Import the bounded history of a session (recent turns + summary)
 
-# Load environment variables from a .env file
-load_dotenv()
+tracing.configure(service='app')
 
-# Retrieve the OpenAI API key from environment variables
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-persist_directory = './chroma_db'  # Directory where the Chroma database will be stored
+# -------------- CHAT CONFIGURATION --------------
+streaming_enabled = True  # Render the answer token by token instead of waiting for the whole answer
+busy_message = "The assistant is busy right now, please ask again in a few seconds."  # Shown when the service queue is full
 
 # -------------- STREAMLIT CONFIGURATION --------------
 # Set the configuration for the Streamlit app
@@ -37,55 +35,116 @@ st.set_page_config(
     },
 )
 
-# -------------- LOAD EMBEDDINGS --------------
-# Function to load embeddings from ChromaDB
-def load_embeddings(persist_directory):
-    # Initialize OpenAI embeddings with the specified model and API key
-    embeddings = OpenAIEmbeddings(model='text-embedding-ada-002', api_key=OPENAI_API_KEY)
-    # Initialize Chroma with the embeddings function and the persistence directory
-    vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-    return vectordb
-
-# Load the embeddings and store them in vectordb
-vectordb = load_embeddings(persist_directory)
-
-# -------------- LOAD PROMPT TEMPLATE --------------
-# Define the prompt template for the assistant
-prompt_template = """
-You are a knowledgeable and helpful assistant designed to support employees of Oakdene Hollins by providing insights and answers based on the company's extensive database of reports and insights. Your goal is to offer clear, detailed, and contextually accurate responses. Ensure your answers are relevant to the employee's role and needs, and include practical steps or recommendations when appropriate.
-
-Context: {context}
-
-Employee Question: {input}
-
-Answer:
-"""
-
-# Initialize the language model with the specified prompt template
-llm = ChatOpenAI(model="gpt-4", max_tokens=1024, api_key=OPENAI_API_KEY)
-# Create a prompt template object
-prompt = PromptTemplate(input_variables=["input", "context"], template=prompt_template)
-# Create a sequence of runnables with the prompt first and the language model last
-qa_chain = RunnableSequence(first=prompt, last=llm)
-
 # -------------- FUNCTIONS --------------
+# The questions are answered by the query service (query_service.py): retrieval, cache and model
+# calls run there, shared by every session; these functions only send the question and its history
+
+# Function to send a question to the query service, returns the HTTP response (open when streaming)
+def ask_service(question, stream, history=None):
+    body = {'question': question, 'stream': stream}
+    if history is not None:
+        body['history'] = history
+    return resources.get_http_session().post(
+        f"{resources.get_query_service()}/answer", json=body, stream=stream,
+        timeout=(10, resources.query_service_timeout),
+    )
+
+# Function to get the history sent with the last message: the summary and the recent turns before it
+def history_payload(messages, history):
+    if history is None:
+        return None
+    return history.payload(messages[:-1])
+
+# Function to fold turns of a conversation into its summary with the query service, None when it failed
+def summarize_turns(summary, turns):
+    try:
+        response = resources.get_http_session().post(
+            f"{resources.get_query_service()}/summarize", json={'summary': summary, 'turns': turns},
+            timeout=(10, resources.query_service_timeout),
+        )
+        if response.status_code != 200:
+            return None
+        return response.json()['summary']
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+# Function to get the message shown for a failed request to the service
+def service_error(response):
+    if response.status_code == 503:
+        return busy_message
+    try:
+        return f"Error: {response.json()['error']}"
+    except (ValueError, KeyError):
+        return f"Error: query service answered {response.status_code}"
+
 # Function to get AI response based on user messages
-def get_ai_response(messages):
-    # Concatenate all messages to form the context
-    context = ""
-    for msg in messages:
-        context += f"{msg['role']}: {msg['content']}\n"
-    
-    # Prepare input data for the model
-    input_data = {"input": messages[-1]['content'], "context": context}
+def get_ai_response(messages, history=None):
+    question = messages[-1]['content']
     try:
-        # Invoke the sequence to get the answer
-        answer = qa_chain.invoke(input_data)
-        return answer if isinstance(answer, str) else answer.content
-    except OpenAIError as e:
-        # Handle any errors that occur during the API call
+        response = ask_service(question, stream=False, history=history_payload(messages, history))
+        if response.status_code != 200:
+            return service_error(response)
+        return response.json()['answer']
+    except requests.RequestException as e:
+        # Handle any errors that occur during the call to the service
         return f"Error: {e}"
 
+# Function to stream the AI response token by token as the model generates it
+def stream_ai_response(messages, history=None):
+    question = messages[-1]['content']
+    try:
+        with ask_service(question, stream=True, history=history_payload(messages, history)) as response:
+            if response.status_code != 200:
+                yield service_error(response)
+                return
+            response.encoding = 'utf-8'
+            for text in response.iter_content(chunk_size=None, decode_unicode=True):
+                if text:
+                    yield text
+    except requests.RequestException as e:
+        # Handle any errors that occur during the call to the service
+        yield f"Error: {e}"
+
+# Function to build the HTML of a chat message
+def format_message(role, content):
+    if role == 'user':
+        return f"<div style='padding: 10px; border-radius: 10px; margin: 10px 0; text-align: left;'><b><u>You</u></b><br>{content}</div>"
+    return f"<div style='background-color: #4D4D4D; color: white; padding: 10px; border-radius: 10px; margin: 10px 0; text-align: left;'><b><u>Assistant</u></b><br>{content}</div>"
+
+# Function to answer the last user message inside the given container
+def answer_pending_question(container):
+    messages = st.session_state['messages']
+    history = st.session_state['history']
+    start_time = time.perf_counter()
+    first_token_time = None
+    # The request span covers the answer and the rendering of its tokens in the page
+    with tracing.span('chat.request', streaming=streaming_enabled) as request_span:
+        with container:
+            placeholder = st.empty()
+            if streaming_enabled:
+                # Render the tokens into the assistant bubble as they arrive
+                answer = ""
+                for text in stream_ai_response(messages, history):
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - start_time
+                    answer += text
+                    placeholder.markdown(format_message('assistant', answer + " ▌"), unsafe_allow_html=True)
+            else:
+                with st.spinner('Getting response...'):
+                    answer = get_ai_response(messages, history)
+            total_time = time.perf_counter() - start_time
+            placeholder.markdown(format_message('assistant', answer), unsafe_allow_html=True)
+        request_span.set('time_to_first_token_ms', round((first_token_time or total_time) * 1000, 3))
+    messages.append({'role': 'assistant', 'content': answer})
+    # Fold the turns that left the verbatim window into the summary while the user reads the answer
+    history.fold_in_background(list(messages), summarize_turns, resources.get_history_executor())
+    # Time-to-first-token is what users perceive, total latency is reported separately
+    st.session_state['last_metrics'] = {
+        'time_to_first_token': first_token_time if first_token_time is not None else total_time,
+        'total_latency': total_time,
+    }
+    tracing.flush()
+
 # Function to handle the chat interface and logic
 def chat():
     # Display the title and subtitle of the chat interface
@@ -98,32 +157,66 @@ def chat():
     # Initialize session state for messages if not already done
     if 'messages' not in st.session_state:
         st.session_state['messages'] = [welcome_message]
+    if 'history' not in st.session_state:
+        st.session_state['history'] = ConversationHistory(recent_turns=resources.history_recent_turns)
     
-    # Function to handle the submission of user input
+    # Function to handle the submission of user input, the answer is generated during the rerun
     def submit():
         user_input = st.session_state.user_input.strip()
         if user_input:  # Check if the message is not blank
             st.session_state['messages'].append({'role': 'user', 'content': user_input})
-            
-            with st.spinner('Getting response...'):
-                ai_response = get_ai_response(st.session_state['messages'])
-                st.session_state['messages'].append({'role': 'assistant', 'content': ai_response})
             # Clear the input after submission
             st.session_state.user_input = ''
 
     # Display the messages
-    if st.session_state['messages']:
+    messages_container = st.container()
+    with messages_container:
         for msg in st.session_state['messages']:
-            if msg['role'] == 'user':
-                st.markdown(f"<div style='padding: 10px; border-radius: 10px; margin: 10px 0; text-align: left;'><b><u>You</u></b><br>{msg['content']}</div>", unsafe_allow_html=True)
-            else:
-                st.markdown(f"<div style='background-color: #4D4D4D; color: white; padding: 10px; border-radius: 10px; margin: 10px 0; text-align: left;'><b><u>Assistant</u></b><br>{msg['content']}</div>", unsafe_allow_html=True)
+            st.markdown(format_message(msg['role'], msg['content']), unsafe_allow_html=True)
 
     # Form to input new user messages
     with st.form(key='chat_form', clear_on_submit=True):
         st.text_area("You:", key='user_input')
         st.form_submit_button(label='Send', on_click=submit)
 
+    # Time spent re-executing the script, before any answer is generated
+    rerun_time = time.perf_counter() - rerun_start_time
+    tracing.record('app.rerun', rerun_time)
+
+    # Answer the last user message below the conversation
+    if st.session_state['messages'][-1]['role'] == 'user':
+        answer_pending_question(messages_container)
+
+    # Show the latency of the last answer in the sidebar
+    if 'last_metrics' in st.session_state:
+        metrics = st.session_state['last_metrics']
+        st.sidebar.metric("Time to first token", f"{metrics['time_to_first_token']:.2f} s")
+        st.sidebar.metric("Total latency", f"{metrics['total_latency']:.2f} s")
+
+    # Show the running summary of the older turns, sent with every question instead of the whole conversation
+    history = st.session_state['history']
+    if history.summary:
+        with st.sidebar.expander("Conversation summary"):
+            st.write(history.summary)
+            st.caption(f"{history.folded // 2} earlier turns summarized, the last {history.recent_turns} sent verbatim")
+
+    # Show the counters of the query service and its cache in the sidebar, to tune the workers,
+    # the queue and the similarity threshold
+    if resources.is_loaded(resources.get_query_service):
+        with st.sidebar.expander("Query service statistics"):
+            try:
+                st.json(resources.get_http_session().get(f"{resources.get_query_service()}/stats", timeout=2).json())
+            except requests.RequestException as e:
+                st.write(f"Unavailable: {e}")
+
+    # Show the startup and rerun timings to check that reruns stay cheap
+    with st.sidebar.expander("Startup and rerun timings"):
+        st.json({
+            'rerun_overhead_ms': round(rerun_time * 1000, 2),
+            'process_uptime_s': round(time.perf_counter() - resources.PROCESS_START, 1),
+            'resource_init_s': {name: round(seconds, 3) for name, seconds in resources.resource_timings().items()},
+        })
+
     # Add footer centered at the bottom
     st.markdown("<p style='text-align: right; color: gray'>App developed by Pablo Sánchez.</p>", unsafe_allow_html=True)
 
@@ -0,0 +1,118 @@
+import os  # Import the OS module to write the site files
+import time  # Import time module to simulate the network latency
+import random  # Import random to generate deterministic article texts
+import argparse  # Import argparse to serve the site from the command line
+import functools  # Import functools to configure the request handler
+from datetime import date, timedelta  # Import date helpers to generate the lastmod values
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler  # Import the standard library HTTP server
+from benchmarks.synthetic_pdfs import generate_corpus, document_title, paragraph  # Import the synthetic PDF corpus
+
+# Local copy of the shape of the crawled site, to benchmark the crawlers fully offline:
+#   python -m benchmarks.fixture_site /tmp/site --reports 50 --articles 50 --port 8099 --latency 0.02
+#   SITEMAP_SOURCE=http://127.0.0.1:8099/sitemap.xml URL_DOMAIN=http://127.0.0.1:8099 python crawl.py reports --restart
+# robots.txt, a sitemap, report pages linking their PDFs and news-insights articles with the
+# usual page furniture (header, navigation, share buttons, footer) around the text
+
+START_DATE = date(2022, 1, 1)  # lastmod of the first page, one more day per page
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title}</title>{meta}</head>
+<body>
+<header class="Header"><div class="Header-branding-logo">Oakdene Hollins</div>
+<nav class="Header-nav"><a href="/">Home</a> <a href="/reports/">Reports</a> <a href="/news-insights/">News</a> <a href="/about/">About</a></nav></header>
+<main>{content}</main>
+<div class="share-buttons"><a href="#">Share on LinkedIn</a> <a href="#">Share on X</a></div>
+<footer class="Footer"><p>Oakdene Hollins Ltd, registered in England. Cookie policy. Privacy.</p></footer>
+</body></html>
+"""
+
+# Function to write a file of the site, creating its directories
+def _write(directory, path, text):
+    path = os.path.join(directory, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+# Function to build the HTML of an article with sections
+def article_html(generator, number):
+    title, _, topic = document_title(number)
+    title = title.replace('Report', 'Insight')
+    sections = [f"<h1>{title}</h1>", f"<p><time datetime=\"{START_DATE + timedelta(days=number)}\">"
+                                     f"{START_DATE + timedelta(days=number)}</time></p>"]
+    for section in range(3):
+        sections.append(f"<h2>Section {section + 1}: {generator.choice(['Findings', 'Background', 'Policy', 'Outlook'])}</h2>")
+        sections.extend(f"<p>{paragraph(generator, topic, sentences=5)}</p>" for _ in range(3))
+    meta = f'<meta property="article:published_time" content="{START_DATE + timedelta(days=number)}">'
+    return PAGE_TEMPLATE.format(title=title, meta=meta, content=f"<article>{''.join(sections)}</article>")
+
+# Function to generate the site: `reports` report pages with one PDF each and `articles` articles
+# Returns the paths listed in the sitemap
+def generate_site(directory, reports=50, articles=50, pages_per_pdf=5, seed=0):
+    generator = random.Random(seed)
+    generate_corpus(os.path.join(directory, 'files'), reports, pages_per_pdf, seed=seed)
+    paths = []
+    for number in range(reports):
+        title, code, topic = document_title(number)
+        content = (f"<h1>{title}</h1><p>{paragraph(generator, topic)}</p>"
+                   f"<p>Reference {code}. <a href=\"/files/report-{number + 1:04d}.pdf\">Download the report (PDF)</a></p>")
+        _write(directory, f"reports/report-{number + 1}/index.html", PAGE_TEMPLATE.format(title=title, meta='', content=content))
+        paths.append(f"/reports/report-{number + 1}/")
+    for number in range(articles):
+        _write(directory, f"news-insights/article-{number + 1}/index.html", article_html(generator, number))
+        paths.append(f"/news-insights/article-{number + 1}/")
+    # Pages outside the crawled sections, and a section robots.txt forbids
+    _write(directory, 'about/index.html', PAGE_TEMPLATE.format(title='About', meta='', content='<p>About us.</p>'))
+    _write(directory, 'reports/private/index.html', PAGE_TEMPLATE.format(title='Private', meta='', content='<p>Private.</p>'))
+    paths += ['/about/', '/reports/private/']
+    _write(directory, 'robots.txt', "User-agent: *\nDisallow: /reports/private/\n")
+    return paths
+
+# Function to write the sitemap of the site for a base URL (the port is only known once serving)
+def write_sitemap(directory, base_url, paths):
+    entries = ''.join(f"<url><loc>{base_url}{path}</loc><lastmod>{START_DATE + timedelta(days=number)}</lastmod></url>\n"
+                      for number, path in enumerate(paths))
+    _write(directory, 'sitemap.xml', '<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n' + entries + '</urlset>\n')
+
+# Class serving the site files with keep-alive connections and a simulated latency
+class FixtureSiteHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like a real site
+
+    def __init__(self, *args, latency=0.0, verbose=False, **kwargs):
+        self.latency = latency
+        self.verbose = verbose
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def send_head(self):
+        time.sleep(self.latency)
+        return super().send_head()
+
+# Function to start serving a site directory, returns the server (port 0 picks a free port)
+def make_server(directory, host='127.0.0.1', port=0, latency=0.0, verbose=False):
+    handler = functools.partial(FixtureSiteHandler, directory=directory, latency=latency, verbose=verbose)
+    return ThreadingHTTPServer((host, port), handler)
+
+# Function to parse the site configuration
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and serve the offline fixture site")
+    parser.add_argument('directory', help="Directory of the site files")
+    parser.add_argument('--reports', type=int, default=50, help="Report pages, each linking one PDF")
+    parser.add_argument('--articles', type=int, default=50, help="News-insights articles")
+    parser.add_argument('--pages-per-pdf', type=int, default=5)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    site_paths = generate_site(args.directory, args.reports, args.articles, args.pages_per_pdf)
+    server = make_server(args.directory, args.host, args.port, args.latency, args.verbose)
+    write_sitemap(args.directory, f"http://{args.host}:{server.server_port}", site_paths)
+    print(f"Fixture site listening on http://{args.host}:{server.server_port}/sitemap.xml")
+    server.serve_forever()
@@ -0,0 +1,126 @@
+import os  # Import the OS module to manage the generated files
+import re  # Import the regular expression module for the legacy parser
+import sys  # Import sys to make the repository modules importable
+import gzip  # Import gzip to write compressed sitemaps
+import time  # Import time module to measure the parsing time
+import json  # Import json to print the results
+import shutil  # Import shutil to remove the generated files
+import resource  # Import resource to measure the peak memory
+import argparse  # Import argparse to configure the benchmark from the command line
+import tempfile  # Import tempfile to write the synthetic sitemaps
+import multiprocessing  # Import multiprocessing to measure every parser in a fresh process
+from datetime import date, timedelta  # Import date helpers to generate the lastmod values
+from lxml import etree  # Import lxml for the legacy parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sitemap import iter_sitemap_urls  # Import the streaming sitemap parser
+
+# Benchmark of the sitemap parsing on a synthetic sitemap:
+#   python -m benchmarks.sitemap_benchmark --urls 1000000
+#   python -m benchmarks.sitemap_benchmark --urls 1000000 --index --gzip --legacy
+
+SECTIONS = ['reports', 'news-insights', 'about', 'insights', 'events']  # Path sections of the synthetic URLs
+START_DATE = date(2020, 1, 1)  # lastmod of the first URL, one more day every 1000 URLs
+
+# Function to write the <url> entries from `start` to `end`
+def write_urlset(path, start, end, compress):
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for number in range(start, end):
+            section = SECTIONS[number % len(SECTIONS)]
+            lastmod = START_DATE + timedelta(days=number // 1000)
+            f.write(f'<url><loc>https://example.com/{section}/page-{number}?a=1&b=2</loc>'
+                    f'<lastmod>{lastmod.isoformat()}</lastmod></url>\n')
+        f.write('</urlset>\n')
+
+# Function to generate the synthetic sitemap: a single file or an index of 50000-URL children
+def generate_sitemap(directory, urls, index, compress):
+    suffix = '.xml.gz' if compress else '.xml'
+    if not index:
+        path = os.path.join(directory, f"sitemap{suffix}")
+        write_urlset(path, 0, urls, compress)
+        return path
+    children = []
+    for part, start in enumerate(range(0, urls, 50000)):
+        name = f"sitemap-{part}{suffix}"
+        end = min(urls, start + 50000)
+        write_urlset(os.path.join(directory, name), start, end, compress)
+        children.append((name, START_DATE + timedelta(days=(end - 1) // 1000)))
+    path = os.path.join(directory, 'sitemap-index.xml')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for name, lastmod in children:
+            f.write(f'<sitemap><loc>{name}</loc><lastmod>{lastmod.isoformat()}</lastmod></sitemap>\n')
+        f.write('</sitemapindex>\n')
+    return path
+
+# Function reproducing the previous parser: whole file in one string, then one lxml tree
+def legacy_filtered_urls(file_path, path_prefix):
+    cleaned_content = ""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip().startswith("<"):
+                cleaned_content += line
+    cleaned_content = re.sub(r'&(?!(amp|lt|gt|quot|apos);)', '&amp;', cleaned_content)
+    root = etree.fromstring(cleaned_content.encode('utf-8'), parser=etree.XMLParser(huge_tree=True))
+    loc_tags = root.xpath('//ns:loc', namespaces={'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'})
+    return [loc.text for loc in loc_tags if path_prefix in loc.text]
+
+# Function run in a child process: parse the sitemap and report the time and peak memory
+def measure(parser_name, path, path_prefix, lastmod_since, results):
+    start_time = time.perf_counter()
+    if parser_name == 'legacy':
+        count = len(legacy_filtered_urls(path, path_prefix))
+    else:
+        count = sum(1 for _ in iter_sitemap_urls(path, [path_prefix], lastmod_since))
+    elapsed = time.perf_counter() - start_time
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put({'parser': parser_name, 'lastmod_since': lastmod_since, 'urls': count,
+                 'seconds': round(elapsed, 2), 'peak_rss_mb': round(peak_mb, 1)})
+
+# Function to run one measurement in a fresh process so the peak memory is not shared
+def run_measurement(parser_name, path, path_prefix, lastmod_since=None):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=measure, args=(parser_name, path, path_prefix, lastmod_since, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+# Function to parse the benchmark configuration
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the streaming sitemap parser on a synthetic sitemap")
+    parser.add_argument('--urls', type=int, default=1000000, help="Number of URLs in the sitemap")
+    parser.add_argument('--index', action='store_true', help="Split the sitemap in a sitemap index of 50000-URL files")
+    parser.add_argument('--gzip', action='store_true', help="Compress the sitemap files (.xml.gz)")
+    parser.add_argument('--prefix', default='/reports/', help="Path prefix filter")
+    parser.add_argument('--since', default=None, help="lastmod filter (YYYY-MM-DD), the second half of the URLs by default")
+    parser.add_argument('--legacy', action='store_true', help="Also run the previous whole-document parser (single plain file only)")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated files")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix='sitemap-benchmark-')
+    try:
+        start_time = time.perf_counter()
+        path = generate_sitemap(directory, args.urls, args.index, args.gzip)
+        size_mb = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1e6
+        print(f"Generated {args.urls} URLs ({size_mb:.1f} MB) in {time.perf_counter() - start_time:.1f} seconds: {path}")
+
+        since = args.since or (START_DATE + timedelta(days=args.urls // 2000)).isoformat()
+        results = [run_measurement('streaming', path, args.prefix), run_measurement('streaming', path, args.prefix, since)]
+        if args.legacy and not (args.index or args.gzip):
+            results.append(run_measurement('legacy', path, args.prefix))
+        for result in results:
+            # Rate over every URL of the sitemap, not only the ones kept by the filters
+            result['sitemap_urls_per_second'] = round(args.urls / result['seconds']) if result['seconds'] else None
+        print(json.dumps({'urls': args.urls, 'index': args.index, 'gzip': args.gzip, 'size_mb': round(size_mb, 1),
+                          'results': results}, indent=2))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
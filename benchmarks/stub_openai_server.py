@@ -0,0 +1,164 @@
+import re  # Import the regular expression module to tokenize the texts
+import json  # Import json to read the requests and write the responses
+import time  # Import time module to simulate the API latency
+import hashlib  # Import hashlib to map words to embedding dimensions deterministically
+import argparse  # Import argparse to configure the stub from the command line
+import threading  # Import threading to count requests across handler threads
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # Import the standard library HTTP server
+
+# Local stand-in for the OpenAI API, used to run the embedding and chat code fully offline:
+#   python -m benchmarks.stub_openai_server --port 8089 --latency 0.05 --rate-limit-every 10
+#   python -m benchmarks.stub_openai_server --chat-latency 0.4 --token-latency 0.02 --answer-tokens 150
+#   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub python update_embeddings.py
+
+# Function to build a deterministic embedding: hashed bag of words, L2-normalized
+# Texts sharing words get similar vectors, so retrieval and similarity thresholds behave sensibly
+def fake_embedding(text, dims):
+    vector = [0.0] * dims
+    for word in re.findall(r'\w+', text.lower()):
+        digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], 'little') % dims
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(value * value for value in vector) ** 0.5
+    if norm == 0:
+        vector[0], norm = 1.0, 1.0
+    return [value / norm for value in vector]
+
+# Function to build a deterministic answer of `tokens` words from the words of the prompt
+def fake_answer(messages, tokens):
+    prompt = ' '.join(message.get('content') or '' for message in messages if isinstance(message.get('content'), str))
+    words = re.findall(r'\w+', prompt) or ['answer']
+    start = int.from_bytes(hashlib.blake2b(prompt.encode('utf-8'), digest_size=4).digest(), 'little') % len(words)
+    return ' '.join(words[(start + i) % len(words)] for i in range(tokens))
+
+# Function to turn an input item into text (LangChain may send token IDs instead of strings)
+def input_to_text(item):
+    if isinstance(item, str):
+        return item
+    try:
+        import tiktoken  # Import tiktoken to decode token IDs back to text
+        return tiktoken.get_encoding('cl100k_base').decode(item)
+    except Exception:
+        return ' '.join(f"t{token}" for token in item)
+
+# Function to build the request handler class for a given configuration
+def make_handler(config):
+    counter = {'requests': 0}
+    lock = threading.Lock()
+
+    class StubOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            if config.verbose:
+                super().log_message(format, *args)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with lock:
+                counter['requests'] += 1
+                request_number = counter['requests']
+            # Simulate rate limiting every N requests
+            if config.rate_limit_every and request_number % config.rate_limit_every == 0:
+                self._send_json(429, {'error': {'message': 'Rate limit reached (stub)', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                                headers={'Retry-After': str(config.retry_after)})
+                return
+            if self.path.rstrip('/').endswith('/embeddings'):
+                self._embeddings(body)
+            elif self.path.rstrip('/').endswith('/chat/completions'):
+                self._chat_completions(body)
+            else:
+                self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+        def _embeddings(self, body):
+            items = body.get('input', [])
+            if isinstance(items, str) or (items and isinstance(items[0], int)):
+                items = [items]
+            texts = [input_to_text(item) for item in items]
+            time.sleep(config.latency + config.latency_per_item * len(texts))
+            tokens = sum(len(text.split()) for text in texts)
+            self._send_json(200, {
+                'object': 'list',
+                'model': body.get('model', 'stub'),
+                'data': [
+                    {'object': 'embedding', 'index': index, 'embedding': fake_embedding(text, config.dims)}
+                    for index, text in enumerate(texts)
+                ],
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+            })
+
+        # Chat answer: the first token after `chat_latency`, then one token every `token_latency`
+        def _chat_completions(self, body):
+            messages = body.get('messages', [])
+            words = fake_answer(messages, config.answer_tokens).split(' ')
+            prompt_tokens = sum(len(str(message.get('content', '')).split()) for message in messages)
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(words),
+                     'total_tokens': prompt_tokens + len(words)}
+            completion = {'id': 'chatcmpl-stub', 'created': int(time.time()), 'model': body.get('model', 'stub')}
+            time.sleep(config.chat_latency)
+            if not body.get('stream'):
+                time.sleep(config.token_latency * len(words))
+                self._send_json(200, {**completion, 'object': 'chat.completion', 'usage': usage, 'choices': [{
+                    'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': ' '.join(words)},
+                }]})
+                return
+            # Server-sent events in a chunked response, the connection stays open for the next request
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for index, word in enumerate(words):
+                if index:
+                    time.sleep(config.token_latency)
+                delta = {'role': 'assistant', 'content': word} if index == 0 else {'content': ' ' + word}
+                self._send_event({**completion, 'object': 'chat.completion.chunk',
+                                  'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+            self._send_event({**completion, 'object': 'chat.completion.chunk',
+                              'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+            self._send_chunk(b'data: [DONE]\n\n')
+            self._send_chunk(b'')
+
+        def _send_event(self, payload):
+            self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+
+        def _send_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return StubOpenAIHandler
+
+# Function to parse the stub configuration
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI API for offline tests and benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--dims', type=int, default=1536, help="Dimensions of the embeddings")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds added to every request")
+    parser.add_argument('--latency-per-item', type=float, default=0.0, help="Seconds added per embedded text")
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="Answer 429 to every Nth request (0 disables it)")
+    parser.add_argument('--chat-latency', type=float, default=0.3, help="Seconds before the first token of an answer")
+    parser.add_argument('--token-latency', type=float, default=0.01, help="Seconds between two tokens of an answer")
+    parser.add_argument('--answer-tokens', type=int, default=100, help="Words of every answer")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After sent with the 429 responses")
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+# Function to start the stub server, returns it so it can run in a background thread
+def make_server(config):
+    return ThreadingHTTPServer((config.host, config.port), make_handler(config))
+
+if __name__ == '__main__':
+    config = parse_args()
+    server = make_server(config)
+    print(f"Stub OpenAI API listening on http://{config.host}:{server.server_port}/v1")
+    server.serve_forever()
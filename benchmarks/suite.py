@@ -0,0 +1,555 @@
+import os  # Import the OS module to manage the working directories
+import io  # Import io to silence the output of the crawlers
+import sys  # Import sys to make the repository modules importable
+import json  # Import json to write and compare the results
+import time  # Import time module to measure every stage
+import queue  # Import queue to wait for the stage processes
+import shutil  # Import shutil to remove the generated files
+import asyncio  # Import asyncio to run the crawlers
+import logging  # Import logging to quiet the ingest logs
+import platform  # Import platform to describe the machine in the results
+import argparse  # Import argparse to configure the suite from the command line
+import resource  # Import resource to measure the peak memory outside Linux
+import tempfile  # Import tempfile for the working directories
+import threading  # Import threading to serve the fixture site and the API stub
+import traceback  # Import traceback to report a failed stage
+import contextlib  # Import contextlib to redirect the output of the stages
+import subprocess  # Import subprocess to read the commit being measured
+import urllib.request  # Import urllib to read the counters of the query service
+import multiprocessing  # Import multiprocessing to run every stage in a fresh process
+import numpy as np  # Import NumPy for the latency percentiles
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRECTORY)
+from benchmarks import fixture_site, stub_openai_server, synthetic_pdfs  # Import the offline stand-ins
+
+# Offline benchmark suite: crawler, ingest, retrieval, end-to-end chat latency and query service load, as JSON
+#   python -m benchmarks.suite --output bench.json
+#   python -m benchmarks.suite --sizes small,medium --output new.json --compare bench.json
+# A local fixture site stands in for the website and the API stub for OpenAI (embeddings and chat,
+# with configurable latency); every stage runs in a fresh process of its own working directory
+# tiktoken needs its cl100k_base file in the cache (TIKTOKEN_CACHE_DIR) to run without network, the suite
+# checks it before starting; seed the cache once with network access:
+#   TIKTOKEN_CACHE_DIR=./tiktoken_cache python -c "import tiktoken; tiktoken.get_encoding('cl100k_base')"
+
+SUITE_VERSION = 2  # Changes when the meaning of a metric changes, results of other versions are not compared
+QUESTION_TEMPLATES = [
+    "What does the research say about {topic}?",
+    "How can {topic} reduce costs for manufacturers?",
+    "Which policies support {topic} in the retail sector?",
+    "What are the main findings on {topic} and emissions?",
+]
+QUESTION_SCOPES = ["", " in the UK", " in Europe", " for small businesses", " for local authorities", " since 2020"]
+KEYWORD_QUESTIONS = ["OH-{number:04d}", "{acronym}", "{title}"]
+
+# -------------- MEASUREMENT HELPERS --------------
+# Function to summarize latencies (seconds) as milliseconds percentiles
+def latency_summary(samples):
+    if not samples:
+        return {'count': 0}
+    milliseconds = np.array(samples) * 1000
+    return {
+        'count': len(samples),
+        'mean_ms': round(float(milliseconds.mean()), 2),
+        'p50_ms': round(float(np.percentile(milliseconds, 50)), 2),
+        'p95_ms': round(float(np.percentile(milliseconds, 95)), 2),
+        'p99_ms': round(float(np.percentile(milliseconds, 99)), 2),
+    }
+
+# Function to get the peak resident memory of this process in MB (VmHWM, ru_maxrss outside Linux)
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# Function to get the resident memory of this process and all its descendants in MB (Linux only)
+def process_tree_rss_mb():
+    parents = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/stat", 'r') as f:
+                    # The process name may hold spaces, the parent PID is the second field after it
+                    parents[int(name)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, frontier = {os.getpid()}, [os.getpid()]
+    while frontier:
+        parent = frontier.pop()
+        for pid, ppid in parents.items():
+            if ppid == parent and pid not in tree:
+                tree.add(pid)
+                frontier.append(pid)
+    total_kb = 0
+    for pid in tree:
+        try:
+            with open(f"/proc/{pid}/status", 'r') as f:
+                total_kb += next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), 0)
+        except OSError:
+            continue
+    return total_kb / 1024
+
+# Class sampling the memory of the process tree (the stage and its parser workers) in a thread
+# ru_maxrss cannot measure the workers: a spawned process keeps the peak of its parent at fork
+class TreeMemorySampler:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if os.path.isdir('/proc/self'):
+            self.peak_mb = 0.0
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.peak_mb = round(self.peak_mb, 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, process_tree_rss_mb())
+            self._stop.wait(self.interval)
+
+# Function run in a stage process: move to the working directory, apply the environment, run the stage
+def _stage_process(function, workdir, env, args, verbose, results):
+    os.chdir(workdir)
+    os.environ.update(env)
+    if not verbose:
+        logging.disable(logging.INFO)
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()), TreeMemorySampler() as sampler:
+            result = function(*args)
+        result['peak_rss_mb'] = peak_rss_mb()
+        # Sampled: a peak shorter than the sampling interval may be missed
+        result['peak_tree_rss_mb'] = sampler.peak_mb
+    except Exception:
+        result = {'error': traceback.format_exc()}
+    results.put(result)
+
+# Function to run a stage in a fresh process so its time and memory are not shared with the others
+def run_stage(function, workdir, env, *args, verbose=False):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_stage_process, args=(function, workdir, env, args, verbose, results))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                result = {'error': f"Stage process exited with code {process.exitcode}"}
+                break
+    process.join()
+    if 'error' in result:
+        print(f"  {function.__name__} failed:\n{result['error']}", file=sys.stderr)
+    return result
+
+# -------------- STAGES --------------
+# Stage: crawl the fixture site with one of the crawlers (a new run from the sitemap)
+def crawl_stage(crawl):
+    import crawl as crawl_cli  # Import the command line of the crawls to load the crawler scripts
+    module = crawl_cli.load_crawl_script(crawl)
+    stats = asyncio.run(module.main(restart=True))
+    stats['pages_per_second'] = round(stats['pages'] / stats['seconds'], 2) if stats['seconds'] else None
+    stats['seconds'] = round(stats['seconds'], 3)
+    return stats
+
+# Stage: ingest the PDFs of the working directory, then run again without changes
+def ingest_stage():
+    import update_embeddings  # Import the ingest pipeline
+    start_time = time.perf_counter()
+    summary = update_embeddings.update_embeddings(update_embeddings.folders_paths, update_embeddings.persist_directory)
+    seconds = time.perf_counter() - start_time
+    rerun_start = time.perf_counter()
+    update_embeddings.update_embeddings(update_embeddings.folders_paths, update_embeddings.persist_directory)
+    return {
+        'files': summary['files'],
+        'chunks': summary['dedup']['chunks'],
+        'embedded_chunks': summary['chunks'],
+        'seconds': round(seconds, 3),
+        'chunks_per_second': round(summary['dedup']['chunks'] / seconds, 1) if seconds else None,
+        'embedding_requests': summary['embedding']['requests'],
+        'saved_tokens': summary['dedup']['saved_tokens'],
+        'unchanged_rerun_seconds': round(time.perf_counter() - rerun_start, 3),
+    }
+
+# Function to build the benchmark questions: topic questions for the hybrid search, codes and titles
+# for the keyword fast path
+def benchmark_questions(count, documents):
+    questions, keyword_questions = [], []
+    for number in range(count):
+        # Every question is different: a repeated question would be answered from the chat cache
+        topics, templates = len(synthetic_pdfs.TOPICS), len(QUESTION_TEMPLATES)
+        topic = synthetic_pdfs.TOPICS[number % topics]
+        template = QUESTION_TEMPLATES[(number // topics) % templates]
+        scope = QUESTION_SCOPES[(number // (topics * templates)) % len(QUESTION_SCOPES)]
+        questions.append(template.format(topic=topic + scope))
+        document = number % documents
+        keyword_questions.append(KEYWORD_QUESTIONS[number % len(KEYWORD_QUESTIONS)].format(
+            number=document + 1, acronym=synthetic_pdfs.ACRONYMS[number % len(synthetic_pdfs.ACRONYMS)],
+            title=synthetic_pdfs.document_title(document)[0]))
+    return questions, keyword_questions
+
+# Stage: retrieval latency with precomputed query embeddings (dense, hybrid, keyword fast path)
+def retrieval_stage(questions, keyword_questions):
+    import resources  # Import the shared resources of the app
+    import retrieval  # Import the retrieval stage helpers
+    import query_service  # Import the query service for its retrieval configuration
+    vectordb = resources.get_vectordb()
+    lexical_index = resources.get_lexical_index()
+    embeddings = resources.get_embeddings().embed_documents(questions)
+    # First search outside the measures: it loads the collection
+    retrieval.search_chunks(vectordb, embeddings[0], k=query_service.retrieval_k)
+    latencies = {'dense': [], 'hybrid': [], 'keyword': [], 'context': []}
+    for question, embedding in zip(questions, embeddings):
+        start_time = time.perf_counter()
+        retrieval.search_chunks(vectordb, embedding, k=query_service.retrieval_k, use_mmr=query_service.use_mmr, fetch_k=query_service.retrieval_fetch_k)
+        latencies['dense'].append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        docs = retrieval.hybrid_search(vectordb, lexical_index, question, embedding, k=query_service.retrieval_k,
+                                       use_mmr=query_service.use_mmr, fetch_k=query_service.retrieval_fetch_k)
+        latencies['hybrid'].append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        retrieval.build_context(docs, max_tokens=query_service.context_token_budget, model_name=resources.llm_model)
+        latencies['context'].append(time.perf_counter() - start_time)
+    keyword_hits = 0
+    for question in keyword_questions:
+        start_time = time.perf_counter()
+        keyword_hits += bool(lexical_index.keyword_search(question, k=query_service.retrieval_k))
+        latencies['keyword'].append(time.perf_counter() - start_time)
+    result = {name: latency_summary(samples) for name, samples in latencies.items()}
+    result['keyword']['fast_path_ratio'] = round(keyword_hits / len(keyword_questions), 3) if keyword_questions else None
+    result['chunks'] = vectordb._collection.count()
+    return result
+
+# Stage: end-to-end latency of the app answers (embedding, retrieval and model calls go to the API stub)
+# The app starts the query service in its process and calls it over HTTP, as in production
+def chat_stage(questions, keyword_questions, session_turns):
+    import app  # Import the app, its answer functions are measured as the chat calls them
+    from chat_history import ConversationHistory, build_history  # Import the history of a session
+    latencies = {'get_ai_response': [], 'keyword_questions': [], 'repeated_questions': [], 'time_to_first_token': [],
+                 'stream_total': []}
+    # First answer outside the measures: it builds the model client and the chain
+    app.get_ai_response([{'role': 'user', 'content': "Warm-up question about the reports"}])
+    half = len(questions) // 2
+    for question in questions[:half]:
+        start_time = time.perf_counter()
+        app.get_ai_response([{'role': 'user', 'content': question}])
+        latencies['get_ai_response'].append(time.perf_counter() - start_time)
+    for question in keyword_questions:
+        start_time = time.perf_counter()
+        app.get_ai_response([{'role': 'user', 'content': question}])
+        latencies['keyword_questions'].append(time.perf_counter() - start_time)
+    # The same questions again: answered from the chat cache, or again by the keyword fast path
+    # (its answers are not cached, they have no query embedding)
+    for question in questions[:half]:
+        start_time = time.perf_counter()
+        app.get_ai_response([{'role': 'user', 'content': question}])
+        latencies['repeated_questions'].append(time.perf_counter() - start_time)
+    for question in questions[half:]:
+        start_time = time.perf_counter()
+        first_token = None
+        for _ in app.stream_ai_response([{'role': 'user', 'content': question}]):
+            if first_token is None:
+                first_token = time.perf_counter() - start_time
+        latencies['time_to_first_token'].append(first_token)
+        latencies['stream_total'].append(time.perf_counter() - start_time)
+    # A long session: the history sent with every question must stop growing once the summary takes
+    # over the older turns. Each fold is awaited, so every turn sees the summary of the previous ones
+    history = ConversationHistory(recent_turns=app.resources.history_recent_turns)
+    messages = [{'role': 'assistant', 'content': "Welcome"}]
+    history_tokens = []
+    latencies.update({'session_answers': [], 'summary_updates': []})
+    for turn in range(session_turns):
+        messages.append({'role': 'user', 'content': f"{questions[turn % len(questions)]} (turn {turn + 1})"})
+        payload = app.history_payload(messages, history)
+        history_tokens.append(build_history(payload['summary'], payload['turns'],
+                                            max_tokens=app.resources.history_max_tokens)[1])
+        start_time = time.perf_counter()
+        messages.append({'role': 'assistant', 'content': app.get_ai_response(messages, history)})
+        latencies['session_answers'].append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        fold = history.fold_in_background(list(messages), app.summarize_turns, app.resources.get_history_executor())
+        if fold is not None:
+            fold.result()
+            latencies['summary_updates'].append(time.perf_counter() - start_time)
+    result = {name: latency_summary(samples) for name, samples in latencies.items()}
+    result['cache'] = app.resources.get_chat_cache().stats()
+    # Equal maxima of the two halves of the session: the history reached its ceiling and stayed there
+    half = session_turns // 2
+    result['session_history_tokens'] = {'turns': session_turns, 'first_half_max': max(history_tokens[:half] or [0]),
+                                        'second_half_max': max(history_tokens[half:] or [0])}
+    return result
+
+# Stage: load test of the query service: bursts of concurrent streaming clients, first with every
+# question asked by `copies` clients at once (coalesced into one model call), then with more
+# questions than the workers and the queue hold (the rest are rejected with 503)
+def service_stage(questions, copies, workers, queue_size):
+    import aiohttp  # Import aiohttp for the concurrent clients
+    import query_service  # Import the query service
+    base_url = query_service.start_in_background(workers=workers, queue_size=queue_size)
+
+    # Function to ask a question as a streaming client, returns (status, first token, total seconds, failed)
+    # A failed answer is streamed with a 200 status, its text is the error message ("Error: ...")
+    async def ask(session, question):
+        start_time = time.perf_counter()
+        first_token = None
+        parts = []
+        async with session.post(f"{base_url}/answer", json={'question': question, 'stream': True}) as response:
+            async for part in response.content.iter_any():
+                if first_token is None:
+                    first_token = time.perf_counter() - start_time
+                parts.append(part)
+        failed = response.status == 200 and b''.join(parts).lstrip().startswith(b'Error:')
+        return response.status, first_token, time.perf_counter() - start_time, failed
+
+    # Function to send every question at once, returns the answers and the seconds of the burst
+    async def burst(batch):
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+            start_time = time.perf_counter()
+            answers = await asyncio.gather(*(ask(session, question) for question in batch))
+            return answers, time.perf_counter() - start_time
+
+    # Function to read the counters of the service
+    def service_stats():
+        with urllib.request.urlopen(f"{base_url}/stats") as response:
+            return json.load(response)['service']
+
+    # First answer outside the measures: it builds the model client and the chain
+    asyncio.run(burst(["Warm-up question about the reports"]))
+    result = {'workers': workers, 'queue_size': queue_size}
+    # Overload: twice as many different questions as the service accepts (answered plus waiting)
+    phases = {'coalesced': [question for question in questions[:workers] for _ in range(copies)],
+              'overload': questions[workers:workers + 2 * (workers + queue_size)]}
+    for phase, batch in phases.items():
+        before = service_stats()
+        answers, seconds = asyncio.run(burst(batch))
+        after = service_stats()
+        answered = [answer for answer in answers if answer[0] == 200 and not answer[3]]
+        result[phase] = {
+            'requests': len(batch),
+            'rejected': sum(1 for answer in answers if answer[0] == 503),
+            'failed': sum(1 for answer in answers if answer[0] not in (200, 503) or answer[3]),
+            'model_errors': after['errors'] - before['errors'],
+            'model_calls': after['model_calls'] - before['model_calls'],
+            'coalesced': after['coalesced'] - before['coalesced'],
+            'requests_per_second': round(len(answered) / seconds, 1) if seconds else None,
+            'time_to_first_token': latency_summary([answer[1] for answer in answered if answer[1] is not None]),
+            'total': latency_summary([answer[2] for answer in answered]),
+        }
+        if result[phase]['failed']:
+            print(f"{result[phase]['failed']} answers of the {phase} phase failed", file=sys.stderr)
+    return result
+
+# -------------- COMPARISON --------------
+# Function to flatten the numeric results as {'stage.name.metric': value}
+def flatten(results, prefix=''):
+    values = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{path}."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and 'name' in item:
+                    values.update(flatten(item, f"{path}.{item['name']}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+# Function to tell whether a higher value of a metric is better (True), worse (False) or neither (None)
+def higher_is_better(path):
+    if path.endswith('per_second') or path.endswith('fast_path_ratio'):
+        return True
+    if path.endswith('_ms') or path.endswith('seconds') or path.endswith('_mb'):
+        return False
+    return None
+
+# Function to compare two results, returns the changes beyond `threshold` (relative) of the known metrics
+def compare_results(previous, current, threshold=0.1):
+    if previous.get('suite_version') != current.get('suite_version'):
+        print("The results come from another version of the suite, they are not compared", file=sys.stderr)
+        return []
+    before, after = flatten(previous), flatten(current)
+    changes = []
+    for path in sorted(set(before) & set(after)):
+        direction = higher_is_better(path)
+        if direction is None or not before[path]:
+            continue
+        change = (after[path] - before[path]) / abs(before[path])
+        if abs(change) >= threshold:
+            regression = change < 0 if direction else change > 0
+            changes.append({'metric': path, 'previous': before[path], 'current': after[path],
+                            'change': round(change, 3), 'regression': regression})
+    return changes
+
+# -------------- SUITE --------------
+# Function to describe the machine and the commit measured
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIRECTORY, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+# Function to start a server in a background thread
+def serve_in_background(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# Function to check that tiktoken loads cl100k_base without network, returns an error message or None
+def check_tiktoken():
+    try:
+        import tiktoken  # Import tiktoken, the stages count tokens with it
+        tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        return (f"tiktoken cannot load cl100k_base ({type(e).__name__}: {e}). Seed its cache once with network access: "
+                "TIKTOKEN_CACHE_DIR=./tiktoken_cache python -c \"import tiktoken; tiktoken.get_encoding('cl100k_base')\", "
+                "then run the suite with the same TIKTOKEN_CACHE_DIR")
+    return None
+
+# Function to run every stage of the suite and return the results
+def run_suite(args, directory):
+    stub_config = stub_openai_server.parse_args([
+        '--port', '0', '--dims', str(args.dims), '--latency', str(args.embedding_latency),
+        '--chat-latency', str(args.chat_latency), '--token-latency', str(args.token_latency),
+        '--answer-tokens', str(args.answer_tokens),
+    ])
+    stub = serve_in_background(stub_openai_server.make_server(stub_config))
+    api_env = {'OPENAI_API_KEY': 'stub', 'OPENAI_BASE_URL': f"http://127.0.0.1:{stub.server_port}/v1",
+               'ANONYMIZED_TELEMETRY': 'False', 'VECTOR_STORE': 'chroma', 'INGEST_WORKERS': str(args.workers),
+               # Only a repeated question reuses an answer, the stub embeddings of similar questions are close
+               'CACHE_SIMILARITY_THRESHOLD': '0.999'}
+    results = {'suite_version': SUITE_VERSION, 'environment': environment_info(), 'config': vars(args).copy()}
+    results['config'].pop('output', None)
+    results['config'].pop('compare', None)
+
+    if 'crawl' in args.stages:
+        print("Crawling the fixture site...", file=sys.stderr)
+        site_directory = os.path.join(directory, 'site')
+        paths = fixture_site.generate_site(site_directory, args.site_reports, args.site_articles)
+        site = serve_in_background(fixture_site.make_server(site_directory, latency=args.site_latency))
+        base_url = f"http://127.0.0.1:{site.server_port}"
+        fixture_site.write_sitemap(site_directory, base_url, paths)
+        crawl_directory = os.path.join(directory, 'crawl')
+        os.makedirs(crawl_directory)
+        crawl_env = {'SITEMAP_SOURCE': f"{base_url}/sitemap.xml", 'URL_DOMAIN': base_url,
+                     'CRAWL_HOST_DELAY': str(args.host_delay), 'CRAWL_CONCURRENCY': str(args.crawl_concurrency),
+                     'NEWS_EXTRACTION_MODE': 'html'}
+        results['crawl'] = {crawl: run_stage(crawl_stage, crawl_directory, crawl_env, crawl, verbose=args.verbose)
+                            for crawl in ('reports', 'news-insights')}
+        site.shutdown()
+
+    if set(args.stages) & {'ingest', 'retrieval', 'chat', 'service'}:
+        results['ingest'] = []
+        for size in args.sizes:
+            documents, pages = synthetic_pdfs.CORPUS_SIZES[size]
+            print(f"Ingesting the {size} corpus ({documents} PDFs of {pages} pages)...", file=sys.stderr)
+            ingest_directory = os.path.join(directory, f"ingest-{size}")
+            synthetic_pdfs.generate_corpus(os.path.join(ingest_directory, 'pdf_reports'), documents, pages)
+            result = run_stage(ingest_stage, ingest_directory, api_env, verbose=args.verbose)
+            results['ingest'].append({'name': size, 'documents': documents, 'pages': documents * pages, **result})
+
+        # Retrieval and chat run on the largest corpus
+        size = args.sizes[-1]
+        documents = synthetic_pdfs.CORPUS_SIZES[size][0]
+        questions, keyword_questions = benchmark_questions(args.queries, documents)
+        ingest_directory = os.path.join(directory, f"ingest-{size}")
+        if 'retrieval' in args.stages:
+            print("Measuring the retrieval...", file=sys.stderr)
+            results['retrieval'] = {'corpus': size, **run_stage(retrieval_stage, ingest_directory, api_env, questions,
+                                                                keyword_questions, verbose=args.verbose)}
+        if 'chat' in args.stages:
+            print("Measuring the chat answers...", file=sys.stderr)
+            results['chat'] = {'corpus': size, **run_stage(chat_stage, ingest_directory, api_env, questions,
+                                                           keyword_questions[:args.queries // 2], args.session_turns,
+                                                           verbose=args.verbose)}
+        if 'service' in args.stages:
+            print("Load testing the query service...", file=sys.stderr)
+            # Questions the chat stage did not ask, so they are not answered from the cache
+            service_count = args.service_workers + 2 * (args.service_workers + args.service_queue)
+            service_questions = benchmark_questions(args.queries + service_count, documents)[0][args.queries:]
+            results['service'] = {'corpus': size, **run_stage(service_stage, ingest_directory, api_env, service_questions,
+                                                              args.service_copies, args.service_workers,
+                                                              args.service_queue, verbose=args.verbose)}
+    stub.shutdown()
+    return results
+
+# Function to parse the suite configuration
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark suite: crawl, ingest, retrieval and chat latency")
+    parser.add_argument('--stages', default='crawl,ingest,retrieval,chat,service', help="Comma-separated stages to run")
+    parser.add_argument('--sizes', default='small,medium', help="Comma-separated corpus sizes: small, medium, large")
+    parser.add_argument('--queries', type=int, default=40, help="Questions measured by the retrieval and chat stages")
+    parser.add_argument('--site-reports', type=int, default=40, help="Report pages of the fixture site")
+    parser.add_argument('--site-articles', type=int, default=40, help="Articles of the fixture site")
+    parser.add_argument('--site-latency', type=float, default=0.02, help="Seconds added to every response of the site")
+    parser.add_argument('--host-delay', type=float, default=0.0, help="Politeness delay of the crawlers (CRAWL_HOST_DELAY)")
+    parser.add_argument('--crawl-concurrency', type=int, default=8, help="Requests in flight (CRAWL_CONCURRENCY)")
+    parser.add_argument('--workers', type=int, default=2, help="PDF parser processes (INGEST_WORKERS)")
+    parser.add_argument('--dims', type=int, default=1536, help="Dimensions of the stub embeddings")
+    parser.add_argument('--embedding-latency', type=float, default=0.05, help="Seconds of every embedding request")
+    parser.add_argument('--chat-latency', type=float, default=0.3, help="Seconds before the first token of an answer")
+    parser.add_argument('--token-latency', type=float, default=0.005, help="Seconds between two answer tokens")
+    parser.add_argument('--answer-tokens', type=int, default=100, help="Words of every answer")
+    parser.add_argument('--session-turns', type=int, default=12, help="Turns of the long chat session of the chat stage")
+    parser.add_argument('--service-workers', type=int, default=4, help="Workers of the load-tested query service")
+    parser.add_argument('--service-queue', type=int, default=8, help="Queue size of the load-tested query service")
+    parser.add_argument('--service-copies', type=int, default=4, help="Clients asking every question at once")
+    parser.add_argument('--output', help="JSON file where the results are written")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Relative change reported by the comparison")
+    parser.add_argument('--keep', action='store_true', help="Keep the working directories")
+    parser.add_argument('--verbose', action='store_true', help="Show the output of the stages")
+    args = parser.parse_args(argv)
+    args.stages = [stage for stage in args.stages.split(',') if stage]
+    args.sizes = [size for size in args.sizes.split(',') if size]
+    unknown = set(args.sizes) - set(synthetic_pdfs.CORPUS_SIZES)
+    if unknown:
+        parser.error(f"Unknown corpus sizes: {', '.join(sorted(unknown))}")
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+    error = check_tiktoken()
+    if error is not None:
+        print(error, file=sys.stderr)
+        sys.exit(2)
+    directory = tempfile.mkdtemp(prefix='benchmark-suite-')
+    try:
+        results = run_suite(args, directory)
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+        else:
+            print(f"Working directories kept in {directory}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            results['comparison'] = compare_results(json.load(f), results, args.threshold)
+        for change in results['comparison']:
+            flag = 'REGRESSION' if change['regression'] else 'improvement'
+            print(f"{flag:>11}  {change['metric']}: {change['previous']} -> {change['current']} "
+                  f"({change['change']:+.0%})", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    # A regression fails the run, so the suite can gate a CI job
+    if any(change['regression'] for change in results.get('comparison', [])):
+        sys.exit(1)
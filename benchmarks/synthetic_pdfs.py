@@ -0,0 +1,130 @@
+import os  # Import the OS module to write the corpus files
+import random  # Import random to generate deterministic texts from a seed
+import argparse  # Import argparse to generate a corpus from the command line
+import textwrap  # Import textwrap to lay out the text lines of a page
+
+# Synthetic PDF corpora for the offline benchmarks, written with the standard library only:
+#   python -m benchmarks.synthetic_pdfs pdf_reports --size medium
+# Every document has a cover paragraph with its title and report code, a header and a footer repeated
+# on every page (the boilerplate stripping removes them) and a share of pages copied from other
+# documents (duplicates)
+
+# Documents and pages of every corpus size
+CORPUS_SIZES = {
+    'small': (20, 5),
+    'medium': (100, 10),
+    'large': (400, 20),
+}
+DUPLICATE_PAGE_RATIO = 0.1  # Share of the pages copied from a previous document
+LINES_PER_PAGE = 45  # Text lines of a page
+LINE_CHARS = 95  # Characters of a line
+
+TOPICS = ['circular economy', 'remanufacturing', 'critical raw materials', 'waste electrical equipment',
+          'product lifetime', 'resource efficiency', 'plastic packaging', 'batteries', 'textiles',
+          'construction materials', 'food waste', 'repair and reuse', 'ecodesign', 'carbon footprint']
+WORDS = """
+market policy producer responsibility recycling collection target supply chain material recovery
+design repair reuse refurbishment demand consumer business model cost benefit analysis emissions
+energy carbon impact assessment regulation standard directive investment innovation industry sector
+manufacturer retailer component metal polymer glass paper fibre quality grade value saving process
+data evidence survey interview stakeholder government agency programme scheme report study review
+""".split()
+ACRONYMS = ['WEEE', 'EPR', 'LCA', 'CRM', 'ELV', 'PAS 2050', 'BS 8001', 'EN 45554', 'ISO 14001', 'GHG']
+
+# Function to write a PDF with one text page per item of `pages` (Helvetica, WinAnsi text)
+def write_pdf(path, pages, title=None):
+    objects = {1: "<< /Type /Catalog /Pages 2 0 R >>", 3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    number = 4
+    for text in pages:
+        lines = [line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in text.split('\n')]
+        stream = "BT /F1 10 Tf 50 760 Td 14 TL " + ' '.join(f"({line}) '" for line in lines) + " ET"
+        objects[number] = f"<< /Length {len(stream.encode('latin-1', 'replace'))} >>\nstream\n{stream}\nendstream"
+        objects[number + 1] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {number} 0 R "
+                               f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        page_ids.append(number + 1)
+        number += 2
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+    info = ''
+    if title:
+        objects[number] = f"<< /Title ({title}) >>"
+        info = f" /Info {number} 0 R"
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(data)
+        data += f"{object_id} 0 obj\n{objects[object_id]}\nendobj\n".encode('latin-1', 'replace')
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    for object_id in sorted(objects):
+        data += f"{offsets[object_id]:010d} 00000 n \n".encode('ascii')
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R{info} >>\nstartxref\n{xref}\n%%EOF\n".encode('ascii')
+    with open(path, 'wb') as f:
+        f.write(data)
+
+# Function to generate a paragraph about a topic
+def paragraph(generator, topic, sentences=4):
+    parts = []
+    for _ in range(sentences):
+        words = generator.choices(WORDS, k=generator.randint(10, 18))
+        position = generator.randrange(len(words))
+        words[position:position] = [topic] if generator.random() < 0.5 else [generator.choice(ACRONYMS)]
+        sentence = ' '.join(words)
+        parts.append(sentence[0].upper() + sentence[1:] + '.')
+    return ' '.join(parts)
+
+# Function to generate the text of a page body, wrapped to the page width
+def page_body(generator, topic, lines):
+    text_lines = []
+    while len(text_lines) < lines:
+        text_lines.extend(textwrap.wrap(paragraph(generator, topic), LINE_CHARS))
+        text_lines.append('')
+    return text_lines[:lines]
+
+# Function to get the title and code of the document `number` of a corpus
+def document_title(number):
+    topic = TOPICS[number % len(TOPICS)]
+    return f"{topic.title()} Report {number + 1}", f"OH-{number + 1:04d}", topic
+
+# Function to generate a corpus of `documents` PDFs of `pages` pages in a directory
+# The same seed always gives the same files, so the benchmark runs are comparable
+def generate_corpus(directory, documents, pages, seed=0, prefix='report'):
+    os.makedirs(directory, exist_ok=True)
+    generator = random.Random(seed)
+    bodies = []  # Page bodies already written, the source of the duplicated pages
+    paths = []
+    for number in range(documents):
+        title, code, topic = document_title(number)
+        document_pages = []
+        for page in range(pages):
+            if bodies and generator.random() < DUPLICATE_PAGE_RATIO:
+                body = generator.choice(bodies)
+            else:
+                body = page_body(generator, topic, LINES_PER_PAGE - 4)
+                bodies.append(body)
+            if page == 0:
+                # Cover: the title and the code are searched by name
+                body = [f"{title}. Report code {code}.", ''] + body[:-2]
+            header = f"{title} ({code})"
+            footer = f"Oakdene Hollins - Page {page + 1} of {pages}"
+            document_pages.append('\n'.join([header, ''] + body + ['', footer]))
+        path = os.path.join(directory, f"{prefix}-{number + 1:04d}.pdf")
+        write_pdf(path, document_pages, title=title)
+        paths.append(path)
+    return paths
+
+# Function to parse the corpus configuration
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF corpus")
+    parser.add_argument('directory', help="Directory of the PDFs")
+    parser.add_argument('--size', choices=sorted(CORPUS_SIZES), default='small', help="Preset number of documents and pages")
+    parser.add_argument('--documents', type=int, default=None, help="Number of documents (overrides the preset)")
+    parser.add_argument('--pages', type=int, default=None, help="Pages per document (overrides the preset)")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    documents, pages = CORPUS_SIZES[args.size]
+    paths = generate_corpus(args.directory, args.documents or documents, args.pages or pages, seed=args.seed)
+    print(f"Generated {len(paths)} PDFs in {args.directory}")
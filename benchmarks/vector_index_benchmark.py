@@ -0,0 +1,169 @@
+import os  # Import the OS module to manage the generated files
+import sys  # Import sys to make the repository modules importable
+import time  # Import time module to measure the load and query times
+import json  # Import json to print the results
+import shutil  # Import shutil to remove the generated files
+import argparse  # Import argparse to configure the benchmark from the command line
+import tempfile  # Import tempfile to build the synthetic collection
+import multiprocessing  # Import multiprocessing to measure every store in a fresh process
+import numpy as np  # Import NumPy to generate the synthetic embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Benchmark of the memory-mapped vector index against Chroma on a synthetic collection:
+#   python -m benchmarks.vector_index_benchmark --vectors 50000
+#   python -m benchmarks.vector_index_benchmark --vectors 200000 --dim 1536 --ivf-lists 450 --nprobe 16
+# Every store is opened in a fresh process: load time, peak memory, query latency and recall@k
+# against an exact float32 search
+
+COLLECTION_NAME = 'langchain'  # Collection name used by the LangChain Chroma store
+
+# Function to generate clustered unit vectors, like the embeddings of documents on a few topics
+def generate_vectors(count, dim, clusters, seed):
+    generator = np.random.default_rng(seed)
+    centers = generator.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[generator.integers(0, clusters, count)] + 0.6 * generator.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+# Function to store the vectors in a Chroma collection
+def build_chroma(directory, vectors, batch_size=5000):
+    import chromadb  # Import the Chroma client
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.get_or_create_collection(COLLECTION_NAME)
+    # Chroma limits the size of a single add
+    batch_size = min(batch_size, client.get_max_batch_size())
+    for start in range(0, len(vectors), batch_size):
+        end = min(len(vectors), start + batch_size)
+        collection.add(
+            ids=[str(row) for row in range(start, end)],
+            embeddings=vectors[start:end].tolist(),
+            documents=[f"Chunk {row} of the synthetic collection" for row in range(start, end)],
+            metadatas=[{'source': f"synthetic/{row // 50}.pdf", 'page': row % 50} for row in range(start, end)],
+        )
+    return collection
+
+# Function to read the memory counters of this process in MB: peak resident memory (VmHWM, reset by exec
+# unlike ru_maxrss, which a spawned child inherits from the parent) and the anonymous and file-backed parts
+def memory_mb():
+    counters = {}
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('VmHWM', 'RssAnon', 'RssFile'):
+                counters[name] = round(int(value.split()[0]) / 1024, 1)
+    return counters
+
+# Function to get the size of a directory in MB
+def directory_size_mb(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names) / 1e6
+
+# Function run in a child process: open a store, answer the queries and report time, memory and recall
+def measure(store, path, queries_path, truth_path, k, nprobe, results):
+    queries = np.load(queries_path)
+    truth = np.load(truth_path)
+    start_time = time.perf_counter()
+    if store == 'chroma':
+        import chromadb  # Import the Chroma client
+        collection = chromadb.PersistentClient(path=path).get_collection(COLLECTION_NAME)
+
+        def search(query):
+            return collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])['ids'][0]
+    else:
+        from vector_index import VectorIndex  # Import the memory-mapped vector index
+        index = VectorIndex(path, nprobe=nprobe)
+
+        def search(query):
+            rows, _ = index.search(query, k)
+            return index.chunk_ids(rows)
+    first_ids = search(queries[0])  # The first query pays the lazy loading of the store
+    load_seconds = time.perf_counter() - start_time
+
+    latencies, hits = [], len(set(first_ids) & {str(row) for row in truth[0]})
+    for query, expected in zip(queries[1:], truth[1:]):
+        query_start = time.perf_counter()
+        ids = search(query)
+        latencies.append(time.perf_counter() - query_start)
+        hits += len(set(ids) & {str(row) for row in expected})
+    memory = memory_mb()
+    results.put({
+        'store': store,
+        'load_and_first_query_seconds': round(load_seconds, 3),
+        'query_ms_mean': round(1000 * float(np.mean(latencies)), 2) if latencies else None,
+        'query_ms_p95': round(1000 * float(np.percentile(latencies, 95)), 2) if latencies else None,
+        f"recall_at_{k}": round(hits / (len(queries) * k), 4),
+        'peak_rss_mb': memory['VmHWM'],
+        # Mapped index pages are file-backed: counted in the RSS but shared and reclaimable by the OS
+        'rss_anon_mb': memory['RssAnon'],
+        'rss_file_mb': memory['RssFile'],
+        'disk_mb': round(directory_size_mb(path), 1),
+    })
+
+# Function to run one measurement in a fresh process so the load time and peak memory are not shared
+def run_measurement(store, path, queries_path, truth_path, k, nprobe):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=measure, args=(store, path, queries_path, truth_path, k, nprobe, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+# Function to parse the benchmark configuration
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the memory-mapped vector index against Chroma")
+    parser.add_argument('--vectors', type=int, default=50000, help="Number of chunks in the collection")
+    parser.add_argument('--dim', type=int, default=1536, help="Embedding dimension (1536 for ada-002)")
+    parser.add_argument('--clusters', type=int, default=200, help="Topics of the synthetic embeddings")
+    parser.add_argument('--queries', type=int, default=200, help="Number of queries")
+    parser.add_argument('--k', type=int, default=10, help="Results per query")
+    parser.add_argument('--ivf-lists', type=int, default=None, help="IVF lists, the square root of the vectors by default")
+    parser.add_argument('--nprobe', type=int, default=16, help="IVF lists scanned per query")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated files")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    from vector_index import export_index  # Import the export of the memory-mapped index
+    directory = tempfile.mkdtemp(prefix='vector-index-benchmark-')
+    try:
+        start_time = time.perf_counter()
+        vectors = generate_vectors(args.vectors, args.dim, args.clusters, seed=0)
+        collection = build_chroma(os.path.join(directory, 'chroma'), vectors)
+        print(f"Built a Chroma collection of {args.vectors} vectors in {time.perf_counter() - start_time:.1f} seconds")
+
+        # Queries close to the documents, the ground truth is an exact float32 search
+        generator = np.random.default_rng(1)
+        queries = vectors[generator.integers(0, args.vectors, args.queries)]
+        queries = queries + 0.3 * generator.standard_normal(queries.shape).astype(np.float32) / np.sqrt(args.dim)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+        queries_path, truth_path = os.path.join(directory, 'queries.npy'), os.path.join(directory, 'truth.npy')
+        np.save(queries_path, queries)
+        np.save(truth_path, truth)
+        del vectors
+
+        ivf_lists = args.ivf_lists if args.ivf_lists is not None else int(np.sqrt(args.vectors))
+        stores = [('chroma', os.path.join(directory, 'chroma'))]
+        exports = {}
+        for dtype in ('float16', 'int8'):
+            for lists in (0, ivf_lists):
+                name = f"index-{dtype}" + (f"-ivf{lists}" if lists else '')
+                path = os.path.join(directory, name)
+                start_time = time.perf_counter()
+                export_index(collection, path, dtype=dtype, ivf_lists=lists)
+                exports[name] = round(time.perf_counter() - start_time, 1)
+                stores.append((name, path))
+
+        results = []
+        for name, path in stores:
+            result = run_measurement('chroma' if name == 'chroma' else 'index', path, queries_path, truth_path,
+                                     args.k, args.nprobe)
+            result['store'] = name
+            if name in exports:
+                result['export_seconds'] = exports[name]
+            results.append(result)
+        print(json.dumps({'vectors': args.vectors, 'dim': args.dim, 'queries': args.queries, 'k': args.k,
+                          'nprobe': args.nprobe, 'results': results}, indent=2))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
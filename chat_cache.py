@@ -0,0 +1,235 @@
+import os  # Import the OS module to inspect the Chroma files
+import re  # Import the regular expression module to normalize questions
+import time  # Import time module for TTL and LRU bookkeeping
+import hashlib  # Import hashlib to key the answers on the conversation history
+import sqlite3  # Import sqlite3 to persist the cache between sessions and restarts
+import threading  # Import threading to share the cache safely between Streamlit sessions
+import numpy as np  # Import NumPy for vectorized cosine similarity
+
+# -------------- CACHE CONFIGURATION --------------
+DEFAULT_CACHE_PATH = './chat_cache.sqlite3'  # SQLite file where the cache is stored
+DEFAULT_SIMILARITY_THRESHOLD = 0.97  # Minimum cosine similarity to reuse a stored answer
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600  # Entries older than this are ignored and evicted
+DEFAULT_MAX_EMBEDDINGS = 5000  # Maximum number of cached query embeddings (LRU)
+DEFAULT_MAX_ANSWERS = 1000  # Maximum number of cached answers (LRU)
+
+STAT_NAMES = ('embedding_hits', 'embedding_misses', 'answer_hits', 'answer_misses', 'invalidations')
+
+# Function to normalize a question so trivial variations share the same cache key
+def normalize_question(question):
+    question = re.sub(r'\s+', ' ', question.strip().casefold())
+    return question.rstrip(' ?!.')
+
+# Function to get the key of the conversation history sent with a question, empty without history
+# A follow-up ("and in 2020?") only reuses an answer given after the same history
+def history_key(history):
+    if not history:
+        return ''
+    return hashlib.sha256(history.encode('utf-8')).hexdigest()
+
+# Function to build a fingerprint of the Chroma collection, it changes whenever the index is updated
+# Every add, update or delete writes the SQLite file of the database (and its write-ahead log when there is
+# one), their size and modification time are enough and cost two stat calls
+def chroma_fingerprint(persist_directory):
+    parts = []
+    for name in ('chroma.sqlite3', 'chroma.sqlite3-wal'):
+        try:
+            stat = os.stat(os.path.join(persist_directory, name))
+            parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append("missing")
+    return ":".join(parts)
+
+# Class implementing the two-level cache: query embeddings (exact) and answers (semantic)
+class ChatCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, max_embeddings=DEFAULT_MAX_EMBEDDINGS, max_answers=DEFAULT_MAX_ANSWERS):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_embeddings = max_embeddings
+        self.max_answers = max_answers
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Answers cached before they were keyed on the history may belong to any conversation, they are dropped
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(answers)")]
+        if columns and 'history_key' not in columns:
+            self._conn.execute("DROP TABLE answers")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                question_key TEXT PRIMARY KEY, embedding BLOB NOT NULL,
+                created_at REAL NOT NULL, last_used REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, question_key TEXT NOT NULL, history_key TEXT NOT NULL,
+                question TEXT NOT NULL, embedding BLOB, answer TEXT NOT NULL,
+                created_at REAL NOT NULL, last_used REAL NOT NULL, UNIQUE (question_key, history_key));
+            CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        self._conn.commit()
+        # Normalized answer embeddings kept in memory for the similarity search, with their history keys
+        self._answer_ids = None
+        self._answer_matrix = None
+        self._answer_history_keys = None
+
+    # -------------- INVALIDATION --------------
+    # Function to drop stale entries when the Chroma collection or the embedding model changes
+    def validate(self, collection_fingerprint, embedding_model):
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM cache_meta"))
+            if meta.get('embedding_model') != embedding_model:
+                self._conn.execute("DELETE FROM query_embeddings")
+                self._conn.execute("DELETE FROM answers")
+                self._answer_ids = None
+            elif meta.get('collection') != collection_fingerprint:
+                # Answers were generated from the old index, embeddings of the questions are still valid
+                self._conn.execute("DELETE FROM answers")
+                self._answer_ids = None
+            else:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache_meta (key, value) VALUES (?, ?)",
+                [('embedding_model', embedding_model), ('collection', collection_fingerprint)],
+            )
+            if meta:
+                self._increment('invalidations')
+            self._conn.commit()
+
+    # -------------- LEVEL 1: QUERY EMBEDDINGS --------------
+    # Function to get the cached embedding of a question (exact match on the normalized text)
+    def get_embedding(self, question):
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT embedding FROM query_embeddings WHERE question_key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                self._increment('embedding_misses')
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE query_embeddings SET last_used = ? WHERE question_key = ?", (now, key))
+            self._increment('embedding_hits')
+            self._conn.commit()
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    # Function to store the embedding of a question
+    def put_embedding(self, question, embedding):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (question_key, embedding, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (normalize_question(question), np.asarray(embedding, dtype=np.float32).tobytes(), now, now),
+            )
+            self._evict('query_embeddings', 'question_key', self.max_embeddings, now)
+            self._conn.commit()
+
+    # -------------- LEVEL 2: SEMANTIC ANSWERS --------------
+    # Function to get a stored answer whose question is close enough to the new one, after the same history
+    def get_answer(self, embedding, history=''):
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._load_answer_matrix()
+            if self._answer_ids:
+                similarities = self._answer_matrix @ query
+                # Answers given after another history never match
+                similarities[self._answer_history_keys != history_key(history)] = -np.inf
+                # Closest first: an expired entry is skipped and the next one above the threshold is used
+                for index in np.argsort(-similarities):
+                    if similarities[index] < self.similarity_threshold:
+                        break
+                    answer_id = self._answer_ids[index]
+                    row = self._conn.execute(
+                        "SELECT answer FROM answers WHERE id = ? AND created_at >= ?",
+                        (answer_id, time.time() - self.ttl_seconds),
+                    ).fetchone()
+                    if row is not None:
+                        self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), answer_id))
+                        self._increment('answer_hits')
+                        self._conn.commit()
+                        return row[0]
+            self._increment('answer_misses')
+            self._conn.commit()
+        return None
+
+    # Function to get the stored answer of the same question (normalized text) after the same history
+    # Used for the questions answered without an embedding (keyword fast path)
+    def get_exact_answer(self, question, history=''):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, answer FROM answers WHERE question_key = ? AND history_key = ? AND created_at >= ?",
+                (normalize_question(question), history_key(history), now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                self._increment('answer_misses')
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, row[0]))
+            self._increment('answer_hits')
+            self._conn.commit()
+        return row[1]
+
+    # Function to store the answer given to a question after a history, the embedding is None for the
+    # questions answered without one (they are only found again by get_exact_answer)
+    def put_answer(self, question, embedding, answer, history=''):
+        now = time.time()
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (question_key, history_key, question, embedding, answer, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (normalize_question(question), history_key(history), question, blob, answer, now, now),
+            )
+            self._evict('answers', 'id', self.max_answers, now)
+            self._conn.commit()
+            self._answer_ids = None
+
+    # -------------- STATISTICS --------------
+    # Function to get the hit/miss counters and hit rates used to tune the threshold
+    def stats(self):
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM cache_stats"))
+            counters['cached_embeddings'] = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            counters['cached_answers'] = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        stats = {name: counters.get(name, 0) for name in STAT_NAMES}
+        for level in ('embedding', 'answer'):
+            lookups = stats[f'{level}_hits'] + stats[f'{level}_misses']
+            stats[f'{level}_hit_rate'] = round(stats[f'{level}_hits'] / lookups, 3) if lookups else 0.0
+        stats['cached_embeddings'] = counters['cached_embeddings']
+        stats['cached_answers'] = counters['cached_answers']
+        stats['similarity_threshold'] = self.similarity_threshold
+        return stats
+
+    # -------------- INTERNAL HELPERS --------------
+    # Function to increment a persisted counter (the caller holds the lock and commits)
+    def _increment(self, name):
+        self._conn.execute(
+            "INSERT INTO cache_stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    # Function to remove expired rows and the least recently used rows above the size limit
+    def _evict(self, table, key_column, max_rows, now):
+        self._conn.execute(f"DELETE FROM {table} WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE {key_column} IN "
+            f"(SELECT {key_column} FROM {table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (max_rows,),
+        )
+
+    # Function to (re)build the in-memory matrix of normalized answer embeddings
+    def _load_answer_matrix(self):
+        if self._answer_ids is not None:
+            return
+        rows = self._conn.execute("SELECT id, embedding, history_key FROM answers WHERE embedding IS NOT NULL").fetchall()
+        self._answer_ids = [row[0] for row in rows]
+        if rows:
+            matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._answer_matrix = matrix / np.where(norms == 0, 1.0, norms)
+            self._answer_history_keys = np.array([row[2] for row in rows])
+        else:
+            self._answer_matrix = None
+            self._answer_history_keys = None
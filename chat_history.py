@@ -0,0 +1,121 @@
+import threading  # Import threading to fold the old turns while the session keeps chatting
+from retrieval import get_encoding  # Import the tokenizer of the model to measure the history
+
+# Conversation history sent with every question, of bounded size however long the session lasts:
+# the last turns (question + answer) verbatim, and the older ones folded into a running summary.
+# The summary is updated in the background after each answer, one fold covering only the turns that
+# left the verbatim window, so its cost does not grow with the session either.
+
+# -------------- HISTORY CONFIGURATION --------------
+DEFAULT_RECENT_TURNS = 3  # Last question/answer pairs sent verbatim
+DEFAULT_HISTORY_TOKENS = 1200  # Ceiling of the history sent with a question: summary + recent turns
+DEFAULT_SUMMARY_TOKENS = 300  # Ceiling of the running summary
+FOLD_MESSAGE_TOKENS = 800  # Tokens of each message sent to the model when it is folded into the summary
+MIN_MESSAGE_TOKENS = 32  # Smallest truncated message worth keeping in the history
+ROLE_NAMES = {'user': 'Employee', 'assistant': 'Assistant'}
+
+# Prompt asking the model to fold some turns into the running summary
+summary_template = """
+Update the running summary of a conversation between an employee and an assistant with the new messages below. Keep the facts, names, reports and decisions the employee may refer to later, drop greetings and repetitions. Answer with the updated summary only, in at most {max_words} words.
+
+Current summary: {summary}
+
+New messages:
+{turns}
+
+Updated summary:
+"""
+
+# Function to get the turns of a conversation: the messages from the first question on
+# (the welcome message of the assistant is not part of the conversation)
+def conversation_turns(messages):
+    for index, message in enumerate(messages):
+        if message['role'] == 'user':
+            return [{'role': message['role'], 'content': message['content']} for message in messages[index:]]
+    return []
+
+# Function to cut a text to its first `max_tokens` tokens
+def truncate_tokens(text, max_tokens, model_name='gpt-4'):
+    encoding = get_encoding(model_name)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return encoding.decode(tokens[:max_tokens]) + " [...]", max_tokens
+
+# Function to write turns as "Employee: ..." / "Assistant: ..." lines, each message cut to `max_tokens`
+def format_turns(turns, max_tokens=FOLD_MESSAGE_TOKENS, model_name='gpt-4'):
+    lines = []
+    for turn in turns:
+        text, _ = truncate_tokens(turn['content'].strip(), max_tokens, model_name)
+        lines.append(f"{ROLE_NAMES.get(turn['role'], turn['role'])}: {text}")
+    return "\n".join(lines)
+
+# Function to build the history text of the prompt under a token ceiling, returns (text, tokens)
+# The summary is kept first (cut to `summary_tokens`), then the most recent messages fill what is left;
+# an older message that does not fit is cut, and the messages before it are dropped
+def build_history(summary, turns, max_tokens=DEFAULT_HISTORY_TOKENS, summary_tokens=DEFAULT_SUMMARY_TOKENS,
+                  model_name='gpt-4'):
+    encoding = get_encoding(model_name)
+    parts = []
+    used_tokens = 0
+    if summary.strip():
+        text, used_tokens = truncate_tokens(summary.strip(), min(summary_tokens, max_tokens), model_name)
+        parts.append(f"Summary of the earlier conversation: {text}")
+    lines = []
+    for turn in reversed(turns):
+        line = f"{ROLE_NAMES.get(turn['role'], turn['role'])}: {turn['content'].strip()}"
+        tokens = encoding.encode(line)
+        if used_tokens + len(tokens) + 1 <= max_tokens:
+            lines.append(line)
+            used_tokens += len(tokens) + 1
+            continue
+        remaining = max_tokens - used_tokens - 1
+        if remaining >= MIN_MESSAGE_TOKENS:
+            lines.append(encoding.decode(tokens[:remaining]) + " [...]")
+            used_tokens = max_tokens
+        break
+    if lines:
+        parts.append("\n".join(reversed(lines)))
+    return "\n\n".join(parts), used_tokens
+
+# Class keeping the history of one chat session: the running summary and how many turns it covers
+# The app stores one per Streamlit session; the folds run in a thread pool and update it in place
+class ConversationHistory:
+    def __init__(self, recent_turns=DEFAULT_RECENT_TURNS):
+        self.recent_turns = recent_turns
+        self.summary = ""
+        self.folded = 0  # Messages of the conversation already folded into the summary
+        self._folding = False
+        self._lock = threading.Lock()
+
+    # Function to get the history sent with the next question: the summary and the messages not folded yet
+    # `messages` is the conversation before the question
+    def payload(self, messages):
+        turns = conversation_turns(messages)
+        with self._lock:
+            return {'summary': self.summary, 'turns': turns[self.folded:]}
+
+    # Function to fold the turns that left the verbatim window into the summary, in the background
+    # `summarize(summary, turns)` returns the new summary, or None when it failed (the turns are folded
+    # with the next answer). Returns the future of the fold, or None when there is nothing to fold
+    def fold_in_background(self, messages, summarize, executor):
+        turns = conversation_turns(messages)
+        with self._lock:
+            # Whole turns only: the end is a multiple of two messages (question + answer)
+            end = max(0, len(turns) - 2 * self.recent_turns) // 2 * 2
+            if self._folding or end <= self.folded:
+                return None
+            self._folding = True
+            start, summary = self.folded, self.summary
+
+        def fold():
+            try:
+                new_summary = summarize(summary, turns[start:end])
+                if new_summary is not None:
+                    with self._lock:
+                        self.summary, self.folded = new_summary, end
+            finally:
+                with self._lock:
+                    self._folding = False
+
+        return executor.submit(fold)
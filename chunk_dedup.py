@@ -0,0 +1,184 @@
+import re  # Import the regular expression module to normalize the text
+import math  # Import math to estimate the embedding requests
+import zlib  # Import zlib for a fast hash of the shingles
+import hashlib  # Import hashlib to hash the normalized chunks and the LSH bands
+from collections import defaultdict  # Import defaultdict to count the pages of every line
+import numpy as np  # Import NumPy to compute the MinHash signatures
+from ingest_manifest import make_chunk_id  # Import the deterministic chunk IDs
+
+# -------------- DEDUP CONFIGURATION --------------
+SHINGLE_WORDS = 5  # Words per shingle of the MinHash signatures
+MINHASH_PERMUTATIONS = 128  # Length of the MinHash signatures
+LSH_BANDS = 16  # Bands of the LSH index (8 rows each), candidates share at least one band
+NEAR_DUPLICATE_THRESHOLD = 0.9  # Estimated Jaccard similarity above which two chunks are the same
+BOILERPLATE_MIN_PAGES = 3  # Pages a line must repeat on to be a header or footer...
+BOILERPLATE_PAGE_RATIO = 0.5  # ...and share of the pages of the document it must appear on
+MIN_CHUNK_CHARS = 20  # Chunks left with less text than this by the line stripping are dropped
+
+_PRIME = 4294967311  # Prime above 2^32 for the universal hash of the permutations
+_generator = np.random.default_rng(1729)  # Fixed seed: the signatures stored in the manifest stay comparable
+_PERM_A = _generator.integers(1, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _generator.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+# Function to normalize a text before hashing it: lowercase, single spaces
+def normalize_text(text):
+    return ' '.join(text.lower().split())
+
+# Function to normalize a line to detect it on every page, numbers are ignored ("Page 3 of 12")
+def normalize_line(line):
+    return re.sub(r'\d+', '#', normalize_text(line))
+
+# Function to get the hash identifying the exact duplicates of a chunk
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+# Function to compute the MinHash signature of a text from its word shingles, None for very short texts
+def minhash_signature(text):
+    words = normalize_text(text).split()
+    if len(words) < SHINGLE_WORDS:
+        return None
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # One universal hash per permutation, the signature keeps the minimum of each
+    return ((hashes[:, None] * _PERM_A + _PERM_B) % _PRIME).min(axis=0)
+
+# Function to get the LSH keys of a signature, one per band (signed 64-bit integers for SQLite)
+def band_keys(signature):
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    keys = []
+    for band in range(LSH_BANDS):
+        digest = hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8,
+                                 salt=band.to_bytes(2, 'little')).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+# Function to estimate the Jaccard similarity of two texts from their signatures
+def similarity(signature, other):
+    return float(np.mean(signature == other))
+
+# Function to remove the headers, footers and other lines repeated on the pages of a document
+# Returns the chunks without those lines and the number of lines removed
+def strip_repeated_lines(docs, min_pages=BOILERPLATE_MIN_PAGES, page_ratio=BOILERPLATE_PAGE_RATIO):
+    pages_by_line = defaultdict(set)
+    pages = set()
+    for doc in docs:
+        page = doc.metadata.get('page')
+        if page is None:
+            continue
+        pages.add(page)
+        for line in doc.page_content.splitlines():
+            if line.strip():
+                pages_by_line[normalize_line(line)].add(page)
+    # Documents without pages (articles extracted from HTML) or too short to tell are left as they are
+    if len(pages) < min_pages:
+        return docs, 0
+    threshold = max(min_pages, page_ratio * len(pages))
+    boilerplate = {line for line, line_pages in pages_by_line.items() if len(line_pages) >= threshold}
+    if not boilerplate:
+        return docs, 0
+    removed = 0
+    for doc in docs:
+        lines = doc.page_content.splitlines()
+        kept = [line for line in lines if not line.strip() or normalize_line(line) not in boilerplate]
+        if len(kept) != len(lines):
+            removed += len(lines) - len(kept)
+            doc.page_content = '\n'.join(kept).strip()
+    return docs, removed
+
+# Function to estimate the embedding requests needed for some chunks with the scheduler batch limits
+def estimate_requests(chunks, tokens, max_batch_chunks, max_batch_tokens):
+    if not chunks:
+        return 0
+    return max(math.ceil(chunks / max_batch_chunks), math.ceil(tokens / max_batch_tokens))
+
+# -------------- DEDUPLICATOR --------------
+# Class removing the boilerplate lines of every source and collapsing the exact and near-duplicate chunks
+# The signatures are stored in the ingest manifest, so a chunk is compared with the chunks of every
+# file already in the vector database; a duplicate is not embedded again, its file references the
+# chunk already stored instead
+class ChunkDeduplicator:
+    def __init__(self, manifest, count_tokens, near_threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.manifest = manifest
+        self.count_tokens = count_tokens
+        self.near_threshold = near_threshold
+        self.shared_chunk_ids = set()  # Stored chunks referenced again in this run
+        self.stats = {'chunks': 0, 'tokens': 0, 'boilerplate_lines': 0, 'stripped_tokens': 0,
+                      'empty_chunks': 0, 'exact_duplicates': 0, 'near_duplicates': 0,
+                      'duplicate_tokens': 0, 'embedded_chunks': 0, 'embedded_tokens': 0}
+
+    # Function to find the stored chunk a chunk duplicates, None if it is new
+    def _find_duplicate(self, content_hash, signature):
+        chunk_id = self.manifest.find_exact(content_hash)
+        if chunk_id is not None:
+            self.stats['exact_duplicates'] += 1
+            return chunk_id
+        if signature is None:
+            return None
+        best_id, best_similarity = None, self.near_threshold
+        for candidate_id, candidate in self.manifest.find_similar(band_keys(signature)):
+            score = similarity(signature, np.frombuffer(candidate, dtype=np.uint64))
+            if score >= best_similarity:
+                best_id, best_similarity = candidate_id, score
+        if best_id is not None:
+            self.stats['near_duplicates'] += 1
+        return best_id
+
+    # Function to deduplicate the chunks of a file
+    # Returns the IDs of every chunk the file references and the (chunk_id, doc) pairs still to embed
+    def process(self, path, content_hash, docs):
+        originals = [doc.page_content for doc in docs]
+        tokens = [self.count_tokens(text) for text in originals]
+        self.stats['chunks'] += len(docs)
+        self.stats['tokens'] += sum(tokens)
+        docs, removed = strip_repeated_lines(docs)
+        self.stats['boilerplate_lines'] += removed
+        # The file is not recorded yet: signatures left with its chunk IDs by an interrupted run describe
+        # chunks that may never have been stored, the file must not be a duplicate of itself
+        self.manifest.forget_signatures([make_chunk_id(path, content_hash, index) for index in range(len(docs))])
+
+        chunk_ids, new_chunks = [], []
+        for index, (doc, original, original_tokens) in enumerate(zip(docs, originals, tokens)):
+            stripped = doc.page_content != original
+            if stripped and len(doc.page_content) < MIN_CHUNK_CHARS:
+                # Nothing but header and footer lines
+                self.stats['empty_chunks'] += 1
+                self.stats['stripped_tokens'] += original_tokens
+                continue
+            doc_tokens = self.count_tokens(doc.page_content) if stripped else original_tokens
+            self.stats['stripped_tokens'] += original_tokens - doc_tokens
+            chunk_hash = text_hash(doc.page_content)
+            signature = minhash_signature(doc.page_content)
+            chunk_id = self._find_duplicate(chunk_hash, signature)
+            if chunk_id is not None:
+                self.stats['duplicate_tokens'] += doc_tokens
+                self.shared_chunk_ids.add(chunk_id)
+            else:
+                chunk_id = make_chunk_id(path, content_hash, index)
+                # Stored right away: the next chunks of this file and of this run are compared with it too
+                self.manifest.add_signature(chunk_id, chunk_hash, signature, band_keys(signature) if signature is not None else [])
+                new_chunks.append((chunk_id, doc))
+                self.stats['embedded_chunks'] += 1
+                self.stats['embedded_tokens'] += doc_tokens
+            if chunk_id not in chunk_ids:
+                chunk_ids.append(chunk_id)
+        return chunk_ids, new_chunks
+
+    # Function to report what the deduplication saved, the requests with the scheduler batch limits
+    def report(self, max_batch_chunks, max_batch_tokens):
+        stats = dict(self.stats)
+        stats['saved_chunks'] = stats['chunks'] - stats['embedded_chunks']
+        stats['saved_tokens'] = stats['tokens'] - stats['embedded_tokens']
+        stats['saved_requests'] = (
+            estimate_requests(stats['chunks'], stats['tokens'], max_batch_chunks, max_batch_tokens)
+            - estimate_requests(stats['embedded_chunks'], stats['embedded_tokens'], max_batch_chunks, max_batch_tokens)
+        )
+        return stats
+
+    # Function to describe what the deduplication saved
+    def summary(self, max_batch_chunks, max_batch_tokens):
+        stats = self.report(max_batch_chunks, max_batch_tokens)
+        return (f"Deduplication: {stats['embedded_chunks']}/{stats['chunks']} chunks embedded, "
+                f"{stats['saved_chunks']} saved ({stats['exact_duplicates']} exact and {stats['near_duplicates']} "
+                f"near duplicates, {stats['empty_chunks']} boilerplate-only), {stats['boilerplate_lines']} boilerplate "
+                f"lines removed, {stats['saved_tokens']} tokens and about {stats['saved_requests']} embedding requests saved")
@@ -0,0 +1,53 @@
+import os  # Import the OS module to find the crawler scripts
+import sys  # Import sys to exit with an error code
+import time  # Import time module to show the retry times
+import asyncio  # Import asyncio to run the crawls
+import argparse  # Import argparse to read the command line
+import importlib.util  # Import importlib to load the crawler scripts (their file names have hyphens)
+from frontier import CrawlFrontier  # Import the persistent crawl frontier
+
+# Crawls of the frontier and the script running each one
+CRAWL_SCRIPTS = {
+    'reports': 'web_scrapping_pdfs_reports.py',
+    'news-insights': 'web_scrapping_pdfs_news-insights.py',
+}
+
+# Command line of the crawls, for example:
+#   python crawl.py reports                  # resume the last run, or start a new one when it finished
+#   python crawl.py reports --restart        # start a new run from the sitemap
+#   python crawl.py reports --retry-failed   # retry the failed URLs now, even those out of attempts
+#   python crawl.py news-insights --status   # show the state of the frontier and the last failures
+
+# Function to load a crawler script as a module
+def load_crawl_script(crawl):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), CRAWL_SCRIPTS[crawl])
+    spec = importlib.util.spec_from_file_location(crawl.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Function to print the state of a crawl and its last failures
+def print_status(crawl):
+    frontier = CrawlFrontier(crawl)
+    print(frontier.summary())
+    for url, attempts, next_retry_at, last_error in frontier.failures():
+        retry = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_retry_at)) if next_retry_at else 'never'
+        print(f"  {url} ({attempts} attempts, next retry: {retry}): {last_error}")
+    frontier.close()
+
+# Function to parse the command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run, resume or inspect a crawl")
+    parser.add_argument('crawl', choices=sorted(CRAWL_SCRIPTS), help="Crawl to run")
+    parser.add_argument('--restart', action='store_true', help="Start a new run from the sitemap instead of resuming")
+    parser.add_argument('--retry-failed', action='store_true', help="Retry the failed URLs now, even those out of attempts")
+    parser.add_argument('--status', action='store_true', help="Only print the state of the frontier")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.status:
+        print_status(args.crawl)
+        sys.exit(0)
+    module = load_crawl_script(args.crawl)
+    asyncio.run(module.main(restart=args.restart, retry_failed=args.retry_failed))
@@ -0,0 +1,245 @@
+import os  # Import the OS module to manage the partial download files
+import re  # Import the regular expression module to parse Content-Range headers
+import base64  # Import base64 to decode the checksums sent by the server
+import hashlib  # Import hashlib to verify the downloaded files
+import asyncio  # Import asyncio for asynchronous programming
+import random  # Import random module for User-Agent rotation and delay jitter
+import contextlib  # Import contextlib to build async context managers
+from urllib.parse import urlsplit  # Import urlsplit to get the host of a URL
+import aiohttp  # Import aiohttp for the pooled asynchronous HTTP client
+import tracing  # Import the spans and counters of the requests
+
+# List of User-Agents for rotation
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:89.0) Gecko/20100101 Firefox/89.0"
+]
+
+RETRY_STATUSES = {502, 503, 504}  # Server errors worth retrying
+RETRY_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)  # Network errors worth retrying
+
+# Function to check if a failed request may succeed later (timeouts, rate limits, server errors)
+def is_retryable_status(status):
+    return status in (408, 425, 429) or status >= 500
+
+# Function to get the host of a URL
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+# -------------- SCHEDULER --------------
+# Class enforcing a global concurrency limit and a politeness delay between requests to the same host
+# Each host has its own timeline of request slots, so a slow host never blocks the others
+class HostScheduler:
+    def __init__(self, max_concurrency=8, host_delay=1.0, jitter=0.25):
+        self.host_delay = host_delay
+        self.jitter = jitter  # Random extra delay, as a fraction of the host delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._host_delays = {}  # Per-host delay overriding the default one
+        self._next_slot = {}  # Earliest moment of the next request to each host
+
+    # Function to set the delay between requests to a given host
+    def set_host_delay(self, host, delay):
+        self._host_delays[host] = delay
+
+    # Function to wait for the next free request slot of the host of a URL
+    async def wait_turn(self, url):
+        host = host_of(url)
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        # Book the slot before sleeping so concurrent callers queue up behind it
+        delay = self._host_delays.get(host, self.host_delay)
+        self._next_slot[host] = slot + delay * (1 + random.uniform(0, self.jitter))
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    # Context manager holding a concurrency slot during a request
+    @contextlib.asynccontextmanager
+    async def request_slot(self, url):
+        async with self._semaphore:
+            await self.wait_turn(url)
+            yield
+
+# -------------- HTTP CLIENT --------------
+# Function to create the pooled HTTP client shared by every request of a crawl (keep-alive connections)
+def create_session(max_connections=16, limit_per_host=8, read_timeout=60):
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=limit_per_host, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=read_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+# Context manager sending a GET request through the scheduler, retrying server and network errors
+# with exponential backoff; the response is yielded open so the caller can read or stream the body,
+# and the concurrency slot is held until the body has been consumed
+@contextlib.asynccontextmanager
+async def request(session, scheduler, url, headers=None, retries=5, backoff_factor=1.0):
+    request_headers = {'User-Agent': random.choice(USER_AGENTS), **(headers or {})}
+    for attempt in range(retries + 1):
+        async with scheduler.request_slot(url):
+            try:
+                response = await session.get(url, headers=request_headers)
+            except RETRY_ERRORS:
+                if attempt == retries:
+                    raise
+                response = None
+            if response is not None:
+                tracing.count('crawl_responses_total', status=response.status)
+                if response.status not in RETRY_STATUSES or attempt == retries:
+                    try:
+                        yield response
+                    finally:
+                        response.release()
+                    return
+                response.release()
+        tracing.count('crawl_retries_total')
+        await asyncio.sleep(backoff_factor * 2 ** attempt)
+
+# Function to GET a URL and read the whole body, returns (status, headers, body)
+async def fetch(session, scheduler, url, headers=None):
+    with tracing.span('crawl.fetch', url=url) as span:
+        async with request(session, scheduler, url, headers=headers) as response:
+            body = await response.read()
+        span.set('status', response.status)
+        span.set('bytes', len(body))
+        tracing.count('crawl_bytes_total', len(body), kind='page')
+        return response.status, response.headers, body
+
+# -------------- DOWNLOADS --------------
+# Error raised when a downloaded file fails verification
+class DownloadError(Exception):
+    pass
+
+# Function to get the checksums announced by the server (Content-MD5 and Digest headers)
+# The Content-MD5 of a 206 response only covers the range sent, it is ignored for partial responses;
+# Digest covers the whole file
+def announced_checksums(headers, partial=False):
+    checksums = {}
+    if 'Content-MD5' in headers and not partial:
+        checksums['md5'] = headers['Content-MD5'].strip()
+    for item in headers.get('Digest', '').split(','):
+        algorithm, _, value = item.strip().partition('=')
+        if algorithm.lower() in ('sha-256', 'md5') and value:
+            checksums[algorithm.lower().replace('-', '')] = value
+    return checksums
+
+# Function to get the validator of a response usable in If-Range: a strong ETag, or Last-Modified
+def range_validator(headers):
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+# Function to remove the partial file of a download and the validator saved with it
+def remove_partial(part_path):
+    for path in (part_path, f"{part_path}.validator"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+# Function to stream a file to disk: the body goes to `<output_path>.part` in chunks, an interrupted
+# download is resumed with an HTTP Range request (with If-Range, so a file changed on the server is
+# downloaded again instead of appended to the old part), and the file is verified (Content-Length, announced
+# checksums, optional `validate` callback) before being atomically renamed to `output_path`
+# Returns (status, sha256, response headers); other statuses (e.g. 304) are returned without touching the files
+async def download_file(session, scheduler, url, output_path, validate=None, headers=None, chunk_size=64 * 1024):
+    with tracing.span('crawl.download', url=url) as span:
+        status, content_hash, response_headers = await _download_file(
+            session, scheduler, url, output_path, validate, headers, chunk_size, span)
+        span.set('status', status)
+        return status, content_hash, response_headers
+
+# Function doing the download of download_file(), the bytes received are added to its span
+async def _download_file(session, scheduler, url, output_path, validate, headers, chunk_size, span):
+    part_path = f"{output_path}.part"
+    validator_path = f"{part_path}.validator"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = None
+    if offset:
+        try:
+            with open(validator_path, 'r', encoding='utf-8') as f:
+                validator = f.read().strip() or None
+        except FileNotFoundError:
+            pass
+        if validator is None:
+            # Without a validator the part cannot be matched with the remote file: start again
+            remove_partial(part_path)
+            offset = 0
+    request_headers = {**(headers or {}), 'Range': f"bytes={offset}-", 'If-Range': validator} if offset else headers
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+
+    async with request(session, scheduler, url, headers=request_headers) as response:
+        status, response_headers = response.status, response.headers
+        if status in (200, 206):
+            expected_size, checksums = await _write_part(response, part_path, offset, sha256, md5, chunk_size, span)
+
+    if status == 416 and offset:
+        # The partial file does not match the remote file anymore: start again from scratch, once the
+        # response is released (the new attempt needs a concurrency slot of its own)
+        remove_partial(part_path)
+        return await _download_file(session, scheduler, url, output_path, validate, headers, chunk_size, span)
+    if status not in (200, 206):
+        return status, None, response_headers
+
+    # Verify the file before making it visible
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        if size > expected_size:
+            remove_partial(part_path)
+        # A short file is kept, the next attempt resumes it
+        raise DownloadError(f"Size mismatch: expected {expected_size} bytes, got {size}")
+    digests = {'md5': base64.b64encode(md5.digest()).decode(), 'sha256': base64.b64encode(sha256.digest()).decode()}
+    for algorithm, value in checksums.items():
+        if digests[algorithm] != value:
+            remove_partial(part_path)
+            raise DownloadError(f"{algorithm} checksum mismatch")
+    if validate is not None and not validate(part_path):
+        remove_partial(part_path)
+        raise DownloadError("Downloaded file failed validation")
+
+    # Atomic rename: readers never see a truncated file
+    os.replace(part_path, output_path)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(validator_path)
+    return status, sha256.hexdigest(), response_headers
+
+# Function to write the body of a 200 or 206 response to the partial file, returns the expected size
+# of the whole file (None when unknown) and the checksums announced for it
+async def _write_part(response, part_path, offset, sha256, md5, chunk_size, span):
+    expected_size = None
+    if response.status == 206:
+        match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+        if not match or int(match.group(1)) != offset:
+            raise DownloadError(f"Unexpected Content-Range: {response.headers.get('Content-Range')}")
+        if match.group(2) != '*':
+            expected_size = int(match.group(2))
+        mode = 'ab'
+        # Hash the bytes already on disk so the checksum covers the whole file
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(chunk_size), b''):
+                sha256.update(block)
+                md5.update(block)
+    else:
+        # The server ignored the Range header, there was none, or the file changed (If-Range):
+        # write from the beginning, with the validator a later resume will send
+        mode = 'wb'
+        if response.content_length is not None and 'Content-Encoding' not in response.headers:
+            expected_size = response.content_length
+        validator_path = f"{part_path}.validator"
+        validator = range_validator(response.headers)
+        if validator:
+            with open(validator_path, 'w', encoding='utf-8') as f:
+                f.write(validator)
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(validator_path)
+    checksums = announced_checksums(response.headers, partial=response.status == 206)
+
+    received = 0
+    with open(part_path, mode) as f:
+        async for block in response.content.iter_chunked(chunk_size):
+            f.write(block)
+            sha256.update(block)
+            md5.update(block)
+            received += len(block)
+    span.set('bytes', received)
+    tracing.count('crawl_bytes_total', received, kind='download')
+    return expected_size, checksums
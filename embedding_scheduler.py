@@ -0,0 +1,151 @@
+import time  # Import time module for the rate limiters and the throughput report
+import random  # Import random module to add jitter to the retry delays
+import logging  # Import logging module to capture logs
+import threading  # Import threading to share the rate limiters between concurrent requests
+from concurrent.futures import ThreadPoolExecutor  # Import the thread pool running the concurrent requests
+import tiktoken  # Import tiktoken to count the tokens of every batch
+import tracing  # Import the counters of the embedding requests
+from openai import OpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError  # Import the OpenAI client and its transient errors
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: rate limits and transient network or server failures
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Class implementing a token bucket: `per_minute` units refilled continuously, up to one minute of burst
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Function to block until `amount` units are available and take them
+    def acquire(self, amount=1):
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_time = (amount - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+# Class scheduling embedding requests: batching by chunk and token count, N concurrent requests,
+# requests/min and tokens/min limits, and retries with jittered exponential backoff on rate limits
+class EmbeddingScheduler:
+    def __init__(self, model, api_key=None, base_url=None, max_batch_chunks=128, max_batch_tokens=50000,
+                 concurrency=4, requests_per_minute=3000, tokens_per_minute=1000000,
+                 max_retries=8, base_delay=1.0, max_delay=60.0):
+        self.model = model
+        self.max_batch_chunks = max_batch_chunks
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # The client retries are disabled, rate limits are handled here for every request at once
+        # (base_url defaults to the OPENAI_BASE_URL environment variable, e.g. a local stub server)
+        self._client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='embed')
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        try:
+            self._encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding('cl100k_base')
+        # When a request is rate limited every worker waits until this moment
+        self._paused_until = 0.0
+        self._stats_lock = threading.Lock()
+        self.stats = {'chunks': 0, 'tokens': 0, 'requests': 0, 'retries': 0, 'seconds': 0.0}
+
+    # Function to embed a list of texts, the vectors are returned in the same order
+    def embed(self, texts):
+        start_time = time.perf_counter()
+        vectors = [None] * len(texts)
+        futures = [
+            self._executor.submit(self._embed_batch, start_index, batch, tokens)
+            for start_index, batch, tokens in self._make_batches(texts)
+        ]
+        total_tokens = 0
+        for future in futures:
+            start_index, batch_vectors, tokens = future.result()
+            vectors[start_index:start_index + len(batch_vectors)] = batch_vectors
+            total_tokens += tokens
+        with self._stats_lock:
+            self.stats['chunks'] += len(texts)
+            self.stats['tokens'] += total_tokens
+            self.stats['seconds'] += time.perf_counter() - start_time
+        return vectors
+
+    # Function to get the throughput of every embed() call so far
+    def throughput(self):
+        seconds = self.stats['seconds'] or 1e-9
+        return {
+            **self.stats,
+            'chunks_per_second': round(self.stats['chunks'] / seconds, 1),
+            'tokens_per_second': round(self.stats['tokens'] / seconds, 1),
+        }
+
+    # Function to count the tokens of a text with the tokenizer of the embedding model
+    def count_tokens(self, text):
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    # Function to stop the worker threads
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    # Function to split the texts in batches limited both by chunk count and by token count
+    def _make_batches(self, texts):
+        batch, batch_tokens, start_index = [], 0, 0
+        for index, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if batch and (len(batch) >= self.max_batch_chunks or batch_tokens + tokens > self.max_batch_tokens):
+                yield start_index, batch, batch_tokens
+                batch, batch_tokens, start_index = [], 0, index
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield start_index, batch, batch_tokens
+
+    # Function to embed one batch, waiting for the rate limiters and retrying transient errors
+    def _embed_batch(self, start_index, batch, tokens):
+        for attempt in range(self.max_retries + 1):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            self._request_bucket.acquire(1)
+            self._token_bucket.acquire(tokens)
+            with self._stats_lock:
+                self.stats['requests'] += 1
+            tracing.count('embedding_requests_total')
+            try:
+                response = self._client.embeddings.create(model=self.model, input=batch)
+                tracing.count('embedding_tokens_total', tokens)
+                return start_index, [item.embedding for item in sorted(response.data, key=lambda item: item.index)], tokens
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                with self._stats_lock:
+                    self.stats['retries'] += 1
+                tracing.count('embedding_retries_total', error=type(e).__name__)
+                if isinstance(e, RateLimitError):
+                    # Slow down every worker, not only the one that was rate limited
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f} seconds")
+                time.sleep(delay)
+
+    # Function to compute the delay before a retry: Retry-After when given, else full-jitter exponential backoff
+    def _retry_delay(self, error, attempt):
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(self.max_delay, float(retry_after)) + random.uniform(0, self.base_delay)
+        except ValueError:
+            pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
@@ -0,0 +1,226 @@
+import time  # Import time module for the retry times
+import random  # Import random module to add jitter to the retry delays
+import asyncio  # Import asyncio to run the crawl workers
+import sqlite3  # Import sqlite3 to persist the frontier between runs
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode  # Import URL helpers to normalize the URLs
+import tracing  # Import the spans and counters of the crawled URLs
+
+DEFAULT_FRONTIER_PATH = './crawl_frontier.sqlite3'  # SQLite file shared by every crawl
+PENDING, IN_FLIGHT, DONE, FAILED = 'pending', 'in_flight', 'done', 'failed'  # States of a URL
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid')  # Query parameters that never change the page
+
+# Error raised by the crawl handlers, `retryable` tells the frontier whether to try the URL again
+class CrawlError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+# Function to normalize a URL so the same page is only crawled once: lowercase scheme and host,
+# no default port, no fragment, no tracking parameters, '/' for an empty path
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    if parts.username:
+        host = f"{parts.username}{':' + parts.password if parts.password else ''}@{host}"
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if not key.lower().startswith(TRACKING_PARAMS)])
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+# -------------- FRONTIER --------------
+# Class storing the state of every URL of a crawl (pending, in flight, done, failed) with its attempts,
+# next retry time and last error, so a crawl can resume after a crash and retry its failures
+# A crawl is made of runs: a new run queues the seeds again, a resumed run continues where it stopped
+class CrawlFrontier:
+    def __init__(self, crawl, path=DEFAULT_FRONTIER_PATH, max_attempts=5, base_delay=30.0, max_delay=3600.0):
+        self.crawl = crawl
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay  # Seconds before the first retry, doubled at every attempt
+        self.max_delay = max_delay
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS crawl_runs (
+                crawl TEXT PRIMARY KEY, run_id INTEGER NOT NULL, started_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS frontier (
+                crawl TEXT NOT NULL, url TEXT NOT NULL, kind TEXT NOT NULL, output_path TEXT,
+                priority INTEGER NOT NULL, run_id INTEGER NOT NULL, state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0, next_retry_at REAL, last_error TEXT,
+                seq INTEGER NOT NULL, updated_at REAL NOT NULL,
+                PRIMARY KEY (crawl, url));
+            CREATE INDEX IF NOT EXISTS frontier_ready ON frontier (crawl, state, priority, seq);
+        """)
+        row = self._conn.execute("SELECT run_id FROM crawl_runs WHERE crawl = ?", (crawl,)).fetchone()
+        self.run_id = row[0] if row else 0
+        self._seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM frontier").fetchone()[0]
+
+    # Function to start the crawl: URLs left in flight by a crash are pending again, and the current run
+    # is resumed if it has unfinished URLs; otherwise (or with restart) a new run starts and the caller seeds it
+    # Returns True when the run is resumed
+    def begin(self, restart=False):
+        self._conn.execute("UPDATE frontier SET state = ? WHERE crawl = ? AND state = ?", (PENDING, self.crawl, IN_FLIGHT))
+        unfinished = self._conn.execute(
+            "SELECT COUNT(*) FROM frontier WHERE crawl = ? AND run_id = ? AND "
+            "(state = ? OR (state = ? AND next_retry_at IS NOT NULL))",
+            (self.crawl, self.run_id, PENDING, FAILED),
+        ).fetchone()[0]
+        if unfinished and not restart:
+            self._conn.commit()
+            return True
+        self.run_id += 1
+        self._conn.execute("INSERT OR REPLACE INTO crawl_runs (crawl, run_id, started_at) VALUES (?, ?, ?)",
+                           (self.crawl, self.run_id, time.time()))
+        self._conn.commit()
+        return False
+
+    # Function to queue a URL in the current run; a URL already queued in this run is ignored
+    # (URLs crawled in a previous run are queued again). Returns True if the URL was queued
+    def add(self, url, kind='page', priority=1, output_path=None):
+        queued = self._insert(url, kind, priority, output_path)
+        self._conn.commit()
+        return queued
+
+    # Function to queue many URLs in a single transaction (seeding a run from the sitemap)
+    # Returns the number of URLs queued
+    def add_many(self, urls, kind='page', priority=1):
+        queued = sum(self._insert(url, kind, priority, None) for url in urls)
+        self._conn.commit()
+        return queued
+
+    def _insert(self, url, kind, priority, output_path):
+        url = normalize_url(url)
+        self._seq += 1
+        cursor = self._conn.execute(
+            "INSERT INTO frontier (crawl, url, kind, output_path, priority, run_id, state, attempts, seq, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?) "
+            "ON CONFLICT (crawl, url) DO UPDATE SET kind = excluded.kind, output_path = excluded.output_path, "
+            "priority = excluded.priority, run_id = excluded.run_id, state = excluded.state, attempts = 0, "
+            "next_retry_at = NULL, last_error = NULL, seq = excluded.seq, updated_at = excluded.updated_at "
+            "WHERE frontier.run_id < excluded.run_id",
+            (self.crawl, url, kind, output_path, priority, self.run_id, PENDING, self._seq, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    # Function to take the URLs ready to be crawled (pending, or failed and due for a retry) and mark them in flight
+    # Returns (url, kind, output_path, priority) tuples in priority and insertion order
+    def claim_ready(self, limit=1000):
+        now = time.time()
+        rows = self._conn.execute(
+            "SELECT url, kind, output_path, priority FROM frontier WHERE crawl = ? AND "
+            "(state = ? OR (state = ? AND next_retry_at <= ?)) ORDER BY priority, seq LIMIT ?",
+            (self.crawl, PENDING, FAILED, now, limit),
+        ).fetchall()
+        self._conn.executemany("UPDATE frontier SET state = ?, updated_at = ? WHERE crawl = ? AND url = ?",
+                               [(IN_FLIGHT, now, self.crawl, row[0]) for row in rows])
+        self._conn.commit()
+        return rows
+
+    # Function to record a URL crawled successfully
+    def mark_done(self, url):
+        self._conn.execute(
+            "UPDATE frontier SET state = ?, attempts = attempts + 1, next_retry_at = NULL, last_error = NULL, "
+            "updated_at = ? WHERE crawl = ? AND url = ?", (DONE, time.time(), self.crawl, url))
+        self._conn.commit()
+
+    # Function to record a failure: retried later with jittered exponential backoff while attempts remain
+    def mark_failed(self, url, error, retryable=True):
+        row = self._conn.execute("SELECT attempts FROM frontier WHERE crawl = ? AND url = ?", (self.crawl, url)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        next_retry_at = None
+        if retryable and attempts < self.max_attempts:
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            next_retry_at = time.time() + delay * random.uniform(0.8, 1.2)
+        self._conn.execute(
+            "UPDATE frontier SET state = ?, attempts = ?, next_retry_at = ?, last_error = ?, updated_at = ? "
+            "WHERE crawl = ? AND url = ?", (FAILED, attempts, next_retry_at, str(error), time.time(), self.crawl, url))
+        self._conn.commit()
+
+    # Function to get the time of the next scheduled retry, None when no failure will be retried
+    def next_retry_at(self):
+        return self._conn.execute(
+            "SELECT MIN(next_retry_at) FROM frontier WHERE crawl = ? AND state = ?", (self.crawl, FAILED)
+        ).fetchone()[0]
+
+    # Function to make every failed URL of the crawl due for a retry now, even those out of attempts
+    def retry_failed(self):
+        cursor = self._conn.execute(
+            "UPDATE frontier SET attempts = 0, next_retry_at = ? WHERE crawl = ? AND state = ?",
+            (time.time(), self.crawl, FAILED))
+        self._conn.commit()
+        return cursor.rowcount
+
+    # Function to count the URLs of the current run by state
+    def counts(self):
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        for state, count in self._conn.execute(
+                "SELECT state, COUNT(*) FROM frontier WHERE crawl = ? AND run_id = ? GROUP BY state",
+                (self.crawl, self.run_id)):
+            counts[state] = count
+        return counts
+
+    # Function to list the failed URLs with their attempts, next retry time and last error
+    def failures(self, limit=20):
+        return self._conn.execute(
+            "SELECT url, attempts, next_retry_at, last_error FROM frontier WHERE crawl = ? AND state = ? "
+            "ORDER BY updated_at DESC LIMIT ?", (self.crawl, FAILED, limit)).fetchall()
+
+    # Function to describe the state of the current run
+    def summary(self):
+        counts = self.counts()
+        return (f"Frontier '{self.crawl}' run {self.run_id}: {counts[DONE]} done, {counts[FAILED]} failed, "
+                f"{counts[PENDING] + counts[IN_FLIGHT]} pending")
+
+    # Function to close the frontier
+    def close(self):
+        self._conn.close()
+
+# -------------- CRAWL LOOP --------------
+# Function to crawl the frontier with `concurrency` workers: `handle(url, kind, output_path)` crawls one URL
+# (and may add new ones), raising CrawlError on failure; `on_error(url, message)` reports the failures
+# Retries due within `max_retry_wait` seconds are done in this run, later ones are left for the next run
+async def run_crawl(frontier, handle, on_error, concurrency=8, max_retry_wait=120):
+    queue = asyncio.PriorityQueue()
+    order = iter(range(1 << 62))  # Tie-breaker keeping the queue FIFO within a priority
+    buffer_size = concurrency * 2  # URLs claimed ahead, the rest waits in the frontier in priority order
+
+    def enqueue_ready():
+        for url, kind, output_path, priority in frontier.claim_ready(limit=max(0, buffer_size - queue.qsize())):
+            queue.put_nowait((priority, next(order), url, kind, output_path))
+
+    async def worker():
+        while True:
+            _, _, url, kind, output_path = await queue.get()
+            try:
+                with tracing.span('crawl.url', kind=kind, url=url):
+                    await handle(url, kind, output_path)
+                frontier.mark_done(url)
+                tracing.count('crawl_urls_total', kind=kind, outcome='done')
+            except CrawlError as e:
+                on_error(url, str(e))
+                frontier.mark_failed(url, e, e.retryable)
+                tracing.count('crawl_urls_total', kind=kind, outcome='failed')
+            except Exception as e:
+                on_error(url, f"Unexpected error: {e}")
+                frontier.mark_failed(url, f"Unexpected error: {e}")
+                tracing.count('crawl_urls_total', kind=kind, outcome='failed')
+            finally:
+                # Pick up the URLs the handler discovered
+                enqueue_ready()
+                queue.task_done()
+
+    enqueue_ready()
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        while True:
+            await queue.join()
+            # Retry pass: wait for the failures due soon, the others stay in the frontier
+            next_retry_at = frontier.next_retry_at()
+            if next_retry_at is None or next_retry_at - time.time() > max_retry_wait:
+                break
+            await asyncio.sleep(max(0.0, next_retry_at - time.time()))
+            enqueue_ready()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,156 @@
+import re  # Import the regular expression module to detect boilerplate and normalize text
+import json  # Import json to read the dates of the JSON-LD metadata
+from bs4 import BeautifulSoup  # Import BeautifulSoup for parsing HTML
+
+# Elements that never hold article text
+NON_CONTENT_TAGS = ['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'button']
+# Layout elements that usually hold page furniture (some sites wrap the whole page in a <form> or a <header>)
+BOILERPLATE_TAGS = ['form', 'nav', 'header', 'footer', 'aside']
+# class/id words of navigation, banners, share buttons, related content, logos...
+BOILERPLATE_PATTERN = re.compile(
+    r'(^|[-_\s])(cookie|consent|share|sharing|social|newsletter|subscribe|menu|breadcrumbs?|related|sidebar|'
+    r'footer|header|banner|promo|advert|ads|popup|modal|nav|navbar|navigation|logo|branding|comments?)([-_\s]|$)',
+    re.IGNORECASE,
+)
+# Elements whose text forms the article, in document order
+BLOCK_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'li', 'blockquote', 'pre', 'figcaption', 'td']
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+MIN_ARTICLE_CHARS = 200  # Text below which an <article>/<main> candidate is ignored
+MAX_LINK_DENSITY = 0.6  # Blocks made mostly of links (menus, tag lists) are dropped
+MAX_BOILERPLATE_SHARE = 0.2  # Share of the text of the page above which a furniture element is kept (unless made of links)
+
+# Function to collapse the whitespace of a text
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+# Function to get the content of a <meta> tag by property or name
+def _meta_content(soup, *keys):
+    for key in keys:
+        tag = soup.find('meta', attrs={'property': key}) or soup.find('meta', attrs={'name': key})
+        if tag and tag.get('content'):
+            return normalize_text(tag['content'])
+    return None
+
+# Function to find the publication date: meta tags, JSON-LD, then the first <time> element
+def _published_date(soup):
+    date = _meta_content(soup, 'article:published_time', 'og:published_time', 'date', 'dc.date', 'publish-date')
+    if date:
+        return date
+    for script in soup.find_all('script', attrs={'type': 'application/ld+json'}):
+        try:
+            data = json.loads(script.string or '')
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict) and item.get('datePublished'):
+                return str(item['datePublished'])
+    time_tag = soup.find('time')
+    if time_tag:
+        return time_tag.get('datetime') or normalize_text(time_tag.get_text())
+    return None
+
+# Function to check if an element looks like page furniture from its tag, class and id
+def _is_boilerplate(tag):
+    if tag.name in ('html', 'body', 'article', 'main'):
+        return False
+    if tag.name in BOILERPLATE_TAGS:
+        return True
+    names = ' '.join(tag.get('class') or []) + ' ' + (tag.get('id') or '')
+    return bool(BOILERPLATE_PATTERN.search(names)) or tag.get('role') in ('navigation', 'banner', 'contentinfo')
+
+# Function to choose the element holding the article: <article>/<main> when they have enough text,
+# otherwise the container whose paragraphs hold the most text (readability-style scoring)
+def _main_container(soup):
+    candidates = soup.find_all(['article', 'main']) + soup.find_all(attrs={'role': 'main'})
+    candidates = [tag for tag in candidates if len(tag.get_text(' ', strip=True)) >= MIN_ARTICLE_CHARS]
+    if candidates:
+        return max(candidates, key=lambda tag: len(tag.get_text(' ', strip=True)))
+    scores, nodes = {}, {}
+    for paragraph in soup.find_all('p'):
+        length = len(paragraph.get_text(' ', strip=True))
+        if length < 25:
+            continue
+        # A paragraph scores for its container, and half as much for the container above
+        for node, weight in ((paragraph.parent, 1.0), (paragraph.parent.parent if paragraph.parent else None, 0.5)):
+            if node is not None:
+                nodes[id(node)] = node
+                scores[id(node)] = scores.get(id(node), 0) + length * weight
+    if not scores:
+        return soup.body or soup
+    return nodes[max(scores, key=scores.get)]
+
+# Function to get the share of the text of an element that is link text
+def _link_density(tag, text):
+    link_chars = sum(len(normalize_text(link.get_text(' ', strip=True))) for link in tag.find_all('a'))
+    return link_chars / len(text) if text else 0.0
+
+# Function to get the text of a block, None for empty blocks and blocks made of links
+def _block_text(block):
+    text = normalize_text(block.get_text(' ', strip=True))
+    if not text:
+        return None
+    if block.name not in HEADING_TAGS and _link_density(block, text) > MAX_LINK_DENSITY:
+        return None
+    return text
+
+# Function to remove the page furniture around and inside the article container
+# A class like "entry-content has-share-buttons" also matches the furniture words: the container and its
+# ancestors are never removed, and neither is an element holding a large share of the text of the page
+# unless it is made of links (a big menu)
+def _strip_boilerplate(soup, container):
+    protected = {id(container)} | {id(parent) for parent in container.parents}
+    page_chars = len(normalize_text(soup.get_text(' ', strip=True))) or 1
+    for tag in soup.find_all(_is_boilerplate):
+        if tag.decomposed or id(tag) in protected:
+            continue
+        text = normalize_text(tag.get_text(' ', strip=True))
+        if len(text) / page_chars <= MAX_BOILERPLATE_SHARE or _link_density(tag, text) > MAX_LINK_DENSITY:
+            tag.decompose()
+
+# Function to split the article in sections, each with its heading path ("Title > Section > Subsection")
+def _sections(container):
+    sections = []
+    headings = []  # Stack of (level, text) of the current headings
+    paragraphs = []
+
+    def close_section():
+        if paragraphs:
+            sections.append({'heading': ' > '.join(text for _, text in headings), 'text': '\n\n'.join(paragraphs)})
+            paragraphs.clear()
+
+    for block in container.find_all(BLOCK_TAGS):
+        # Text of nested blocks (a <p> inside a <li>...) is already part of the outer block
+        if block.find_parent(BLOCK_TAGS) is not None:
+            continue
+        text = _block_text(block)
+        if text is None:
+            continue
+        if block.name in HEADING_TAGS:
+            close_section()
+            level = HEADING_TAGS[block.name]
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, text))
+        else:
+            paragraphs.append(text)
+    close_section()
+    return sections
+
+# Function to extract the main article of an HTML page, without navigation, banners and other boilerplate
+# Returns a document {url, title, date, sections: [{heading, text}]} ready for the ingest pipeline
+def extract_article(html, url):
+    soup = BeautifulSoup(html, 'lxml')
+    # Title and date first: they often live in the <head> and in header elements removed below
+    h1 = soup.find('h1')
+    title = (_meta_content(soup, 'og:title', 'twitter:title')
+             or (normalize_text(h1.get_text(' ', strip=True)) if h1 else None)
+             or (normalize_text(soup.title.get_text()) if soup.title else None))
+    date = _published_date(soup)
+
+    for tag in soup.find_all(NON_CONTENT_TAGS):
+        tag.decompose()
+    # The container is chosen before the furniture is removed, so it is never removed with it
+    container = _main_container(soup)
+    _strip_boilerplate(soup, container)
+
+    return {'url': url, 'title': title, 'date': date, 'sections': _sections(container)}
@@ -0,0 +1,81 @@
+import json  # Import json to store the links found in a page
+import time  # Import time module to record when a URL was fetched
+import sqlite3  # Import sqlite3 to persist the metadata between runs
+
+DEFAULT_HTTP_CACHE_PATH = './http_cache.sqlite3'  # SQLite file storing the HTTP metadata of every URL
+
+# Class storing, per URL, the validators (ETag, Last-Modified) and the content hash of the last fetch,
+# so re-crawls send conditional requests and skip unchanged pages and files
+class HttpMetadataCache:
+    def __init__(self, path=DEFAULT_HTTP_CACHE_PATH):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT,
+                size INTEGER, fetched_at REAL NOT NULL, links TEXT)
+        """)
+        self._conn.commit()
+        # Counters of the current run
+        self.stats = {'requests': 0, 'not_modified': 0, 'unchanged': 0, 'bytes_downloaded': 0, 'bytes_saved': 0}
+
+    # Function to get the stored metadata of a URL
+    def get(self, url):
+        row = self._conn.execute(
+            "SELECT etag, last_modified, content_hash, size, fetched_at, links FROM http_cache WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'etag': row[0], 'last_modified': row[1], 'content_hash': row[2], 'size': row[3],
+            'fetched_at': row[4], 'links': json.loads(row[5]) if row[5] else None,
+        }
+
+    # Function to build the If-None-Match / If-Modified-Since headers of a URL
+    def conditional_headers(self, url):
+        entry = self.get(url)
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    # Function to record a 304 answer: the stored content is still valid
+    def record_not_modified(self, url):
+        entry = self.get(url)
+        self.stats['requests'] += 1
+        self.stats['not_modified'] += 1
+        self.stats['bytes_saved'] += (entry or {}).get('size') or 0
+        self._conn.execute("UPDATE http_cache SET fetched_at = ? WHERE url = ?", (time.time(), url))
+        self._conn.commit()
+
+    # Function to record a full answer; returns True when the content is the same as last time
+    def record_response(self, url, headers, content_hash, size, links=None):
+        entry = self.get(url)
+        unchanged = entry is not None and entry['content_hash'] == content_hash
+        self.stats['requests'] += 1
+        self.stats['bytes_downloaded'] += size
+        if unchanged:
+            self.stats['unchanged'] += 1
+        if links is None and unchanged:
+            links = entry['links']
+        self._conn.execute(
+            "INSERT OR REPLACE INTO http_cache (url, etag, last_modified, content_hash, size, fetched_at, links) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, headers.get('ETag'), headers.get('Last-Modified'), content_hash, size, time.time(),
+             json.dumps(links) if links is not None else None),
+        )
+        self._conn.commit()
+        return unchanged
+
+    # Function to describe the savings of the current run
+    def summary(self):
+        stats = self.stats
+        return (f"HTTP cache: {stats['not_modified']}/{stats['requests']} requests answered 304 Not Modified, "
+                f"{stats['unchanged']} unchanged responses skipped, "
+                f"{stats['bytes_saved'] / 1e6:.1f} MB saved, {stats['bytes_downloaded'] / 1e6:.1f} MB downloaded")
+
+    # Function to close the cache
+    def close(self):
+        self._conn.close()
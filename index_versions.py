@@ -0,0 +1,292 @@
+import os  # Import the OS module to manage the version directories and the pointer file
+import json  # Import json to store the description of every version
+import time  # Import time module to name and date the versions
+import shutil  # Import shutil to copy the active version and remove the old ones
+import logging  # Import logging module to report the builds
+import argparse  # Import argparse to build, check and roll back versions from the command line
+import numpy as np  # Import NumPy to read the sampled embeddings
+
+# Blue-green builds of the indexes used by the app (Chroma, BM25 index, exported vector index):
+#   index_versions/
+#     CURRENT                     <- name of the active version, replaced atomically
+#     v20261018-101500/           <- one directory per version
+#       chroma_db/  lexical_index.sqlite3  vector_index/  version.json
+# A build copies the active version into a new directory and runs the incremental ingest there (or
+# ingests everything again with --fresh, e.g. after changing the splitter or the embedding model),
+# then validates it: chunk counts of the three indexes and recall of sampled chunks searched by their
+# own embedding. Only a valid version is activated. The app reads CURRENT before its queries and opens
+# the new version on the next one, without restarting; rollback points CURRENT back to the previous version.
+#   python index_versions.py build
+#   python index_versions.py status
+#   python index_versions.py rollback
+
+# -------------- VERSIONS CONFIGURATION --------------
+DEFAULT_VERSIONS_DIRECTORY = './index_versions'  # Directory of the versions
+CURRENT_FILE = 'CURRENT'  # Pointer to the active version
+VERSION_FILE = 'version.json'  # Description of a version: origin, validation, activation
+CHROMA_DIRECTORY = 'chroma_db'  # Chroma database of a version
+LEXICAL_INDEX_FILE = 'lexical_index.sqlite3'  # BM25 index of a version
+VECTOR_INDEX_DIRECTORY = 'vector_index'  # Exported vector index of a version (when the active one has one)
+# Indexes written by update_embeddings.py before the versions, the first build starts from them
+LEGACY_PATHS = {'persist_directory': './chroma_db', 'lexical_index_path': './lexical_index.sqlite3',
+                'vector_index_directory': './vector_index'}
+KEEP_VERSIONS = 3  # Versions kept on disk, besides the active one and its previous one
+VALIDATION_SAMPLES = 20  # Chunks searched by their own embedding to measure the recall
+VALIDATION_K = 6  # A sampled chunk is found when it is in the first k results
+MIN_RECALL = 0.9  # Recall needed to activate a version
+MAX_SHRINK = 0.5  # Share of the chunks of the active version a new version may lose
+
+logger = logging.getLogger(__name__)
+
+# -------------- VERSIONS --------------
+# Function to get the paths of the indexes of a version, with the names used by update_embeddings.py
+def version_paths(root, version):
+    directory = os.path.join(root, version)
+    return {'persist_directory': os.path.join(directory, CHROMA_DIRECTORY),
+            'lexical_index_path': os.path.join(directory, LEXICAL_INDEX_FILE),
+            'vector_index_directory': os.path.join(directory, VECTOR_INDEX_DIRECTORY)}
+
+# Function to get the name of the active version, None when no version was activated yet
+def current_version(root=DEFAULT_VERSIONS_DIRECTORY):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+# Function to read the description of a version
+def read_version_info(root, version):
+    with open(os.path.join(root, version, VERSION_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Function to write a file atomically: written next to it, then renamed over it
+def _write_atomic(path, text):
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+# Function to write the description of a version
+def write_version_info(root, version, info):
+    _write_atomic(os.path.join(root, version, VERSION_FILE), json.dumps(info, indent=2))
+
+# Function to list the versions on disk, oldest first
+def list_versions(root=DEFAULT_VERSIONS_DIRECTORY):
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, VERSION_FILE)))
+
+# Function to create a new version directory: a copy of the indexes of the active version (or of the
+# legacy indexes before the first version), or an empty one with `fresh`. Returns its name
+def create_version(root=DEFAULT_VERSIONS_DIRECTORY, fresh=False):
+    os.makedirs(root, exist_ok=True)
+    version = time.strftime('v%Y%m%d-%H%M%S')
+    suffix = 1
+    while os.path.exists(os.path.join(root, version)):
+        suffix += 1
+        version = f"{time.strftime('v%Y%m%d-%H%M%S')}-{suffix}"
+    base = current_version(root)
+    source = version_paths(root, base) if base is not None else LEGACY_PATHS
+    target = version_paths(root, version)
+    os.makedirs(os.path.join(root, version))
+    if not fresh:
+        # Nothing writes to the active version, its files are copied as they are
+        for name, path in source.items():
+            if os.path.isdir(path):
+                shutil.copytree(path, target[name])
+            elif os.path.exists(path):
+                shutil.copy2(path, target[name])
+    write_version_info(root, version, {'version': version, 'created_at': time.time(), 'based_on': base,
+                                       'fresh': fresh, 'validation': None})
+    return version
+
+# -------------- VALIDATION --------------
+# Function to find the chunk IDs closest to an embedding in the store the app will search
+def _nearest_ids(store, collection, embedding, k):
+    if store is not None:
+        rows, _ = store.search(embedding, k)
+        return store.chunk_ids(rows)
+    return collection.query(query_embeddings=[embedding.tolist()], n_results=k, include=[])['ids'][0]
+
+# Function to validate a version before activating it, returns the report of the checks
+# The report lists the problems found, the version is valid when there are none
+def validate_version(root, version, samples=VALIDATION_SAMPLES, k=VALIDATION_K, min_recall=MIN_RECALL,
+                     max_shrink=MAX_SHRINK):
+    from langchain_chroma import Chroma  # Import Chroma to read the collection of the version
+    from lexical_index import LexicalIndex, lexical_index_exists  # Import the BM25 index
+    from vector_index import VectorIndex, index_exists  # Import the exported vector index
+    paths = version_paths(root, version)
+    problems = []
+    collection = Chroma(persist_directory=paths['persist_directory'])._collection
+    count = collection.count()
+    report = {'chunks': count, 'lexical_chunks': None, 'vector_index_chunks': None, 'recall': None}
+    if not count:
+        problems.append("the collection is empty")
+
+    # Counts: the three indexes hold the same chunks
+    if lexical_index_exists(paths['lexical_index_path']):
+        lexical_index = LexicalIndex(paths['lexical_index_path'], read_only=True)
+        report['lexical_chunks'] = lexical_index.count()
+        lexical_index.close()
+        if report['lexical_chunks'] != count:
+            problems.append(f"the BM25 index has {report['lexical_chunks']} chunks, Chroma {count}")
+    else:
+        problems.append("the BM25 index is missing")
+    store = None
+    if index_exists(paths['vector_index_directory']):
+        store = VectorIndex(paths['vector_index_directory'])
+        report['vector_index_chunks'] = store.count()
+        if store.count() != count:
+            problems.append(f"the vector index has {store.count()} chunks, Chroma {count}")
+
+    # A new version losing most of the chunks of the active one comes from a wrong folder or a broken run
+    active = current_version(root)
+    if active is not None and active != version:
+        active_chunks = (read_version_info(root, active).get('validation') or {}).get('chunks') or 0
+        if count < active_chunks * (1 - max_shrink):
+            problems.append(f"{count} chunks against {active_chunks} in the active version {active}")
+
+    # Recall: chunks spread over the collection must come first when searched by their own embedding
+    if count and (store is None or store.count() == count):
+        found = 0
+        offsets = np.unique(np.linspace(0, count - 1, min(samples, count)).astype(int))
+        for offset in offsets:
+            sample = collection.get(limit=1, offset=int(offset), include=['embeddings'])
+            embedding = np.asarray(sample['embeddings'][0], dtype=np.float32)
+            found += sample['ids'][0] in _nearest_ids(store, collection, embedding, k)
+        report['recall'] = round(found / len(offsets), 3)
+        if report['recall'] < min_recall:
+            problems.append(f"recall@{k} of {report['recall']} below {min_recall}")
+    if store is not None:
+        store.close()
+    report['problems'] = problems
+    report['valid'] = not problems
+    report['validated_at'] = time.time()
+    info = read_version_info(root, version)
+    info['validation'] = report
+    write_version_info(root, version, info)
+    return report
+
+# -------------- ACTIVATION --------------
+# Function to make a version the active one: CURRENT is replaced in one rename, the app processes
+# open the new version on their next query. Only validated versions are activated unless `force`
+def activate_version(root, version, force=False, record_previous=True):
+    info = read_version_info(root, version)
+    if not force and not (info.get('validation') or {}).get('valid'):
+        raise ValueError(f"Version {version} was not validated, it cannot be activated")
+    previous = current_version(root)
+    if record_previous and previous != version:
+        info['previous'] = previous
+    info['activated_at'] = time.time()
+    write_version_info(root, version, info)
+    _write_atomic(os.path.join(root, CURRENT_FILE), version)
+    logger.info(f"Index version {version} activated (previous: {previous})")
+    return previous
+
+# Function to go back to the version active before the current one, returns its name
+def rollback(root=DEFAULT_VERSIONS_DIRECTORY):
+    version = current_version(root)
+    if version is None:
+        raise ValueError("No version is active")
+    previous = read_version_info(root, version).get('previous')
+    if previous is None or not os.path.exists(os.path.join(root, previous, VERSION_FILE)):
+        raise ValueError(f"Version {version} has no previous version to go back to")
+    # The previous version keeps its own previous one, rolling back again goes further back
+    activate_version(root, previous, force=True, record_previous=False)
+    return previous
+
+# Function to remove the old versions, keeping the active one, its previous one and the `keep` newest
+# Processes still reading a removed version keep their open files until they switch to the active one
+def prune_versions(root=DEFAULT_VERSIONS_DIRECTORY, keep=KEEP_VERSIONS):
+    versions = list_versions(root)
+    active = current_version(root)
+    kept = set(versions[-keep:]) if keep else set()
+    if active is not None:
+        kept.add(active)
+        kept.add(read_version_info(root, active).get('previous'))
+    removed = [version for version in versions if version not in kept]
+    for version in removed:
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+    return removed
+
+# -------------- BUILD --------------
+# Function to build a new version with the documents of `folders_paths`, validate it and activate it
+# when it is valid. Returns (version, validation report)
+def build_version(folders_paths, root=DEFAULT_VERSIONS_DIRECTORY, fresh=False, activate=True, keep=KEEP_VERSIONS):
+    import update_embeddings  # Import the ingest pipeline (loads LangChain and Chroma)
+    from vector_index import export_index, index_exists, INDEX_FILE  # Import the export of the vector index
+    from chat_cache import chroma_fingerprint  # Import the fingerprint of the Chroma collection
+    version = create_version(root, fresh=fresh)
+    base = current_version(root)
+    paths = version_paths(root, version)
+    origin = 'from scratch' if fresh else f"from {base or 'the legacy indexes'}"
+    logger.info(f"Building index version {version} ({origin})")
+    summary = update_embeddings.update_embeddings(folders_paths, paths['persist_directory'],
+                                                  lexical_index_path=paths['lexical_index_path'],
+                                                  vector_index_directory=paths['vector_index_directory'])
+    # A fresh build exports the vector index with the settings of the active version
+    base_index = (version_paths(root, base) if base is not None else LEGACY_PATHS)['vector_index_directory']
+    if fresh and index_exists(base_index) and not index_exists(paths['vector_index_directory']):
+        from langchain_chroma import Chroma  # Import Chroma to read the new collection
+        with open(os.path.join(base_index, INDEX_FILE), 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+        vectordb = Chroma(persist_directory=paths['persist_directory'])
+        if vectordb._collection.count():
+            export_index(vectordb._collection, paths['vector_index_directory'], dtype=settings['dtype'],
+                         ivf_lists=settings['ivf_lists'],
+                         fingerprint=chroma_fingerprint(paths['persist_directory']))
+    report = validate_version(root, version)
+    report['ingest'] = {'files': summary['files'], 'removed_files': summary['removed_files'], 'chunks': summary['chunks']}
+    if not report['valid']:
+        logger.error(f"Index version {version} is not valid, the active version is unchanged: {'; '.join(report['problems'])}")
+    elif activate:
+        activate_version(root, version)
+        removed = prune_versions(root, keep)
+        if removed:
+            logger.info(f"Old index versions removed: {', '.join(removed)}")
+    return version, report
+
+# Function to parse the command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build, validate, activate and roll back versions of the indexes")
+    parser.add_argument('--root', default=DEFAULT_VERSIONS_DIRECTORY, help="Directory of the versions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="Build a new version, validate it and activate it")
+    build.add_argument('--fresh', action='store_true', help="Ingest every document again instead of copying the active version")
+    build.add_argument('--no-activate', action='store_true', help="Only build and validate the version")
+    build.add_argument('--keep', type=int, default=KEEP_VERSIONS, help="Old versions kept on disk")
+    commands.add_parser('status', help="List the versions and their validation")
+    validate = commands.add_parser('validate', help="Validate a version again")
+    validate.add_argument('version')
+    activate = commands.add_parser('activate', help="Activate a validated version")
+    activate.add_argument('version')
+    activate.add_argument('--force', action='store_true', help="Activate it even if it was not validated")
+    commands.add_parser('rollback', help="Go back to the previous version")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        from update_embeddings import folders_paths  # Import the folders of the documents
+        version, report = build_version(folders_paths, args.root, fresh=args.fresh, activate=not args.no_activate,
+                                        keep=args.keep)
+        print(json.dumps({'version': version, **report}, indent=2))
+        raise SystemExit(0 if report['valid'] else 1)
+    if args.command == 'status':
+        active = current_version(args.root)
+        for version in list_versions(args.root):
+            validation = read_version_info(args.root, version).get('validation') or {}
+            state = 'valid' if validation.get('valid') else ('invalid' if validation else 'not validated')
+            print(f"{'*' if version == active else ' '} {version}  {state}  chunks={validation.get('chunks')}  "
+                  f"recall={validation.get('recall')}")
+    elif args.command == 'validate':
+        report = validate_version(args.root, args.version)
+        print(json.dumps(report, indent=2))
+        raise SystemExit(0 if report['valid'] else 1)
+    elif args.command == 'activate':
+        activate_version(args.root, args.version, force=args.force)
+        print(f"Active version: {args.version}")
+    elif args.command == 'rollback':
+        print(f"Active version: {rollback(args.root)}")
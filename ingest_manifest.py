@@ -0,0 +1,182 @@
+import os  # Import the OS module to inspect the files
+import json  # Import json to store the splitter parameters
+import sqlite3  # Import sqlite3 to persist the manifest and checkpoint the progress of a run
+import hashlib  # Import hashlib to hash the file contents and build deterministic chunk IDs
+
+MANIFEST_NAME = 'ingest_manifest.sqlite3'  # File name of the manifest inside the persistence directory
+
+# Function to compute the SHA-256 of a file without loading it fully in memory
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to build the deterministic ID of a chunk, the same file content always gives the same IDs
+def make_chunk_id(path, content_hash, index):
+    key = f"{path.replace(os.sep, '/')}|{content_hash}|{index}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+# Class keeping track of which files are in the vector database and with which chunk IDs
+# A chunk shared by several files (deduplicated) is stored once and referenced by each of them
+# Every commit is a checkpoint: a crashed run resumes after the last committed file
+class IngestManifest:
+    def __init__(self, path, splitter_params):
+        self.path = path
+        self.splitter_params = splitter_params
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS manifest_meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunk_refs (
+                chunk_id TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY (path, chunk_id));
+            CREATE INDEX IF NOT EXISTS chunk_refs_by_chunk ON chunk_refs (chunk_id);
+            CREATE TABLE IF NOT EXISTS chunk_signatures (
+                chunk_id TEXT PRIMARY KEY, text_hash TEXT NOT NULL, minhash BLOB);
+            CREATE INDEX IF NOT EXISTS chunk_signatures_by_hash ON chunk_signatures (text_hash);
+            CREATE TABLE IF NOT EXISTS chunk_bands (band_key INTEGER NOT NULL, chunk_id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunk_bands_by_key ON chunk_bands (band_key);
+        """)
+        # Manifests written before the deduplication had one file per chunk, their rows become references
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks'").fetchone():
+            self._conn.execute("INSERT OR IGNORE INTO chunk_refs (chunk_id, path) SELECT chunk_id, path FROM chunks")
+            self._conn.execute("DROP TABLE chunks")
+            self._conn.commit()
+        row = self._conn.execute("SELECT value FROM manifest_meta WHERE key = 'splitter_params'").fetchone()
+        stored_params = json.loads(row[0]) if row else None
+        # Changing the splitter (or the embedding model) invalidates every chunk
+        self.params_changed = stored_params is not None and stored_params != splitter_params
+        if stored_params is None:
+            self._store_params()
+
+    # Function to iterate over every chunk ID in the manifest, in batches
+    def iter_chunk_id_batches(self, batch_size):
+        cursor = self._conn.execute("SELECT DISTINCT chunk_id FROM chunk_refs")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
+
+    # Function to drop every entry, used once the chunks built with old parameters are deleted
+    def clear(self):
+        self._conn.execute("DELETE FROM files")
+        self._conn.execute("DELETE FROM chunk_refs")
+        self._conn.execute("DELETE FROM chunk_signatures")
+        self._conn.execute("DELETE FROM chunk_bands")
+        self._store_params()
+        self._conn.commit()
+        self.params_changed = False
+
+    # Function to check whether a file was never ingested with this manifest
+    def is_new(self, path):
+        return self._conn.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone() is None
+
+    # Function to check a file on disk against the manifest
+    # Returns the content hash when the file must be (re)ingested, None when it is unchanged
+    def check(self, path):
+        stat = os.stat(path)
+        row = self._conn.execute("SELECT sha256, size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+        # Same size and modification time: assume unchanged without reading the file
+        if row and row[1] == stat.st_size and row[2] == stat.st_mtime_ns:
+            return None
+        content_hash = file_sha256(path)
+        if row and row[0] == content_hash:
+            # Touched but not modified: only refresh the file metadata
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                (stat.st_size, stat.st_mtime_ns, path),
+            )
+            return None
+        return content_hash
+
+    # Function to get the files in the manifest that were not seen on disk
+    def removed_paths(self, seen_paths):
+        return [row[0] for row in self._conn.execute("SELECT path FROM files") if row[0] not in seen_paths]
+
+    # Function to get the chunk IDs referenced by a file
+    def chunk_ids(self, path):
+        return [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunk_refs WHERE path = ?", (path,))]
+
+    # Function to get the chunk IDs referenced by a file and by no other file
+    def exclusive_chunk_ids(self, path):
+        return [row[0] for row in self._conn.execute(
+            "SELECT chunk_id FROM chunk_refs AS ref WHERE path = ? AND NOT EXISTS "
+            "(SELECT 1 FROM chunk_refs AS other WHERE other.chunk_id = ref.chunk_id AND other.path <> ?)",
+            (path, path))]
+
+    # Function to get the files referencing each of some chunks, {chunk_id: [paths]} (unreferenced chunks are missing)
+    def chunk_sources(self, chunk_ids):
+        sources = {}
+        for chunk_id in chunk_ids:
+            paths = [row[0] for row in self._conn.execute(
+                "SELECT path FROM chunk_refs WHERE chunk_id = ? ORDER BY path", (chunk_id,))]
+            if paths:
+                sources[chunk_id] = paths
+        return sources
+
+    # Function to store the exact hash, MinHash signature and LSH band keys of a stored chunk
+    def add_signature(self, chunk_id, text_hash, minhash, band_keys):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chunk_signatures (chunk_id, text_hash, minhash) VALUES (?, ?, ?)",
+            (chunk_id, text_hash, minhash.tobytes() if minhash is not None else None),
+        )
+        self._conn.execute("DELETE FROM chunk_bands WHERE chunk_id = ?", (chunk_id,))
+        self._conn.executemany("INSERT INTO chunk_bands (band_key, chunk_id) VALUES (?, ?)",
+                               [(key, chunk_id) for key in band_keys])
+
+    # Function to find a stored chunk with the same normalized text
+    def find_exact(self, text_hash):
+        row = self._conn.execute("SELECT chunk_id FROM chunk_signatures WHERE text_hash = ? LIMIT 1", (text_hash,)).fetchone()
+        return row[0] if row else None
+
+    # Function to get the stored chunks sharing an LSH band with a signature, as (chunk_id, minhash) pairs
+    def find_similar(self, band_keys):
+        placeholders = ', '.join('?' * len(band_keys))
+        return self._conn.execute(
+            "SELECT chunk_id, minhash FROM chunk_signatures WHERE chunk_id IN "
+            f"(SELECT chunk_id FROM chunk_bands WHERE band_key IN ({placeholders}))", band_keys,
+        ).fetchall()
+
+    # Function to remove the signatures of deleted chunks
+    def forget_signatures(self, chunk_ids):
+        self._conn.executemany("DELETE FROM chunk_signatures WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+        self._conn.executemany("DELETE FROM chunk_bands WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+
+    # Function to record a file once all its chunks are in the vector database
+    def record(self, path, content_hash, chunk_ids):
+        stat = os.stat(path)
+        self._conn.execute("DELETE FROM chunk_refs WHERE path = ?", (path,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, sha256, size, mtime_ns) VALUES (?, ?, ?, ?)",
+            (path, content_hash, stat.st_size, stat.st_mtime_ns),
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO chunk_refs (chunk_id, path) VALUES (?, ?)",
+            [(chunk_id, path) for chunk_id in chunk_ids],
+        )
+
+    # Function to remove a file from the manifest once its own chunks are deleted
+    def forget(self, path):
+        self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        self._conn.execute("DELETE FROM chunk_refs WHERE path = ?", (path,))
+
+    # Function to checkpoint the progress of the run
+    def commit(self):
+        self._conn.commit()
+
+    # Function to close the manifest
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    # Function to store the splitter parameters of the manifest
+    def _store_params(self):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO manifest_meta (key, value) VALUES ('splitter_params', ?)",
+            (json.dumps(self.splitter_params, sort_keys=True),),
+        )
@@ -0,0 +1,215 @@
+import os  # Import the OS module to find the index file and the titles of the sources
+import re  # Import the regular expression module to split the questions into terms
+import json  # Import json to store the chunk metadata
+import sqlite3  # Import sqlite3 for the FTS5 full-text index (BM25 ranking)
+import threading  # Import threading to share the connection between Streamlit sessions
+
+# -------------- LEXICAL INDEX CONFIGURATION --------------
+DEFAULT_LEXICAL_INDEX_PATH = './lexical_index.sqlite3'  # SQLite file of the BM25 index
+TITLE_WEIGHT = 2.0  # BM25 weight of a match in the title of the document, the chunk text weighs 1
+MAX_QUERY_TERMS = 32  # Terms of a question used for the lexical search
+KEYWORD_MAX_TERMS = 6  # Longest question answered by the keyword fast path...
+KEYWORD_MAX_SOURCES = 3  # ...when its words are found next to each other (or its codes) in at most this many documents
+KEYWORD_MIN_CODE_SHARE = 0.5  # Share of the terms of a question that must be acronyms or codes to search them alone
+KEYWORD_MIN_SCORE_GAP = 2.0  # BM25 score of the best chunk over the best chunk of another document for a phrase found outside the titles
+REBUILD_BATCH = 5000  # Chunks read from Chroma at a time to rebuild the index
+
+# Words ignored in the questions, they match every chunk and say nothing about the documents wanted
+STOPWORDS = frozenset("""
+a about an and any are as at be by can could did do does for from had has have how i in is it its
+me my of on or our should tell than that the their there these this those to was we were what when
+where which who why will with would you your
+""".split())
+
+# Function to get the distinct search terms of a question, in order and without stopwords
+def query_terms(question, limit=MAX_QUERY_TERMS):
+    terms = []
+    for term in re.findall(r'\w+', question.lower()):
+        if term not in STOPWORDS and term not in terms:
+            terms.append(term)
+    return terms[:limit]
+
+# Function to get the terms of a question written as acronyms or codes ("WEEE", "PAS 2050", "EN45554")
+# A plain number is only part of a code after an acronym, "since 2020" is not a code
+def code_terms(question):
+    terms = []
+    previous_is_code = False
+    for term in re.findall(r'\w+', question):
+        has_digit = any(char.isdigit() for char in term)
+        is_code = ((has_digit and not term.isdigit()) or (len(term) > 1 and term.isupper())
+                   or (term.isdigit() and previous_is_code))
+        if is_code and term.lower() not in terms:
+            terms.append(term.lower())
+        previous_is_code = is_code
+    return terms
+
+# Function to build an FTS5 query from some terms, quoted so they are never read as operators
+def match_expression(terms, operator):
+    return f" {operator} ".join(f'"{term}"' for term in terms)
+
+# Function to get the title indexed with a chunk: the article title, or the file name of a report
+def chunk_title(metadata):
+    if metadata.get('title'):
+        return metadata['title']
+    return os.path.splitext(os.path.basename(metadata.get('source', '')))[0].replace('_', ' ').replace('-', ' ')
+
+# -------------- INDEX --------------
+# Class keeping a BM25 index of the chunks stored in Chroma, in an SQLite FTS5 table
+# update_embeddings.py writes the same chunks, with the same IDs, to Chroma and to this index,
+# so both stay in sync incrementally; the app opens it read-only
+class LexicalIndex:
+    def __init__(self, path=DEFAULT_LEXICAL_INDEX_PATH, read_only=False):
+        self.path = path
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            # External content table: the text is stored once in `chunks`, the triggers keep FTS5 in sync
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    rowid INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, source TEXT NOT NULL,
+                    title TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL);
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    title, text, content='chunks', content_rowid='rowid', tokenize='porter unicode61 remove_diacritics 2');
+                CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts (rowid, title, text) VALUES (new.rowid, new.title, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, title, text) VALUES ('delete', old.rowid, old.title, old.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_update AFTER UPDATE OF title, text ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, title, text) VALUES ('delete', old.rowid, old.title, old.text);
+                    INSERT INTO chunks_fts (rowid, title, text) VALUES (new.rowid, new.title, new.text);
+                END;
+            """)
+            self._conn.commit()
+        self._lock = threading.Lock()
+
+    # -------------- WRITES --------------
+    # Function to add or replace chunks (LangChain documents) with their chunk IDs
+    def upsert(self, chunk_ids, docs):
+        rows = [(chunk_id, doc.metadata.get('source', ''), chunk_title(doc.metadata), doc.page_content,
+                 json.dumps(doc.metadata)) for chunk_id, doc in zip(chunk_ids, docs)]
+        with self._lock:
+            self._conn.executemany("""
+                INSERT INTO chunks (chunk_id, source, title, text, metadata) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chunk_id) DO UPDATE SET source = excluded.source, title = excluded.title,
+                    text = excluded.text, metadata = excluded.metadata
+            """, rows)
+
+    # Function to merge metadata keys into stored chunks, like a Chroma update
+    def update_metadata(self, chunk_ids, metadatas):
+        with self._lock:
+            for chunk_id, metadata in zip(chunk_ids, metadatas):
+                row = self._conn.execute("SELECT metadata FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE chunks SET metadata = ? WHERE chunk_id = ?",
+                                       (json.dumps({**json.loads(row[0]), **metadata}), chunk_id))
+
+    # Function to delete chunks by ID
+    def delete(self, chunk_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+
+    # Function to save the changes, called with the manifest checkpoints
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    # Function to index again every chunk of a Chroma collection (first run, or index out of sync)
+    def rebuild(self, collection, batch_size=REBUILD_BATCH):
+        from langchain_core.documents import Document  # Import Document to index the stored chunks
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+        for offset in range(0, collection.count(), batch_size):
+            batch = collection.get(limit=batch_size, offset=offset, include=['documents', 'metadatas'])
+            if not batch['ids']:
+                break
+            self.upsert(batch['ids'], [Document(page_content=text or '', metadata=metadata or {})
+                                       for text, metadata in zip(batch['documents'], batch['metadatas'])])
+        with self._lock:
+            # Merge the FTS5 segments written by the batches, the searches read fewer of them
+            self._conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('optimize')")
+            self._conn.commit()
+
+    # -------------- SEARCH --------------
+    # Function to get the number of chunks in the index
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    # Function to run an FTS5 query, as (chunk_id, BM25 score, document) best first
+    def _search(self, expression, k):
+        from langchain_core.documents import Document  # Import Document to return the same results as Chroma
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT chunks.chunk_id, chunks.text, chunks.metadata, bm25(chunks_fts, ?, 1.0) AS rank
+                FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid
+                WHERE chunks_fts MATCH ? ORDER BY rank LIMIT ?
+            """, (TITLE_WEIGHT, expression, k)).fetchall()
+        # FTS5 returns the BM25 score negated, the lower the better
+        return [(chunk_id, -rank, Document(page_content=text, metadata=json.loads(metadata)))
+                for chunk_id, text, metadata, rank in rows]
+
+    # Function to get the `k` chunks with the best BM25 score for any of the terms of a question
+    def search(self, question, k=6):
+        terms = query_terms(question)
+        if not terms:
+            return []
+        return [doc for _, _, doc in self._search(match_expression(terms, 'OR'), k)]
+
+    # Function to count the documents with a chunk matching an FTS5 query, up to `limit`
+    def _matching_sources(self, expression, limit):
+        with self._lock:
+            return len(self._conn.execute("""
+                SELECT DISTINCT chunks.source FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid
+                WHERE chunks_fts MATCH ? LIMIT ?
+            """, (expression, limit)).fetchall())
+
+    # Function to get how far the best chunk for the terms of a question is ahead of the best chunk of
+    # another document (BM25 score ratio), infinite when no other document has the terms
+    def _score_gap(self, terms, limit=50):
+        results = self._search(match_expression(terms, 'OR'), limit)
+        if not results:
+            return 0.0
+        _, top_score, top_doc = results[0]
+        for _, score, doc in results[1:]:
+            if doc.metadata.get('source') != top_doc.metadata.get('source'):
+                return top_score / score if score > 0 else float('inf')
+        return float('inf')
+
+    # Function to answer a short keyword question (title, acronym, product code) from this index alone
+    # It is confident when the question is mostly acronyms and codes found together in a few documents,
+    # or when its words (two or more) are found next to each other in a few documents and either in a
+    # title or in a chunk far ahead of every other document; otherwise it returns no chunks and the
+    # question goes through the hybrid search (a question in plain words matches the words of many
+    # chunks, a single word matches any chunk that has it)
+    def keyword_search(self, question, k=6, max_terms=KEYWORD_MAX_TERMS, max_sources=KEYWORD_MAX_SOURCES,
+                       min_code_share=KEYWORD_MIN_CODE_SHARE, min_score_gap=KEYWORD_MIN_SCORE_GAP):
+        terms = query_terms(question)
+        if not terms or len(terms) > max_terms:
+            return []
+        codes = code_terms(question)
+        if codes and len(codes) >= min_code_share * len(terms):
+            expression = match_expression(codes, 'AND')
+            if 0 < self._matching_sources(expression, max_sources + 1) <= max_sources:
+                return [doc for _, _, doc in self._search(expression, k)]
+        if len(terms) < 2:
+            return []
+        # The terms of the question within a window as long as the question (FTS5 counts the tokens
+        # between the first and the last term)
+        window = max(len(re.findall(r'\w+', question)) - 2, 0)
+        phrase = f"NEAR({match_expression(terms, '')}, {window})"
+        if not 0 < self._matching_sources(phrase, max_sources + 1) <= max_sources:
+            return []
+        if self._matching_sources(f"{{title}} : {phrase}", 1) or self._score_gap(terms) >= min_score_gap:
+            return [doc for _, _, doc in self._search(phrase, k)]
+        return []
+
+    # Function to close the index
+    def close(self):
+        self._conn.close()
+
+# Function to check whether the index file exists
+def lexical_index_exists(path=DEFAULT_LEXICAL_INDEX_PATH):
+    return os.path.exists(path)
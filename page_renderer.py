@@ -0,0 +1,105 @@
+import asyncio  # Import asyncio for asynchronous programming
+import random  # Import random module for the delays between pages
+from pyppeteer import launch  # Import pyppeteer for controlling headless browsers
+
+# -------------- RENDERER --------------
+# Class rendering pages with one long-lived headless browser and a pool of reusable tabs
+# At most `tabs` pages render at the same time; a page that fails or exceeds the timeout only
+# recycles its own tab, and the browser is relaunched if it dies, so the run always continues
+class PageRenderer:
+    def __init__(self, tabs=4, page_timeout=60, delay_range=(3, 7), launch_options=None):
+        self.tabs = tabs
+        self.page_timeout = page_timeout  # Seconds allowed to render one page
+        self.delay_range = delay_range  # Random pause of every tab between two pages (seconds)
+        self.launch_options = {'headless': True, 'handleSIGINT': False, 'handleSIGTERM': False,
+                               'handleSIGHUP': False, **(launch_options or {})}
+        self._browser = None
+        self._browser_lock = asyncio.Lock()
+        # Idle tabs, opened on first use (None) and reused for the following pages
+        self._idle_tabs = asyncio.Queue()
+        for _ in range(tabs):
+            self._idle_tabs.put_nowait(None)
+        self._releases = set()  # Tabs in their pause before going back to the pool
+        self.stats = {'pages': 0, 'errors': 0, 'recycled_tabs': 0, 'browser_launches': 0}
+
+    async def __aenter__(self):
+        await self._get_browser()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Function to close the tabs and the browser
+    async def close(self):
+        for task in list(self._releases):
+            task.cancel()
+        while not self._idle_tabs.empty():
+            page = self._idle_tabs.get_nowait()
+            if page is not None:
+                await self._close_tab(page)
+        if self._browser is not None:
+            browser, self._browser = self._browser, None
+            try:
+                await asyncio.wait_for(browser.close(), timeout=10)
+            except Exception:
+                pass
+
+    # Function to get the browser, launching it the first time or again after a crash
+    async def _get_browser(self):
+        async with self._browser_lock:
+            if self._browser is None:
+                browser = await launch(self.launch_options)
+                # Forget a browser that died, the next tab launches a fresh one
+                browser.on('disconnected', lambda: self._forget_browser(browser))
+                self._browser = browser
+                self.stats['browser_launches'] += 1
+            return self._browser
+
+    def _forget_browser(self, browser):
+        if self._browser is browser:
+            self._browser = None
+
+    # Function to open a new tab, flagged as crashed if Chromium kills its renderer process
+    async def _new_tab(self):
+        browser = await self._get_browser()
+        page = await browser.newPage()
+        page.crashed = False
+        page.on('error', lambda error: setattr(page, 'crashed', True))
+        return page
+
+    # Function to close a tab without waiting forever on a hung renderer
+    async def _close_tab(self, page):
+        try:
+            await asyncio.wait_for(page.close(), timeout=5)
+        except Exception:
+            pass
+
+    # Function to put a tab back in the pool after its pause between two pages
+    async def _release_tab(self, page):
+        await asyncio.sleep(random.uniform(*self.delay_range))
+        self._idle_tabs.put_nowait(page)
+
+    # Function to render one URL with `handler(page, url)` in an idle tab, waiting for one if all are busy
+    # A failure or timeout closes the tab (the next page gets a fresh one) and is raised to the caller
+    async def render(self, url, handler):
+        page = await self._idle_tabs.get()
+        try:
+            if page is None or page.isClosed() or page.crashed:
+                page = await self._new_tab()
+            await asyncio.wait_for(handler(page, url), timeout=self.page_timeout)
+            self.stats['pages'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            # The tab may be stuck on the failed page: start the next URL in a fresh one
+            if page is not None:
+                self.stats['recycled_tabs'] += 1
+                await self._close_tab(page)
+            page = None
+            if isinstance(e, asyncio.TimeoutError):
+                raise TimeoutError(f"timed out after {self.page_timeout} seconds") from e
+            raise
+        finally:
+            # Asynchronous pause of the tab: the caller and the other tabs carry on meanwhile
+            task = asyncio.create_task(self._release_tab(page))
+            self._releases.add(task)
+            task.add_done_callback(self._releases.discard)
@@ -0,0 +1,161 @@
+import json  # Import json to read the articles extracted from HTML pages
+import time  # Import time module to enforce the per-file timeout
+import multiprocessing  # Import multiprocessing to parse the files on every CPU core
+from multiprocessing.connection import wait  # Import wait to listen to several workers at once
+import tracing  # Import the spans of the load and split stages
+
+# Splitters already built in this process, by parameters
+_splitters = {}
+
+# -------------- PARSING --------------
+# Function to get the text splitter of some parameters, built once per process
+def get_splitter(chunk_size, chunk_overlap):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter  # Import text splitter from LangChain
+    key = (chunk_size, chunk_overlap)
+    if key not in _splitters:
+        _splitters[key] = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return _splitters[key]
+
+# Function to load a PDF and split it into chunks
+# Returns compact (metadata, text) tuples instead of Document objects to keep the results small to transfer
+def parse_pdf(path_pdf, chunk_size, chunk_overlap):
+    from langchain_community.document_loaders import PyPDFLoader  # Import PDF loader from LangChain community
+    with tracing.span('ingest.load', path=path_pdf) as span:
+        docs = PyPDFLoader(path_pdf).load()
+        span.set('pages', len(docs))
+    with tracing.span('ingest.split', path=path_pdf) as span:
+        chunks = get_splitter(chunk_size, chunk_overlap).split_documents(docs)
+        span.set('chunks', len(chunks))
+    return [({'page': chunk.metadata.get('page')}, chunk.page_content) for chunk in chunks]
+
+# Function to split an article extracted from an HTML page (JSON written by the news-insights scraper)
+# Every section is split on its own so each chunk keeps its heading, title, URL and date
+def parse_article(path_json, chunk_size, chunk_overlap):
+    with tracing.span('ingest.load', path=path_json):
+        with open(path_json, 'r', encoding='utf-8') as f:
+            article = json.load(f)
+    splitter = get_splitter(chunk_size, chunk_overlap)
+    chunks = []
+    with tracing.span('ingest.split', path=path_json) as span:
+        for section in article.get('sections', []):
+            metadata = {'url': article.get('url'), 'title': article.get('title'), 'date': article.get('date'),
+                        'heading': section.get('heading')}
+            # Chroma only stores str/int/float/bool metadata values
+            metadata = {key: value for key, value in metadata.items() if value}
+            chunks.extend((metadata, text) for text in splitter.split_text(section['text']))
+        span.set('chunks', len(chunks))
+    return chunks
+
+# Function to parse any ingestable file: PDFs, and JSON articles extracted from HTML
+def parse_document(path, chunk_size, chunk_overlap):
+    if path.endswith('.json'):
+        return parse_article(path, chunk_size, chunk_overlap)
+    return parse_pdf(path, chunk_size, chunk_overlap)
+
+# Loop run by every worker process: receive a file, parse it, send the chunks back
+# The spans of the file go back with the result, the parent process writes them with its own
+def _worker_loop(conn, chunk_size, chunk_overlap):
+    while True:
+        path_pdf = conn.recv()
+        if path_pdf is None:
+            break
+        try:
+            result = ('ok', parse_document(path_pdf, chunk_size, chunk_overlap))
+        except Exception as e:
+            result = ('error', f"{type(e).__name__}: {e}")
+        conn.send(result + (tracing.drain(),))
+
+# -------------- PROCESS POOL --------------
+# Class wrapping one worker process and the file it is working on
+class _Worker:
+    def __init__(self, context, chunk_size, chunk_overlap):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_conn, chunk_size, chunk_overlap), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started_at = None
+
+    def submit(self, task):
+        self.task = task
+        self.started_at = time.monotonic()
+        self.conn.send(task[0])
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+# Generator parsing the (path, content_hash) tasks on a pool of worker processes
+# Yields (path, content_hash, chunks, error) in completion order; a file that fails, crashes its
+# worker or exceeds the timeout yields an error and its worker is replaced, the run continues
+def parse_files_parallel(tasks, workers, chunk_size, chunk_overlap, timeout=120):
+    # Spawned workers do not inherit the open Chroma client and threads of the parent
+    context = multiprocessing.get_context('spawn')
+    pool = [_Worker(context, chunk_size, chunk_overlap) for _ in range(workers)]
+    tasks = iter(tasks)
+    exhausted = False
+    try:
+        while True:
+            # Give a file to every idle worker, so at most `workers` files are in flight
+            for worker in pool:
+                if worker.task is None and not exhausted:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                    else:
+                        worker.submit(task)
+            busy = [worker for worker in pool if worker.task is not None]
+            if not busy:
+                break
+
+            now = time.monotonic()
+            next_deadline = min(worker.started_at + timeout for worker in busy)
+            ready = wait([worker.conn for worker in busy], timeout=max(0.0, next_deadline - now))
+
+            for index, worker in enumerate(pool):
+                if worker.task is None:
+                    continue
+                path_pdf, content_hash = worker.task
+                if worker.conn in ready:
+                    try:
+                        status, payload, spans = worker.conn.recv()
+                        tracing.adopt(spans)
+                    except (EOFError, OSError):
+                        worker.kill()
+                        status, payload = 'error', f"worker process died (exit code {worker.process.exitcode})"
+                        pool[index] = _Worker(context, chunk_size, chunk_overlap)
+                    worker.task = None
+                    if status == 'ok':
+                        yield path_pdf, content_hash, payload, None
+                    else:
+                        yield path_pdf, content_hash, None, payload
+                elif time.monotonic() - worker.started_at > timeout and not worker.conn.poll():
+                    # The parser hung on this file: kill the worker and start a fresh one
+                    worker.kill()
+                    pool[index] = _Worker(context, chunk_size, chunk_overlap)
+                    yield path_pdf, content_hash, None, f"timed out after {timeout} seconds"
+    finally:
+        for worker in pool:
+            if worker.task is None:
+                worker.stop()
+            else:
+                worker.kill()
+
+# Generator parsing the files one at a time in this process (same interface, no timeout)
+def parse_files_sequential(tasks, chunk_size, chunk_overlap):
+    for path_pdf, content_hash in tasks:
+        try:
+            yield path_pdf, content_hash, parse_document(path_pdf, chunk_size, chunk_overlap), None
+        except Exception as e:
+            yield path_pdf, content_hash, None, f"{type(e).__name__}: {e}"
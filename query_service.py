@@ -0,0 +1,478 @@
+# -------------- Need to deploy Streamlit cloud --------------
+import sys
+try:
+    import pysqlite3
+    sys.modules['sqlite3'] = pysqlite3  # Replace the sqlite3 module with pysqlite3 to ensure compatibility
+except ImportError:
+    pass
+
+import os  # Import the OS module to read the service configuration
+import time  # Import time module to measure the queue waits
+import socket  # Import socket to bind the embedded service to a free port
+import asyncio  # Import asyncio for the event loop of the service
+import argparse  # Import argparse to run the service from the command line
+import functools  # Import functools to run the blocking stages in the thread pool
+import threading  # Import threading to run the service inside the Streamlit process
+import contextvars  # Import contextvars so the spans of the blocking stages stay in their trace
+from concurrent.futures import ThreadPoolExecutor  # Import the thread pool of the blocking stages (Chroma, SQLite)
+from aiohttp import web  # Import the aiohttp web server
+import resources  # Import the process-wide registry of shared resources (clients, Chroma, chain, cache)
+import tracing  # Import the spans and counters of every answer (turned on with TRACING=1)
+from chat_cache import normalize_question  # Import the question normalization of the cache keys
+from chat_history import build_history, format_turns  # Import the bounded conversation history
+from retrieval import embed_question, hybrid_search, build_context, count_tokens  # Import the retrieval stage helpers
+
+# Backend answering the questions of every Streamlit session: retrieval and model calls run here,
+# app.py only sends the question and renders the answer.
+#   python query_service.py --port 8000 --workers 8 --queue-size 64
+#   QUERY_SERVICE_URL=http://127.0.0.1:8000 streamlit run app.py
+# Without QUERY_SERVICE_URL the app starts the service inside its own process.
+# - Identical questions in flight are answered by one model call, every caller gets the same tokens
+# - A fixed number of workers call the model, the other questions wait in a bounded queue; when every
+#   worker is busy and the queue is full the service answers 503 with Retry-After instead of piling up requests
+# - One chat model client (one pool of keep-alive connections) is shared by every worker
+# - The history of the session comes with the question (summary + recent turns) and is cut to a token
+#   ceiling, so the prompt stops growing however long the conversation lasts
+
+# -------------- RETRIEVAL CONFIGURATION --------------
+retrieval_k = 6  # Number of chunks retrieved from Chroma for every question
+retrieval_fetch_k = 20  # Number of candidates considered when MMR is enabled
+use_mmr = True  # Diversify the retrieved chunks with Maximal Marginal Relevance
+keyword_fast_path = True  # Answer titles, acronyms and codes from the BM25 index alone, without embedding the question
+context_token_budget = 3000  # Maximum number of tokens of retrieved context sent to the model
+
+# -------------- SERVICE CONFIGURATION --------------
+service_workers = int(os.getenv('QUERY_WORKERS', '8'))  # Questions answered at the same time (model calls in flight)
+service_queue_size = int(os.getenv('QUERY_QUEUE_SIZE', '64'))  # Questions waiting for a worker before answering 503
+retry_after_seconds = 2  # Retry-After sent with the 503 answers
+
+# -------------- RETRIEVAL --------------
+# Blocking stages, run in the thread pool of the service
+
+# Function to pack the retrieved chunks into the token budget
+def pack_context(docs):
+    with tracing.span('chat.prompt_build', chunks=len(docs)) as span:
+        # Pack the chunks into a fixed token budget so the prompt size does not grow with the session
+        context, context_tokens = build_context(docs, max_tokens=context_token_budget, model_name=resources.llm_model)
+        span.set('context_tokens', context_tokens)
+    return context
+
+# Function to retrieve the chunks relevant to a question and pack them into the token budget
+def get_context(question, query_embedding):
+    with tracing.span('chat.retrieval', k=retrieval_k, mmr=use_mmr) as span:
+        # Get the top-k chunks from the vector store and the BM25 index, fused by rank
+        docs = hybrid_search(resources.get_vectordb(), resources.get_lexical_index(), question, query_embedding,
+                             k=retrieval_k, use_mmr=use_mmr, fetch_k=retrieval_fetch_k)
+        span.set('chunks', len(docs))
+    return pack_context(docs)
+
+# Function to get the chunks of a keyword question from the BM25 index alone, empty when it is not confident
+def get_keyword_docs(question):
+    lexical_index = resources.get_lexical_index()
+    if not keyword_fast_path or lexical_index is None:
+        return []
+    with tracing.span('chat.keyword_search') as span:
+        docs = lexical_index.keyword_search(question, k=retrieval_k)
+        span.set('chunks', len(docs))
+    return docs
+
+# Function to prepare the model input for a question, or get a cached answer for it
+# The query embedding is None when the question was answered by the keyword fast path
+# Cached answers are keyed on the history sent with the question: a follow-up ("and in 2020?") depends
+# on the previous turns, the same words only reuse an answer given after the same history
+def prepare_input(question, history=""):
+    # A new index version activated by index_versions.py is opened here, before the question is answered
+    resources.refresh_index_version()
+    chat_cache = resources.get_chat_cache()
+    with tracing.span('chat.cache_lookup') as span:
+        # Drop cached answers if the Chroma collection changed since they were generated
+        chat_cache.validate(resources.collection_fingerprint(), resources.embedding_model)
+        # Reuse the embedding when the same question was already asked
+        query_embedding = chat_cache.get_embedding(question)
+        span.set('embedding_hit', query_embedding is not None)
+    if query_embedding is None:
+        # A confident keyword match skips the embedding request
+        keyword_docs = get_keyword_docs(question)
+        if keyword_docs:
+            # No embedding to compare: only the same question after the same history reuses an answer
+            cached_answer = chat_cache.get_exact_answer(question, history)
+            if cached_answer is not None:
+                tracing.count('chat_questions_total', path='cache')
+                return None, cached_answer, None
+            tracing.count('chat_questions_total', path='keyword')
+            return None, None, model_input(question, pack_context(keyword_docs), history)
+        with tracing.span('chat.embed', model=resources.embedding_model):
+            query_embedding = embed_question(resources.get_embeddings(), question)
+        chat_cache.put_embedding(question, query_embedding)
+    # Reuse the answer of an equivalent question if there is one
+    cached_answer = chat_cache.get_answer(query_embedding, history)
+    if cached_answer is not None:
+        tracing.count('chat_questions_total', path='cache')
+        return query_embedding, cached_answer, None
+    tracing.count('chat_questions_total', path='hybrid')
+    # Prepare input data for the model with the retrieved context
+    return query_embedding, None, model_input(question, get_context(question, query_embedding), history)
+
+# Function to build the input data of the prompt
+def model_input(question, context, history):
+    return {"input": question, "context": context, "history": history or "None, this is the first question."}
+
+# Function to get the history text of the prompt from the history sent by the app
+# {"summary": "...", "turns": [{"role": "user", "content": "..."}, ...]}, cut to the token ceiling
+def history_text(history):
+    if not history:
+        return ""
+    with tracing.span('chat.history') as span:
+        text, tokens = build_history(history.get('summary') or "", history.get('turns') or [],
+                                     max_tokens=resources.history_max_tokens,
+                                     summary_tokens=resources.history_summary_tokens, model_name=resources.llm_model)
+        span.set('history_tokens', tokens)
+    return text
+
+# Function to count the tokens sent to and received from the model, only when tracing is on
+def record_tokens(span, input_data, answer):
+    if not tracing.enabled():
+        return
+    tokens_in = count_tokens(resources.prompt_template.format(**input_data), resources.llm_model)
+    tokens_out = count_tokens(answer, resources.llm_model)
+    span.set('tokens_in', tokens_in)
+    span.set('tokens_out', tokens_out)
+    tracing.count('chat_tokens_total', tokens_in, direction='in')
+    tracing.count('chat_tokens_total', tokens_out, direction='out')
+
+# Function to build the chat chain ahead of the first question
+def warm_up():
+    try:
+        resources.get_qa_chain()
+    except Exception:
+        pass  # A missing API key is reported by the first answer, not at startup
+
+# -------------- SERVICE --------------
+# Error raised when the queue is full, the caller should retry later
+class ServiceBusy(Exception):
+    pass
+
+# Class holding the answer of a question in flight: the tokens produced so far and whether it is complete
+# Every caller of the same question reads the same tokens, the late ones start from the first token
+class InFlightAnswer:
+    def __init__(self, question, history=""):
+        self.question = question
+        self.history = history
+        self.parts = []
+        self.done = False
+        self.failed = False
+        self.queued_at = time.perf_counter()
+        self._changed = asyncio.Condition()
+
+    # Function to add tokens to the answer and wake up the readers
+    async def publish(self, text):
+        async with self._changed:
+            self.parts.append(text)
+            self._changed.notify_all()
+
+    # Function to mark the answer complete (an error message is the last part of a failed answer)
+    async def finish(self, error=None):
+        async with self._changed:
+            if error is not None:
+                self.parts.append(error)
+                self.failed = True
+            self.done = True
+            self._changed.notify_all()
+
+    # Generator yielding the tokens of the answer as they are produced
+    async def stream(self):
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done or len(self.parts) > index)
+                parts, done = self.parts[index:], self.done
+            for text in parts:
+                yield text
+            index += len(parts)
+            if done and index == len(self.parts):
+                return
+
+    # Function to wait for the whole answer
+    async def result(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.done)
+        return "".join(self.parts)
+
+# Class holding a summary fold waiting in the queue, the worker that runs it sets its result
+class PendingSummary:
+    def __init__(self, summary, turns):
+        self.summary = summary
+        self.turns = turns
+        self.queued_at = time.perf_counter()
+        self.result = asyncio.get_running_loop().create_future()
+
+# Class answering the questions with a bounded queue, a fixed pool of workers and request coalescing
+class QueryService:
+    def __init__(self, workers=service_workers, queue_size=service_queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue = None
+        self._tasks = []
+        self._in_flight = {}  # Normalized question -> answer in flight
+        self._pending = 0  # Questions and summary folds accepted and not done yet (waiting or running)
+        # Chroma, SQLite and the embedding request are blocking, they run in these threads
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+        self.stats = {'requests': 0, 'coalesced': 0, 'rejected': 0, 'model_calls': 0, 'cache_answers': 0, 'errors': 0,
+                      'summaries': 0}
+
+    # Function to start the workers, inside the event loop of the service
+    async def start(self):
+        # The admission is counted in submit(), a burst arriving before the workers take their first
+        # question still gets `workers + queue_size` places
+        self._queue = asyncio.Queue()
+        # Build the chain in the thread pool without waiting for it: the first model client loads openai
+        # and its schemas, imports that would otherwise block the event loop during the first answers
+        self._executor.submit(warm_up)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    # Function to stop the workers and the thread pool
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    # Function to queue a job for the workers, raises ServiceBusy when the workers and the queue are full
+    def _admit(self, key, job):
+        if self._pending >= self.workers + self.queue_size:
+            self.stats['rejected'] += 1
+            tracing.count('query_service_requests_total', outcome='rejected')
+            raise ServiceBusy(f"{self.queue_size} requests already waiting")
+        self._pending += 1
+        self._queue.put_nowait((key, job))
+        tracing.count('query_service_requests_total', outcome='queued')
+
+    # Function to get the answer in flight for a question, queuing it when nobody asked it yet
+    # Only the same question with the same history is coalesced. Raises ServiceBusy when the queue is full
+    def submit(self, question, history=""):
+        self.stats['requests'] += 1
+        key = (normalize_question(question), history)
+        answer = self._in_flight.get(key)
+        if answer is not None:
+            self.stats['coalesced'] += 1
+            tracing.count('query_service_requests_total', outcome='coalesced')
+            return answer
+        answer = InFlightAnswer(question, history)
+        self._admit(key, answer)
+        self._in_flight[key] = answer
+        return answer
+
+    # Function to run a blocking function in the thread pool, in the trace of the caller
+    async def _run_blocking(self, function, *args):
+        call = functools.partial(contextvars.copy_context().run, function, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    # Loop run by every worker: take a question (or a summary fold) from the queue and answer it
+    async def _worker(self):
+        while True:
+            key, job = await self._queue.get()
+            try:
+                tracing.record('query_service.queue_wait', time.perf_counter() - job.queued_at)
+                if isinstance(job, PendingSummary):
+                    await self._fold(job)
+                else:
+                    await self._answer(job)
+            finally:
+                # Later callers of the same question start a new answer (or get it from the cache)
+                if key is not None:
+                    self._in_flight.pop(key, None)
+                self._pending -= 1
+                self._queue.task_done()
+
+    # Function to answer a question: retrieval in the thread pool, then the model streaming its tokens
+    async def _answer(self, answer):
+        from openai import OpenAIError  # Deferred import, openai is loaded with the chat model on the first question
+        question = answer.question
+        with tracing.span('chat.answer', streaming=True) as answer_span:
+            try:
+                query_embedding, cached_answer, input_data = await self._run_blocking(prepare_input, question,
+                                                                                      answer.history)
+                if cached_answer is not None:
+                    self.stats['cache_answers'] += 1
+                    await answer.publish(cached_answer)
+                    await answer.finish()
+                    return
+                self.stats['model_calls'] += 1
+                # The chain is built in the thread pool, the event loop never waits for the registry lock
+                qa_chain = await self._run_blocking(resources.get_qa_chain)
+                with tracing.span('chat.llm', model=resources.llm_model) as span:
+                    start_time = time.perf_counter()
+                    async for chunk in qa_chain.astream(input_data):
+                        text = chunk if isinstance(chunk, str) else chunk.content
+                        if text:
+                            if not answer.parts:
+                                span.set('first_token_ms', round((time.perf_counter() - start_time) * 1000, 3))
+                            await answer.publish(text)
+                    record_tokens(span, input_data, "".join(answer.parts))
+                await self._run_blocking(resources.get_chat_cache().put_answer, question, query_embedding,
+                                         "".join(answer.parts), answer.history)
+                await answer.finish()
+            except OpenAIError as e:
+                # Handle any errors that occur during the API call, the message is the end of the answer
+                self.stats['errors'] += 1
+                answer_span.set('error', type(e).__name__)
+                await answer.finish(error=f"Error: {e}")
+            except Exception as e:
+                self.stats['errors'] += 1
+                answer_span.set('error', type(e).__name__)
+                await answer.finish(error=f"Error: {type(e).__name__}: {e}")
+
+    # Function to fold some turns of a conversation into its running summary, returns the new summary
+    # A fold is a model call too: it waits in the same queue as the questions and takes a worker, so
+    # the model never gets more than `workers` calls at once. Raises ServiceBusy when the queue is full
+    async def summarize(self, summary, turns):
+        job = PendingSummary(summary, turns)
+        self._admit(None, job)
+        self.stats['summaries'] += 1
+        return await job.result
+
+    # Function to run a queued summary fold and set its result (or its error)
+    async def _fold(self, job):
+        if job.result.done():
+            return  # The client went away while the fold was waiting
+        try:
+            with tracing.span('chat.summary', turns=len(job.turns)):
+                summary_chain = await self._run_blocking(resources.get_summary_chain)
+                message = await summary_chain.ainvoke({
+                    "summary": job.summary or "None yet.",
+                    "turns": format_turns(job.turns, model_name=resources.llm_model),
+                    "max_words": resources.history_summary_tokens * 3 // 4,
+                })
+            if not job.result.done():
+                job.result.set_result(message.content.strip())
+        except Exception as e:
+            if not job.result.done():
+                job.result.set_exception(e)
+
+    # Function to get the counters of the service
+    def status(self):
+        return {**self.stats, 'workers': self.workers, 'queue_size': self.queue_size,
+                'queued': self._queue.qsize() if self._queue is not None else 0, 'in_flight': len(self._in_flight)}
+
+# -------------- HTTP API --------------
+# POST /answer {"question": "...", "stream": true, "history": {"summary": "...", "turns": [...]}} -> the
+# answer as plain text, streamed token by token with "stream", or {"answer": "..."}; 503 with Retry-After
+# when the queue is full
+async def handle_answer(request):
+    service = request.app['service']
+    try:
+        body = await request.json()
+        question = body['question'].strip()
+        history = history_text(body.get('history'))
+    except (ValueError, KeyError, AttributeError, TypeError):
+        return web.json_response({'error': "Expected a JSON body with a 'question'"}, status=400)
+    if not question:
+        return web.json_response({'error': "Empty question"}, status=400)
+    try:
+        answer = service.submit(question, history)
+    except ServiceBusy as e:
+        return web.json_response({'error': f"Service busy: {e}"}, status=503,
+                                 headers={'Retry-After': str(retry_after_seconds)})
+    if not body.get('stream'):
+        return web.json_response({'answer': await answer.result(), 'failed': answer.failed})
+    response = web.StreamResponse(headers={'Content-Type': 'text/plain; charset=utf-8'})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    async for text in answer.stream():
+        await response.write(text.encode('utf-8'))
+    await response.write_eof()
+    return response
+
+# POST /summarize {"summary": "...", "turns": [...]} -> {"summary": "..."}, the summary with the turns folded in;
+# 503 with Retry-After when the queue is full (the app folds the turns again after the next answer)
+async def handle_summarize(request):
+    from openai import OpenAIError  # Deferred import, openai is loaded with the chat model
+    try:
+        body = await request.json()
+        summary, turns = body.get('summary') or "", body['turns']
+        if not isinstance(turns, list) or not all(isinstance(turn, dict) and 'content' in turn for turn in turns):
+            raise TypeError
+    except (ValueError, KeyError, AttributeError, TypeError):
+        return web.json_response({'error': "Expected a JSON body with the 'turns' to summarize"}, status=400)
+    try:
+        return web.json_response({'summary': await request.app['service'].summarize(summary, turns)})
+    except ServiceBusy as e:
+        return web.json_response({'error': f"Service busy: {e}"}, status=503,
+                                 headers={'Retry-After': str(retry_after_seconds)})
+    except OpenAIError as e:
+        return web.json_response({'error': str(e)}, status=502)
+
+# GET /stats -> counters of the service and of the chat cache
+async def handle_stats(request):
+    service = request.app['service']
+    stats = {'service': service.status(), 'index_version': await service._run_blocking(resources.refresh_index_version)}
+    if resources.is_loaded(resources.get_chat_cache):
+        stats['cache'] = resources.get_chat_cache().stats()
+    return web.json_response(stats)
+
+# GET /metrics -> Prometheus snapshot of the spans and counters (empty unless TRACING=1)
+async def handle_metrics(request):
+    return web.Response(text=tracing.prometheus_text(), content_type='text/plain')
+
+# GET /health
+async def handle_health(request):
+    return web.json_response({'status': 'ok'})
+
+# Function to build the web application of a service
+def create_app(service):
+    application = web.Application()
+    application['service'] = service
+
+    async def on_startup(application):
+        await service.start()
+
+    async def on_cleanup(application):
+        await service.stop()
+
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    application.add_routes([
+        web.post('/answer', handle_answer),
+        web.post('/summarize', handle_summarize),
+        web.get('/stats', handle_stats),
+        web.get('/metrics', handle_metrics),
+        web.get('/health', handle_health),
+    ])
+    return application
+
+# Function to start the service in a background thread of this process, returns its base URL
+# Used by the app when no QUERY_SERVICE_URL is configured: every session of the process shares it
+def start_in_background(host='127.0.0.1', port=0, workers=service_workers, queue_size=service_queue_size):
+    # The socket is bound here, so the port is known (port 0 picks a free one) before the thread starts
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    started = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_app(QueryService(workers, queue_size)), access_log=None)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.SockSite(runner, sock).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, name='query-service', daemon=True).start()
+    started.wait()
+    return f"http://{host}:{sock.getsockname()[1]}"
+
+# Function to parse the service configuration
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the answers of the chat over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=service_workers, help="Questions answered at the same time")
+    parser.add_argument('--queue-size', type=int, default=service_queue_size, help="Questions waiting before answering 503")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    tracing.configure(service='query-service')
+    web.run_app(create_app(QueryService(args.workers, args.queue_size)), host=args.host, port=args.port,
+                access_log=None)
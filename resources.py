@@ -0,0 +1,242 @@
+import os  # Import the OS module to interact with the operating system
+import time  # Import time module to measure how long each resource takes to build
+import threading  # Import threading to build each resource only once across Streamlit sessions
+import functools  # Import functools to keep the name of the wrapped factories
+from dotenv import load_dotenv  # Import function to load environment variables from a .env file
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# -------------- CONFIGURATION --------------
+# Retrieve the OpenAI API key from environment variables
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+persist_directory = './chroma_db'  # Directory where the Chroma database will be stored
+vector_index_directory = './vector_index'  # Directory of the memory-mapped index exported from Chroma
+# 'index' answers from the exported index, 'chroma' from the Chroma database, 'auto' from the index when it exists
+vector_store = os.getenv('VECTOR_STORE', 'auto')
+vector_index_nprobe = int(os.getenv('VECTOR_INDEX_NPROBE', '8'))  # IVF lists scanned per question
+lexical_index_path = './lexical_index.sqlite3'  # BM25 index of the same chunks, written by update_embeddings.py
+# Versions of the three indexes built by index_versions.py; when one is active it replaces the paths above
+index_versions_directory = os.getenv('INDEX_VERSIONS_DIRECTORY', './index_versions')
+index_version_check_seconds = 2.0  # The pointer to the active version is read at most this often
+llm_model = "gpt-4"  # Chat model used to answer the questions
+llm_max_tokens = 1024  # Maximum number of tokens of every answer
+llm_max_connections = int(os.getenv('LLM_MAX_CONNECTIONS', '16'))  # Keep-alive connections of the chat model client
+embedding_model = 'text-embedding-ada-002'  # Embedding model used for the documents and the questions
+
+cache_path = './chat_cache.sqlite3'  # SQLite file storing cached query embeddings and answers
+cache_similarity_threshold = float(os.getenv('CACHE_SIMILARITY_THRESHOLD', '0.97'))  # Cosine similarity needed to reuse an answer
+cache_ttl_seconds = 7 * 24 * 3600  # Cached entries expire after one week
+
+# URL of the query service answering the questions (query_service.py); when empty the app starts it in its own process
+query_service_url = os.getenv('QUERY_SERVICE_URL', '')
+query_service_timeout = 120  # Seconds to wait for the next token of an answer
+
+history_recent_turns = int(os.getenv('HISTORY_TURNS', '3'))  # Last question/answer pairs of a session sent verbatim
+history_max_tokens = int(os.getenv('HISTORY_MAX_TOKENS', '1200'))  # Ceiling of the history sent with every question
+history_summary_tokens = 300  # Ceiling of the running summary of the older turns
+
+# Define the prompt template for the assistant
+prompt_template = """
+You are a knowledgeable and helpful assistant designed to support employees of Oakdene Hollins by providing insights and answers based on the company's extensive database of reports and insights. Your goal is to offer clear, detailed, and contextually accurate responses. Ensure your answers are relevant to the employee's role and needs, and include practical steps or recommendations when appropriate.
+
+Conversation so far: {history}
+
+Context: {context}
+
+Employee Question: {input}
+
+Answer:
+"""
+
+# -------------- REGISTRY --------------
+# Streamlit re-executes app.py on every interaction, but this module is imported only once per
+# process, so the resources stored here are built on first use and shared by every session.
+PROCESS_START = time.perf_counter()  # Moment the process imported the registry
+_instances = {}  # Built resources by name
+_init_times = {}  # Seconds spent building each resource
+_lock = threading.RLock()  # Re-entrant: a factory may request other resources
+_index_version = None  # Active index version the stores were opened from (None: the paths of the configuration)
+_index_checked_at = None  # Last time the pointer to the active version was read
+_fingerprint = None  # (version, fingerprint of the collection, time it was computed), computed again at most
+# every index_version_check_seconds
+
+# Decorator turning a factory into a lazy, process-wide shared resource
+def shared_resource(factory):
+    name = factory.__name__
+
+    @functools.wraps(factory)
+    def getter():
+        try:
+            return _instances[name]
+        except KeyError:
+            pass
+        with _lock:
+            if name not in _instances:
+                start_time = time.perf_counter()
+                _instances[name] = factory()
+                _init_times[name] = time.perf_counter() - start_time
+            return _instances[name]
+
+    return getter
+
+# Function to get the time spent building each resource, in creation order
+def resource_timings():
+    return dict(_init_times)
+
+# Function to check whether a resource was already built, without building it
+def is_loaded(getter):
+    return getter.__name__ in _instances
+
+# Function to drop built resources, they are built again on their next use
+# Callers still holding the old objects keep using them until they are done
+def reset(*getters):
+    with _lock:
+        for getter in getters:
+            _instances.pop(getter.__name__, None)
+            _init_times.pop(getter.__name__, None)
+
+# -------------- INDEX VERSIONS --------------
+# Function to follow the active index version (blue-green builds of index_versions.py), returns its name
+# When the pointer changed, the stores are opened again from the new version on their next use: the
+# next question reads the new indexes, without restarting the app
+def refresh_index_version():
+    global _index_version, _index_checked_at
+    now = time.monotonic()
+    if _index_checked_at is not None and now - _index_checked_at < index_version_check_seconds:
+        return _index_version
+    from index_versions import current_version  # Import the pointer of the index versions
+    version = current_version(index_versions_directory)
+    with _lock:
+        _index_checked_at = now
+        if version != _index_version:
+            _index_version = version
+            reset(get_vectordb, get_lexical_index)
+    return version
+
+# Function to get the paths of the indexes to read: the active version, or the configured ones
+def index_paths():
+    version = refresh_index_version()
+    if version is None:
+        return {'persist_directory': persist_directory, 'lexical_index_path': lexical_index_path,
+                'vector_index_directory': vector_index_directory}
+    from index_versions import version_paths  # Import the layout of a version
+    return version_paths(index_versions_directory, version)
+
+# -------------- RESOURCES --------------
+# Heavy imports are done inside the factories so they are only paid on the first question
+
+# OpenAI embeddings function used for the documents and the questions
+@shared_resource
+def get_embeddings():
+    from langchain_openai import OpenAIEmbeddings  # Import OpenAI embeddings function
+    return OpenAIEmbeddings(model=embedding_model, api_key=OPENAI_API_KEY)
+
+# Function to check whether the questions are answered from the exported index instead of Chroma
+def uses_vector_index():
+    from vector_index import index_exists  # Import the check of an exported index
+    return vector_store == 'index' or (vector_store == 'auto' and index_exists(index_paths()['vector_index_directory']))
+
+# Vector store: the memory-mapped index exported with vector_index.py (fast cold start, nothing loaded
+# in memory), or the Chroma database opened from the persistence directory
+@shared_resource
+def get_vectordb():
+    paths = index_paths()
+    if uses_vector_index():
+        from vector_index import VectorIndex  # Import the memory-mapped vector index
+        return VectorIndex(paths['vector_index_directory'], nprobe=vector_index_nprobe)
+    from langchain_chroma import Chroma  # Import Chroma for the vector database
+    return Chroma(persist_directory=paths['persist_directory'], embedding_function=get_embeddings())
+
+# BM25 index of the chunks, opened read-only; None when update_embeddings.py has not built it yet
+@shared_resource
+def get_lexical_index():
+    from lexical_index import LexicalIndex, lexical_index_exists  # Import the BM25 index
+    path = index_paths()['lexical_index_path']
+    if not lexical_index_exists(path):
+        return None
+    return LexicalIndex(path, read_only=True)
+
+# Chat model used to answer the questions
+@shared_resource
+def get_llm():
+    import httpx  # Import httpx to size the connection pool of the asynchronous client
+    from langchain_openai.chat_models import ChatOpenAI  # Import the chat model from LangChain and OpenAI
+    # The query service calls the model from its event loop, every worker shares these connections
+    limits = httpx.Limits(max_connections=llm_max_connections, max_keepalive_connections=llm_max_connections)
+    return ChatOpenAI(model=llm_model, max_tokens=llm_max_tokens, api_key=OPENAI_API_KEY,
+                      http_async_client=httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(600.0, connect=10.0)))
+
+# Sequence of runnables with the prompt first and the language model last
+@shared_resource
+def get_qa_chain():
+    from langchain.prompts import PromptTemplate  # Import prompt template
+    from langchain_core.runnables import RunnableSequence  # Import runnable sequence
+    prompt = PromptTemplate(input_variables=["input", "context", "history"], template=prompt_template)
+    return RunnableSequence(first=prompt, last=get_llm())
+
+# Sequence folding the older turns of a conversation into its running summary
+@shared_resource
+def get_summary_chain():
+    from langchain.prompts import PromptTemplate  # Import prompt template
+    from langchain_core.runnables import RunnableSequence  # Import runnable sequence
+    from chat_history import summary_template  # Import the prompt of the summary
+    prompt = PromptTemplate(input_variables=["summary", "turns", "max_words"], template=summary_template)
+    return RunnableSequence(first=prompt, last=get_llm().bind(max_tokens=history_summary_tokens))
+
+# Two-level cache: exact question -> embedding, and similar question -> answer
+@shared_resource
+def get_chat_cache():
+    from chat_cache import ChatCache  # Import the two-level chat cache
+    return ChatCache(cache_path, similarity_threshold=cache_similarity_threshold, ttl_seconds=cache_ttl_seconds)
+
+# Base URL of the query service: the configured one, or a service started in a thread of this process
+@shared_resource
+def get_query_service():
+    if query_service_url:
+        return query_service_url.rstrip('/')
+    from query_service import start_in_background  # Import the embedded query service
+    return start_in_background()
+
+# HTTP client of the app, its keep-alive connections to the query service are shared by every session
+@shared_resource
+def get_http_session():
+    import requests  # Import requests to call the query service
+    from requests.adapters import HTTPAdapter  # Import the adapter to size the connection pool
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+    return session
+
+# Threads of the app updating the conversation summaries after the answers
+@shared_resource
+def get_history_executor():
+    from concurrent.futures import ThreadPoolExecutor  # Import the thread pool of the summary updates
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix='history')
+
+# Function to get a fingerprint of the Chroma collection, it changes whenever the index is updated
+# An index exported again in place (or exported for the first time with VECTOR_STORE=auto) is opened again
+# Checked at most every index_version_check_seconds, like the pointer to the active version
+def collection_fingerprint():
+    global _fingerprint
+    from chat_cache import chroma_fingerprint  # Import the Chroma fingerprint helper
+    from vector_index import VectorIndex  # Import the memory-mapped vector index
+    version = refresh_index_version()
+    now = time.monotonic()
+    cached = _fingerprint
+    if cached is not None and cached[0] == version and now - cached[2] < index_version_check_seconds:
+        return cached[1]
+    vectordb = get_vectordb()
+    if isinstance(vectordb, VectorIndex) and vectordb.is_stale():
+        reset(get_vectordb)
+        vectordb = get_vectordb()
+    elif not isinstance(vectordb, VectorIndex) and vector_store == 'auto' and uses_vector_index():
+        reset(get_vectordb)
+        vectordb = get_vectordb()
+    prefix = f"{version}:" if version is not None else ""
+    if isinstance(vectordb, VectorIndex):
+        fingerprint = prefix + vectordb.fingerprint()
+    else:
+        fingerprint = prefix + chroma_fingerprint(index_paths()['persist_directory'])
+    _fingerprint = (version, fingerprint, now)
+    return fingerprint
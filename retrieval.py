@@ -0,0 +1,104 @@
+import os  # Import the OS module to work with file paths
+import functools  # Import functools to cache the tokenizer between calls
+import tiktoken  # Import tiktoken to measure the context with the model's real tokenizer
+
+# -------------- RETRIEVAL CONFIGURATION --------------
+DEFAULT_K = 6  # Number of chunks passed to the model
+DEFAULT_FETCH_K = 20  # Number of candidates fetched before MMR re-ranking
+DEFAULT_MMR_LAMBDA = 0.5  # 1 = pure relevance, 0 = maximum diversity
+DEFAULT_CONTEXT_TOKENS = 3000  # Fixed token budget for the retrieved context
+MIN_PARTIAL_TOKENS = 64  # Smallest truncated chunk worth adding to fill the budget
+RRF_RANK_CONSTANT = 60  # Reciprocal rank fusion constant, it damps the weight of the first ranks of each list
+CHUNK_SEPARATOR = "\n\n---\n\n"  # Separator placed between chunks in the context
+
+# -------------- TOKENIZER --------------
+# Function to get the tokenizer of a model (cached, building it is expensive)
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # Unknown model names fall back to the encoding used by gpt-4 and ada-002
+        return tiktoken.get_encoding('cl100k_base')
+
+# Function to count the tokens of a text for a given model
+def count_tokens(text, model_name='gpt-4'):
+    return len(get_encoding(model_name).encode(text))
+
+# -------------- RETRIEVAL --------------
+# Function to embed the latest question with the same model used for the documents
+def embed_question(embeddings, question):
+    return embeddings.embed_query(question)
+
+# Function to get the top-k chunks for a query embedding, optionally diversified with MMR
+def search_chunks(vectordb, query_embedding, k=DEFAULT_K, use_mmr=False, fetch_k=DEFAULT_FETCH_K, lambda_mult=DEFAULT_MMR_LAMBDA):
+    if use_mmr:
+        return vectordb.max_marginal_relevance_search_by_vector(
+            query_embedding, k=k, fetch_k=max(fetch_k, k), lambda_mult=lambda_mult
+        )
+    return vectordb.similarity_search_by_vector(query_embedding, k=k)
+
+# Function to merge several rankings of chunks with reciprocal rank fusion: every chunk scores
+# 1 / (constant + rank) in each list it appears in, so only the ranks matter and not the scales
+# of the scores (cosine similarity and BM25 are not comparable)
+def reciprocal_rank_fusion(rankings, k=DEFAULT_K, rank_constant=RRF_RANK_CONSTANT):
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            # The text identifies a chunk in every store, the duplicates were collapsed at ingest
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rank_constant + rank)
+            docs.setdefault(key, doc)
+    # Stable sort: on a tie the chunk of the first ranking comes first
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+# Function to get the top-k chunks for a question from the vector store and the BM25 index, fused by rank
+def hybrid_search(vectordb, lexical_index, question, query_embedding, k=DEFAULT_K, use_mmr=False,
+                  fetch_k=DEFAULT_FETCH_K, lambda_mult=DEFAULT_MMR_LAMBDA):
+    dense_docs = search_chunks(vectordb, query_embedding, k=k, use_mmr=use_mmr, fetch_k=fetch_k, lambda_mult=lambda_mult)
+    if lexical_index is None:
+        return dense_docs
+    return reciprocal_rank_fusion([dense_docs, lexical_index.search(question, k=k)], k=k)
+
+# -------------- CONTEXT BUILDER --------------
+# Function to format a chunk with a short reference to its source
+def format_chunk(doc):
+    metadata = doc.metadata
+    # Articles extracted from HTML are cited by title, section and URL, PDFs by file and page
+    title = metadata.get('title') or os.path.basename(metadata.get('source', 'unknown'))
+    parts = [title]
+    # The heading path usually starts with the <h1> title, shown once
+    heading = metadata.get('heading', '')
+    if heading.startswith(title):
+        heading = heading[len(title):].lstrip(' >')
+    if heading:
+        parts.append(heading)
+    if isinstance(metadata.get('page'), int):
+        parts.append(f"page {metadata['page'] + 1}")
+    if metadata.get('url'):
+        parts.append(metadata['url'])
+    # A deduplicated chunk appears in several documents
+    if metadata.get('source_count', 1) > 1:
+        parts.append(f"also in {metadata['source_count'] - 1} other documents")
+    return f"[{', '.join(parts)}]\n{doc.page_content.strip()}"
+
+# Function to pack the retrieved chunks (in ranking order) into a fixed token budget
+def build_context(docs, max_tokens=DEFAULT_CONTEXT_TOKENS, model_name='gpt-4'):
+    encoding = get_encoding(model_name)
+    separator_tokens = len(encoding.encode(CHUNK_SEPARATOR))
+    parts = []
+    used_tokens = 0
+    for doc in docs:
+        tokens = encoding.encode(format_chunk(doc))
+        cost = len(tokens) + (separator_tokens if parts else 0)
+        if used_tokens + cost <= max_tokens:
+            parts.append(encoding.decode(tokens))
+            used_tokens += cost
+            continue
+        # The chunk does not fit: truncate it to fill what is left of the budget and stop
+        remaining = max_tokens - used_tokens - (separator_tokens if parts else 0)
+        if remaining >= MIN_PARTIAL_TOKENS:
+            parts.append(encoding.decode(tokens[:remaining]))
+            used_tokens += remaining + (separator_tokens if len(parts) > 1 else 0)
+        break
+    return CHUNK_SEPARATOR.join(parts), used_tokens
@@ -1,20 +1,141 @@
+import os  # Import os module to interact with the operating system
+import time  # Import time module to expire the cached robots.txt files
+import asyncio  # Import asyncio to fetch every robots.txt only once
+from urllib.parse import urlsplit  # Import urlsplit to get the robots.txt URL of a page
+from urllib.robotparser import RobotFileParser  # Import the standard robots.txt parser
 import requests  # Import requests module for making HTTP requests
 from dotenv import load_dotenv  # Import function to load environment variables from a .env file
-import os  # Import os module to interact with the operating system
+from crawler import fetch, host_of, RETRY_ERRORS  # Import the shared asynchronous crawler helpers
+from frontier import CrawlError  # Import the crawl error, an unreachable robots.txt is retried later
 
 # Load environment variables from a .env file
 load_dotenv()
 
-# Function to check the robots.txt file of a given URL
+ROBOTS_USER_AGENT = os.getenv('ROBOTS_USER_AGENT', '*')  # User agent token matched against the robots.txt groups
+ROBOTS_TTL = 24 * 3600  # Seconds a robots.txt is trusted before fetching it again
+ROBOTS_ERROR_TTL = 300  # Seconds an unreachable robots.txt blocks its host before retrying
+
+# Function to get the robots.txt URL of the host of a URL
+def robots_url(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/robots.txt"
+
+# Function to build the rules from a robots.txt answer (RFC 9309):
+# 2xx is parsed, 4xx means no restrictions, 5xx or no answer means nothing may be crawled
+def parse_robots(status, text, url):
+    rules = RobotFileParser(url)
+    if status is not None and 200 <= status < 300:
+        rules.parse(text.splitlines())
+    elif status is not None and 400 <= status < 500:
+        rules.allow_all = True
+    else:
+        rules.disallow_all = True
+    return rules
+
+# -------------- POLICY --------------
+# Class fetching, parsing and caching (with a TTL) the robots.txt of every host, answering
+# allow/deny per URL and the Crawl-delay / Request-rate the crawlers must respect
+class RobotsPolicy:
+    def __init__(self, user_agent=ROBOTS_USER_AGENT, ttl_seconds=ROBOTS_TTL, error_ttl_seconds=ROBOTS_ERROR_TTL):
+        self.user_agent = user_agent
+        self.ttl_seconds = ttl_seconds
+        self.error_ttl_seconds = error_ttl_seconds
+        self._rules = {}  # robots.txt URL -> (rules, expires_at, unreachable)
+        self._locks = {}  # robots.txt URL -> lock, concurrent requests for a new host wait for one fetch
+        self.stats = {'fetched': 0, 'allowed': 0, 'disallowed': 0, 'unreachable': 0}
+
+    # Function to store the rules of a host
+    def store(self, url, status, text=''):
+        unreachable = status is None or status >= 500
+        ttl = self.error_ttl_seconds if unreachable else self.ttl_seconds
+        rules = parse_robots(status, text, robots_url(url))
+        self._rules[robots_url(url)] = (rules, time.monotonic() + ttl, unreachable)
+        return rules
+
+    # Function to get the cached rules of the host of a URL, None if missing or expired
+    def cached_rules(self, url):
+        entry = self._rules.get(robots_url(url))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    # Function to get the rules of the host of a URL, fetching its robots.txt with the crawler when needed
+    async def rules(self, session, scheduler, url):
+        key = robots_url(url)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            rules = self.cached_rules(url)
+            if rules is None:
+                try:
+                    status, _, body = await fetch(session, scheduler, key)
+                    text = body.decode('utf-8', errors='replace')
+                except RETRY_ERRORS:
+                    status, text = None, ''
+                rules = self.store(url, status, text)
+                self.stats['fetched'] += 1
+                # Pace the host at the rate its robots.txt asks for
+                delay = self.crawl_delay(url)
+                if delay is not None:
+                    scheduler.set_host_delay(host_of(url), delay)
+        return rules
+
+    # Function to check if the cached rules of the host of a URL come from an unreachable robots.txt
+    def unreachable(self, url):
+        entry = self._rules.get(robots_url(url))
+        return entry is not None and entry[2]
+
+    # Function to check if a URL may be crawled, fetching the robots.txt of its host the first time
+    # An unreachable robots.txt (no answer or 5xx) raises a retryable CrawlError: the URL is blocked
+    # for now, not disallowed for good
+    async def allowed(self, session, scheduler, url):
+        rules = await self.rules(session, scheduler, url)
+        if self.unreachable(url):
+            self.stats['unreachable'] += 1
+            raise CrawlError(f"robots.txt unreachable: {robots_url(url)}", retryable=True)
+        allowed = rules.can_fetch(self.user_agent, url)
+        self.stats['allowed' if allowed else 'disallowed'] += 1
+        return allowed
+
+    # Function to get the seconds between two requests asked by the robots.txt of the host of a URL
+    # (the largest of Crawl-delay and the period of Request-rate), None when it sets no limit
+    def crawl_delay(self, url):
+        rules = self.cached_rules(url)
+        if rules is None:
+            return None
+        delays = []
+        crawl_delay = rules.crawl_delay(self.user_agent)
+        if crawl_delay is not None:
+            delays.append(float(crawl_delay))
+        request_rate = rules.request_rate(self.user_agent)
+        if request_rate is not None and request_rate.requests:
+            delays.append(request_rate.seconds / request_rate.requests)
+        return max(delays) if delays else None
+
+    # Function to describe the decisions of the current run
+    def summary(self):
+        return (f"robots.txt: {self.stats['fetched']} fetched, {self.stats['allowed']} URLs allowed, "
+                f"{self.stats['disallowed']} disallowed, {self.stats['unreachable']} postponed (robots.txt unreachable)")
+
+# Function to check the robots.txt file of a given URL: print it with the rules that apply to the crawlers
 def check_robots_txt(url):
-    robots_url = f"{url}/robots.txt"  # Construct the URL for robots.txt
-    response = requests.get(robots_url)  # Send a GET request to the robots.txt URL
-    if response.status_code == 200:  # Check if the request was successful
-        print(response.text)  # Print the content of robots.txt
+    try:
+        response = requests.get(robots_url(url), timeout=30)  # Send a GET request to the robots.txt URL
+        status, text = response.status_code, response.text
+    except requests.RequestException:
+        status, text = None, ''
+    if status == 200:  # Check if the request was successful
+        print(text)  # Print the content of robots.txt
     else:
         print("Could not access the robots.txt file")  # Print an error message if the request failed
+    policy = RobotsPolicy()
+    rules = policy.store(url, status, text)
+    decision = 'allowed' if rules.can_fetch(policy.user_agent, url) else 'disallowed'
+    print(f"User agent '{policy.user_agent}': {url} is {decision}, "
+          f"delay between requests: {policy.crawl_delay(url) or 'not set'}")
+    return policy
 
-# Get the domain URL from environment variables
-domain = os.getenv('URL_DOMAIN')
-# Check the robots.txt file of the domain
-check_robots_txt(domain)
+if __name__ == '__main__':
+    # Get the domain URL from environment variables
+    domain = os.getenv('URL_DOMAIN')
+    # Check the robots.txt file of the domain
+    check_robots_txt(domain)
@@ -0,0 +1,172 @@
+import os  # Import the OS module to resolve the child sitemaps of a local index
+import re  # Import the regular expression module to fix invalid entity references
+import gzip  # Import gzip to read compressed sitemaps (.xml.gz)
+import functools  # Import functools to cache the parsed lastmod dates
+import tempfile  # Import tempfile to spool the remote sitemaps to disk
+from datetime import datetime, date, timezone  # Import datetime to compare the lastmod dates
+from urllib.parse import urljoin, urlsplit  # Import URL helpers to resolve and filter the sitemap URLs
+from lxml import etree  # Import lxml for the incremental XML parsing
+
+GZIP_MAGIC = b'\x1f\x8b'  # First bytes of every gzip file
+BLOCK_SIZE = 1024 * 1024  # Bytes read from the sitemap at a time
+INVALID_ENTITY = re.compile(rb'&(?!(?:amp|lt|gt|quot|apos|#\d+|#x[0-9a-fA-F]+);)')  # '&' not starting an entity
+MAX_ENTITY_SIZE = 16  # Longest entity reference checked at the end of a block ('&#x10FFFF;' and shorter)
+
+# -------------- STREAMS --------------
+# Class cleaning a sitemap on the fly, one block at a time: drops any text before the first tag
+# (sitemaps saved from a browser start with a notice) and escapes invalid entity references
+class _CleanedXmlStream:
+    def __init__(self, stream):
+        self._stream = stream
+        self._started = False
+        self._tail = b''  # End of the previous block held back because it may be a split entity
+
+    # Function called by the XML parser, returns the next cleaned block (the size is only a hint)
+    def read(self, size=-1):
+        while True:
+            data = self._stream.read(BLOCK_SIZE)
+            block = self._tail + data
+            self._tail = b''
+            if not block:
+                return b''
+            # Hold back an '&' close to the end of the block so no entity is split between two blocks
+            # (a minified sitemap is a single line, cutting at a line end would read the whole file)
+            if data:
+                amp = block.rfind(b'&', max(len(block) - MAX_ENTITY_SIZE, 0))
+                if amp != -1 and b';' not in block[amp:]:
+                    block, self._tail = block[:amp], block[amp:]
+            if not self._started:
+                start = block.find(b'<')
+                if start == -1:
+                    continue
+                block = block[start:]
+                self._started = True
+            if not block:
+                continue
+            return INVALID_ENTITY.sub(b'&amp;', block)
+
+# Function to open a sitemap (local path or http(s) URL) as a binary stream, decompressing gzip
+def open_sitemap(source, timeout=60):
+    if urlsplit(source).scheme in ('http', 'https'):
+        import requests  # Import requests module only when a remote sitemap is read
+        # Spool the body to a temporary file in blocks: constant memory, and the parser gets a real file
+        stream = tempfile.TemporaryFile()
+        with requests.get(source, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for block in response.iter_content(BLOCK_SIZE):
+                stream.write(block)
+        stream.seek(0)
+    else:
+        stream = open(source, 'rb')
+    # A .xml.gz file is still compressed after the transfer decoding
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+    return stream
+
+# -------------- PARSING --------------
+# Function to turn a lastmod value (W3C datetime, date or datetime object) into an aware UTC datetime
+# Cached: a large sitemap repeats the same few dates many times
+@functools.lru_cache(maxsize=4096)
+def parse_lastmod(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    else:
+        text = value.strip().replace('Z', '+00:00')
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            try:
+                parsed = datetime.strptime(text[:10], '%Y-%m-%d')
+            except ValueError:
+                return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+# Function to resolve the location of a child sitemap listed in an index
+def _child_source(parent, loc):
+    if urlsplit(loc).scheme in ('http', 'https') or urlsplit(parent).scheme in ('http', 'https'):
+        return urljoin(parent, loc)
+    return os.path.join(os.path.dirname(parent), loc)
+
+# Generator streaming the (loc, lastmod) entries of a sitemap with constant memory, lastmod is the raw text
+# <sitemapindex> files are followed recursively; a child sitemap whose lastmod is older
+# than `lastmod_since` is not read at all
+def iter_sitemap(source, lastmod_since=None, follow_index=True, _depth=0):
+    since = parse_lastmod(lastmod_since)
+    children = []
+    with open_sitemap(source) as raw_stream:
+        stream = _CleanedXmlStream(raw_stream)
+        for _, element in etree.iterparse(stream, events=('end',), tag=('{*}url', '{*}sitemap'), recover=True,
+                                          huge_tree=True, remove_comments=True, remove_pis=True):
+            # A plain loop over the children is much faster than findtext() on millions of entries
+            loc = lastmod = None
+            for child in element:
+                if child.tag.endswith('loc'):
+                    loc = (child.text or '').strip()
+                elif child.tag.endswith('lastmod'):
+                    lastmod = child.text
+            is_index_entry = element.tag.endswith('sitemap')
+            # Free the parsed elements, the tree never holds more than one entry
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if not loc:
+                continue
+            if since is not None and lastmod:
+                modified = parse_lastmod(lastmod.strip())
+                if modified is not None and modified < since:
+                    continue
+            if is_index_entry:
+                children.append(loc)
+            else:
+                yield loc, lastmod
+    # The children are read after the index is closed, so only one file is open at a time
+    if follow_index and _depth < 5:
+        for loc in children:
+            yield from iter_sitemap(_child_source(source, loc), lastmod_since, follow_index, _depth + 1)
+
+# Function to get the path (and query) of an absolute URL, cheaper than urlsplit on millions of URLs
+def url_path(url):
+    scheme_end = url.find('//')
+    path_start = url.find('/', scheme_end + 2) if scheme_end != -1 else 0
+    return url[path_start:] if path_start != -1 else '/'
+
+# Function to check if a URL path starts with one of the prefixes (no prefixes keeps everything)
+def matches_prefix(url, path_prefixes):
+    if not path_prefixes:
+        return True
+    return url_path(url).startswith(tuple(path_prefixes))
+
+# Generator streaming the URLs of a sitemap filtered by path prefix and lastmod date
+def iter_sitemap_urls(source, path_prefixes=None, lastmod_since=None):
+    if isinstance(path_prefixes, str):
+        path_prefixes = [path_prefixes]
+    prefixes = tuple(path_prefixes or ())
+    for loc, _ in iter_sitemap(source, lastmod_since=lastmod_since):
+        if not prefixes or url_path(loc).startswith(prefixes):
+            yield loc
+
+# Function to extract the filtered URLs of a sitemap (shared by every crawler script)
+def get_filtered_sitemap_urls(source, path_prefixes=None, lastmod_since=None):
+    try:
+        urls = list(iter_sitemap_urls(source, path_prefixes, lastmod_since))
+        print(f"Filtered URLs extracted from sitemap: {len(urls)}")
+        return urls
+    except Exception as e:
+        print(f"Error reading the sitemap: {e}")
+        return []
+
+if __name__ == '__main__':
+    import argparse  # Import argparse to read the command line options
+    parser = argparse.ArgumentParser(description="List the URLs of a sitemap (local file or URL, .xml or .xml.gz)")
+    parser.add_argument('source')
+    parser.add_argument('--prefix', action='append', help="Keep only the URLs whose path starts with this prefix")
+    parser.add_argument('--since', help="Keep only the URLs modified since this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    for url in iter_sitemap_urls(args.source, args.prefix, args.since):
+        print(url)
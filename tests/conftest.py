@@ -0,0 +1,5 @@
+import os  # Import os to locate the repository root
+import sys  # Import sys to import the top-level modules from the tests
+
+# The modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
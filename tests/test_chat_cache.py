@@ -0,0 +1,53 @@
+from chat_cache import ChatCache, chroma_fingerprint  # Import the chat cache under test
+
+# An expired nearest answer does not hide a valid one that is also above the threshold
+def test_expired_nearest_answer_falls_back_to_the_next(tmp_path):
+    cache = ChatCache(str(tmp_path / 'cache.sqlite3'), similarity_threshold=0.9)
+    cache.put_answer("What is WEEE?", [1.0, 0.0, 0.0], "nearest")
+    cache.put_answer("What does WEEE mean?", [0.98, 0.2, 0.0], "second")
+    cache._conn.execute("UPDATE answers SET created_at = 0 WHERE answer = 'nearest'")
+    cache._conn.commit()
+    assert cache.get_answer([1.0, 0.0, 0.0]) == "second"
+    assert cache.get_answer([0.0, 0.0, 1.0]) is None
+
+# The fingerprint of a Chroma directory changes when its database file is written
+def test_chroma_fingerprint_follows_the_database_file(tmp_path):
+    assert chroma_fingerprint(str(tmp_path)) == "missing:missing"
+    (tmp_path / 'chroma.sqlite3').write_bytes(b'a')
+    first = chroma_fingerprint(str(tmp_path))
+    (tmp_path / 'chroma.sqlite3').write_bytes(b'ab')
+    assert chroma_fingerprint(str(tmp_path)) != first
+
+# An answer given after a history is only reused after the same history, whatever the similarity
+def test_answers_are_keyed_on_the_history(tmp_path):
+    cache = ChatCache(str(tmp_path / 'cache.sqlite3'), similarity_threshold=0.9)
+    cache.put_answer("And in 2020?", [1.0, 0.0], "steel answer", history="Employee: What about steel?")
+    assert cache.get_answer([1.0, 0.0], history="Employee: What about steel?") == "steel answer"
+    assert cache.get_answer([1.0, 0.0], history="Employee: What about plastics?") is None
+    assert cache.get_answer([1.0, 0.0]) is None
+
+# An answer stored without an embedding (keyword fast path) is found by its normalized question only
+def test_keyword_answers_are_found_by_the_exact_question(tmp_path):
+    cache = ChatCache(str(tmp_path / 'cache.sqlite3'))
+    cache.put_answer("OH-0001", None, "report answer")
+    assert cache.get_exact_answer("  oh-0001? ") == "report answer"
+    assert cache.get_exact_answer("OH-0001", history="Employee: hello") is None
+    assert cache.get_answer([1.0, 0.0]) is None
+    assert cache.stats()['answer_hits'] == 1
+
+# A cache written before the answers were keyed on the history starts without answers
+def test_answers_without_history_key_are_dropped(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    import sqlite3  # Import sqlite3 to write a cache with the old table
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE answers (id INTEGER PRIMARY KEY AUTOINCREMENT, question_key TEXT UNIQUE NOT NULL, "
+                 "question TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL, "
+                 "last_used REAL NOT NULL)")
+    conn.execute("INSERT INTO answers (question_key, question, embedding, answer, created_at, last_used) "
+                 "VALUES ('q', 'q', x'', 'old', 0, 0)")
+    conn.commit()
+    conn.close()
+    cache = ChatCache(path)
+    assert cache.stats()['cached_answers'] == 0
+    cache.put_answer("q", [1.0], "new")
+    assert cache.get_exact_answer("q") == "new"
@@ -0,0 +1,40 @@
+import chat_history  # Import the module to measure the history in words
+from chat_history import build_history, conversation_turns  # Import the bounded history under test
+
+# Class counting one token per word, the budget logic does not depend on the model tokenizer
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+
+# Function to build a conversation of `count` turns of `words` words each
+def make_turns(count, words):
+    return [{'role': 'user' if index % 2 == 0 else 'assistant', 'content': ' '.join([f"w{index}"] * words)}
+            for index in range(count)]
+
+# The history never goes over the budget however long the session is, the summary comes first and
+# the most recent messages fill the rest
+def test_history_stays_within_the_budget(monkeypatch):
+    monkeypatch.setattr(chat_history, 'get_encoding', lambda model_name: WordEncoding())
+    for count in (2, 20, 200):
+        text, tokens = build_history("earlier summary " * 50, make_turns(count, 40), max_tokens=200, summary_tokens=30)
+        assert tokens <= 200
+        assert text.startswith("Summary of the earlier conversation:")
+        assert f"w{count - 1}" in text
+    _, tokens = build_history("", make_turns(2, 5), max_tokens=200)
+    assert tokens == 14
+
+# An older message that does not fit is cut, and the messages before it are dropped
+def test_older_messages_are_cut_then_dropped(monkeypatch):
+    monkeypatch.setattr(chat_history, 'get_encoding', lambda model_name: WordEncoding())
+    text, tokens = build_history("", make_turns(4, 50), max_tokens=150)
+    assert tokens == 150
+    assert "w0" not in text
+    assert text.splitlines()[0].startswith("Assistant: w1") and text.splitlines()[0].endswith("[...]")
+
+# The welcome message of the assistant is not part of the conversation
+def test_conversation_starts_at_the_first_question():
+    messages = [{'role': 'assistant', 'content': 'Hello'}, {'role': 'user', 'content': 'What is WEEE?'}]
+    assert conversation_turns(messages) == [{'role': 'user', 'content': 'What is WEEE?'}]
@@ -0,0 +1,61 @@
+from langchain_core.documents import Document  # Import Document to build the chunks of a file
+from chunk_dedup import ChunkDeduplicator  # Import the deduplicator under test
+from ingest_manifest import IngestManifest  # Import the manifest storing the signatures
+
+SPLITTER_PARAMS = {'splitter': 'test', 'chunk_size': 1000}
+TEXTS = [
+    "The central bank kept the policy rate unchanged at its March meeting",
+    "Inflation expectations remain anchored according to the latest survey of forecasters",
+    "Credit to households grew faster than credit to firms during the second quarter",
+    "The current account deficit narrowed as export volumes recovered from the slowdown",
+]
+
+# Function to count the tokens of a text, words are enough for the tests
+def count_words(text):
+    return len(text.split())
+
+# Function to build the chunks of a file
+def make_docs(path):
+    return [Document(page_content=text, metadata={'source': path}) for text in TEXTS]
+
+# Function to create a file on disk (the manifest records its size and mtime)
+def make_file(tmp_path, name):
+    path = tmp_path / name
+    path.write_text('content')
+    return str(path)
+
+# A run interrupted after the signatures of a file were committed, but before the file was recorded,
+# must embed the file again instead of finding its own chunks as exact duplicates
+def test_interrupted_file_is_not_a_duplicate_of_itself(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.sqlite3')
+    path = make_file(tmp_path, 'report.pdf')
+
+    manifest = IngestManifest(manifest_path, SPLITTER_PARAMS)
+    chunk_ids, new_chunks = ChunkDeduplicator(manifest, count_words).process(path, 'hash-1', make_docs(path))
+    assert len(new_chunks) == 4
+    # Checkpoint of a batch that did not complete the file, then the run stops
+    manifest.commit()
+    manifest.close()
+
+    manifest = IngestManifest(manifest_path, SPLITTER_PARAMS)
+    deduplicator = ChunkDeduplicator(manifest, count_words)
+    resumed_ids, resumed_chunks = deduplicator.process(path, 'hash-1', make_docs(path))
+    assert resumed_ids == chunk_ids
+    assert [chunk_id for chunk_id, _ in resumed_chunks] == chunk_ids
+    assert deduplicator.stats['exact_duplicates'] == 0
+    manifest.close()
+
+# The chunks of a recorded file are still found as duplicates by another file
+def test_recorded_file_chunks_are_shared(tmp_path):
+    manifest = IngestManifest(str(tmp_path / 'manifest.sqlite3'), SPLITTER_PARAMS)
+    deduplicator = ChunkDeduplicator(manifest, count_words)
+    first, second = make_file(tmp_path, 'report.pdf'), make_file(tmp_path, 'copy.pdf')
+
+    chunk_ids, _ = deduplicator.process(first, 'hash-1', make_docs(first))
+    manifest.record(first, 'hash-1', chunk_ids)
+    manifest.commit()
+    copy_ids, copy_chunks = deduplicator.process(second, 'hash-2', make_docs(second))
+    assert copy_ids == chunk_ids
+    assert copy_chunks == []
+    assert deduplicator.stats['exact_duplicates'] == 4
+    manifest.close()
@@ -0,0 +1,109 @@
+import asyncio  # Import asyncio to run the crawl loop
+import pytest  # Import pytest to check the raised errors
+import frontier  # Import the module to move its clock
+import robots  # Import the module to replace its fetch
+from frontier import CrawlFrontier, CrawlError, run_crawl, normalize_url, DONE, FAILED, PENDING  # Import the frontier under test
+from robots import RobotsPolicy  # Import the robots.txt policy, an unreachable robots.txt is retried
+
+# Function to replace the wall clock and the jitter of the frontier with settable ones
+def fake_clock(monkeypatch, start=1000.0):
+    clock = {'now': start}
+    monkeypatch.setattr(frontier.time, 'time', lambda: clock['now'])
+    monkeypatch.setattr(frontier.random, 'uniform', lambda low, high: 1.0)
+    return clock
+
+# Function to read the state, attempts and next retry time of a URL
+def url_state(crawl_frontier, url):
+    return crawl_frontier._conn.execute(
+        "SELECT state, attempts, next_retry_at FROM frontier WHERE url = ?", (url,)).fetchone()
+
+# The same page with a fragment, tracking parameters or another case in the host is queued once
+def test_equivalent_urls_are_queued_once(tmp_path):
+    crawl_frontier = CrawlFrontier('test', str(tmp_path / 'frontier.sqlite3'))
+    crawl_frontier.begin()
+    urls = ['https://Example.com:443/a?id=1#top', 'https://example.com/a?id=1&utm_source=x', 'https://example.com/b']
+    assert crawl_frontier.add_many(urls) == 2
+    assert normalize_url(urls[0]) == 'https://example.com/a?id=1'
+
+# A retryable failure waits base_delay * 2^(attempts - 1) seconds (capped), and fails for good after max_attempts
+def test_failures_back_off_exponentially_until_max_attempts(tmp_path, monkeypatch):
+    clock = fake_clock(monkeypatch)
+    crawl_frontier = CrawlFrontier('test', str(tmp_path / 'frontier.sqlite3'), max_attempts=4, base_delay=10, max_delay=25)
+    crawl_frontier.begin()
+    crawl_frontier.add('https://example.com/a')
+    delays = []
+    for _ in range(3):
+        assert [row[0] for row in crawl_frontier.claim_ready()] == ['https://example.com/a']
+        crawl_frontier.mark_failed('https://example.com/a', 'timeout')
+        _, _, next_retry_at = url_state(crawl_frontier, 'https://example.com/a')
+        delays.append(next_retry_at - clock['now'])
+        # Not due yet
+        assert crawl_frontier.claim_ready() == []
+        clock['now'] = next_retry_at
+    assert delays == [10, 20, 25]
+    crawl_frontier.claim_ready()
+    crawl_frontier.mark_failed('https://example.com/a', 'timeout')
+    assert url_state(crawl_frontier, 'https://example.com/a') == (FAILED, 4, None)
+    assert crawl_frontier.next_retry_at() is None
+
+# A failure that is not retryable is never retried, until retry_failed queues every failure again
+def test_retry_failed_requeues_permanent_failures(tmp_path, monkeypatch):
+    clock = fake_clock(monkeypatch)
+    crawl_frontier = CrawlFrontier('test', str(tmp_path / 'frontier.sqlite3'))
+    crawl_frontier.begin()
+    crawl_frontier.add('https://example.com/gone')
+    crawl_frontier.claim_ready()
+    crawl_frontier.mark_failed('https://example.com/gone', 'Status Code: 404', retryable=False)
+    clock['now'] += 10 ** 6
+    assert crawl_frontier.claim_ready() == []
+    assert crawl_frontier.retry_failed() == 1
+    assert [row[0] for row in crawl_frontier.claim_ready()] == ['https://example.com/gone']
+    assert url_state(crawl_frontier, 'https://example.com/gone')[1] == 0
+
+# A crash leaves URLs in flight: the next run resumes them instead of seeding a new run
+def test_interrupted_run_is_resumed(tmp_path):
+    path = str(tmp_path / 'frontier.sqlite3')
+    crawl_frontier = CrawlFrontier('test', path)
+    assert crawl_frontier.begin() is False
+    crawl_frontier.add_many(['https://example.com/a', 'https://example.com/b'])
+    crawl_frontier.claim_ready(limit=1)
+    crawl_frontier.close()
+
+    crawl_frontier = CrawlFrontier('test', path)
+    assert crawl_frontier.begin() is True
+    assert url_state(crawl_frontier, 'https://example.com/a')[0] == PENDING
+    assert crawl_frontier.counts()[PENDING] == 2
+
+# The crawl loop retries the failures due soon in the same run
+def test_run_crawl_retries_failures_due_soon(tmp_path):
+    crawl_frontier = CrawlFrontier('test', str(tmp_path / 'frontier.sqlite3'), base_delay=0.01)
+    crawl_frontier.begin()
+    crawl_frontier.add_many(['https://example.com/flaky', 'https://example.com/ok'])
+    calls, errors = [], []
+
+    async def handle(url, kind, output_path):
+        calls.append(url)
+        if url.endswith('flaky') and calls.count(url) < 3:
+            raise CrawlError('timeout')
+
+    asyncio.run(run_crawl(crawl_frontier, handle, lambda url, message: errors.append(url), concurrency=2))
+    assert calls.count('https://example.com/flaky') == 3
+    assert len(errors) == 2
+    assert crawl_frontier.counts()[DONE] == 2
+
+# Class standing for the crawler scheduler, the policy only sets host delays on it
+class FakeScheduler:
+    def set_host_delay(self, host, delay):
+        pass
+
+# An unreachable robots.txt postpones the URL with a retryable error instead of disallowing it
+def test_unreachable_robots_txt_raises_a_retryable_error(monkeypatch):
+    async def failing_fetch(session, scheduler, url):
+        return 503, {}, b''
+
+    monkeypatch.setattr(robots, 'fetch', failing_fetch)
+    policy = RobotsPolicy()
+    with pytest.raises(CrawlError) as error:
+        asyncio.run(policy.allowed(None, FakeScheduler(), 'https://example.com/page'))
+    assert error.value.retryable
+    assert policy.stats['unreachable'] == 1
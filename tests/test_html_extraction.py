@@ -0,0 +1,40 @@
+import pytest  # Import pytest to run the same page with several wrappers
+from html_extraction import extract_article  # Import the extraction under test
+
+PARAGRAPHS = ''.join(
+    f"<p>Paragraph {index} of the article about the circular economy, recycled materials and remanufacturing.</p>"
+    for index in range(6)
+)
+
+# Function to build a page whose article body sits in a wrapper with the given class
+def make_page(wrapper_class):
+    return f"""<html><head><title>Page</title></head><body>
+    <nav class="main-menu"><a href="/">Home</a> <a href="/news">News</a> <a href="/about">About</a></nav>
+    <div class="{wrapper_class}">
+      <h1>Circular economy</h1>
+      {PARAGRAPHS}
+      <div class="share-buttons"><a href="#">Share on LinkedIn</a> <a href="#">Share on X</a></div>
+    </div>
+    <footer><p>Copyright of the site, all rights reserved.</p></footer>
+    </body></html>"""
+
+# A wrapper whose class also holds a furniture word keeps the article, the real furniture is removed
+@pytest.mark.parametrize('wrapper_class', ['entry-content has-share-buttons', 'post-header-and-body',
+                                           'content with-sidebar'])
+def test_article_in_a_wrapper_with_a_furniture_class_is_kept(wrapper_class):
+    article = extract_article(make_page(wrapper_class), 'https://example.com/news/circular')
+    text = ' '.join(section['text'] for section in article['sections'])
+    assert article['title'] == 'Circular economy'
+    assert all(f"Paragraph {index} " in text for index in range(6))
+    assert 'Share on' not in text
+    assert 'Home' not in text
+    assert 'Copyright' not in text
+
+# A furniture block inside the article holding a small share of the page is removed even when it is not made of links
+def test_small_furniture_block_inside_the_article_is_removed():
+    html = make_page('entry').replace('<div class="share-buttons">',
+                                      '<div class="newsletter"><p>Subscribe to our newsletter today.</p></div><div class="share-buttons">')
+    article = extract_article(html, 'https://example.com/news/circular')
+    text = ' '.join(section['text'] for section in article['sections'])
+    assert 'newsletter' not in text
+    assert 'Paragraph 5 ' in text
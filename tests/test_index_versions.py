@@ -0,0 +1,89 @@
+import numpy as np  # Import NumPy to build the embeddings of the chunks
+import pytest  # Import pytest to check the refused activations
+from langchain_core.documents import Document  # Import Document to index the chunks
+from index_versions import (activate_version, create_version, current_version, list_versions, prune_versions,
+                            read_version_info, rollback, validate_version, version_paths, write_version_info)
+
+# Function to create a version marked valid without building its indexes
+def make_valid_version(root, chunks=10):
+    version = create_version(root, fresh=True)
+    info = read_version_info(root, version)
+    info['validation'] = {'valid': True, 'chunks': chunks}
+    write_version_info(root, version, info)
+    return version
+
+# Function to store `count` chunks with well separated embeddings in the Chroma collection and BM25 index of a version
+def fill_version(root, version, count, lexical_count=None):
+    from langchain_chroma import Chroma  # Import Chroma to write the collection of the version
+    from lexical_index import LexicalIndex  # Import the BM25 index of the version
+    paths = version_paths(root, version)
+    ids = [f"chunk-{number}" for number in range(count)]
+    texts = [f"Chunk number {number} about recycling" for number in range(count)]
+    collection = Chroma(persist_directory=paths['persist_directory'])._collection
+    collection.add(ids=ids, embeddings=np.eye(count, dtype=np.float32).tolist(), documents=texts,
+                   metadatas=[{'source': f"report-{number}.pdf"} for number in range(count)])
+    lexical_index = LexicalIndex(paths['lexical_index_path'])
+    count = count if lexical_count is None else lexical_count
+    lexical_index.upsert(ids[:count], [Document(page_content=text, metadata={'source': f"report-{number}.pdf"})
+                                       for number, text in enumerate(texts[:count])])
+    lexical_index.commit()
+    lexical_index.close()
+
+# A version is activated only once it is valid, unless forced
+def test_only_valid_versions_are_activated(tmp_path):
+    root = str(tmp_path)
+    version = create_version(root, fresh=True)
+    with pytest.raises(ValueError):
+        activate_version(root, version)
+    assert current_version(root) is None
+    activate_version(root, version, force=True)
+    assert current_version(root) == version
+
+# Every activation records the previous version, rolling back walks back through them
+def test_rollback_goes_back_one_version_at_a_time(tmp_path):
+    root = str(tmp_path)
+    first, second, third = (make_valid_version(root) for _ in range(3))
+    for version in (first, second, third):
+        activate_version(root, version)
+    assert rollback(root) == second
+    assert current_version(root) == second
+    assert rollback(root) == first
+    with pytest.raises(ValueError):
+        rollback(root)
+    assert current_version(root) == first
+
+# Pruning keeps the newest versions, the active one and the version a rollback would go back to
+def test_prune_keeps_the_active_and_previous_versions(tmp_path):
+    root = str(tmp_path)
+    versions = [make_valid_version(root) for _ in range(6)]
+    activate_version(root, versions[0])
+    activate_version(root, versions[1])
+    removed = prune_versions(root, keep=2)
+    assert removed == versions[2:4]
+    assert list_versions(root) == [versions[0], versions[1], versions[4], versions[5]]
+    assert rollback(root) == versions[0]
+
+# Validation checks the chunk counts of the indexes and the recall of the sampled chunks
+def test_validation_reports_the_problems(tmp_path):
+    root = str(tmp_path)
+    valid = create_version(root, fresh=True)
+    fill_version(root, valid, 8)
+    report = validate_version(root, valid)
+    assert report['valid'], report['problems']
+    assert report['chunks'] == 8 and report['lexical_chunks'] == 8 and report['recall'] == 1.0
+    activate_version(root, valid)
+
+    out_of_sync = create_version(root, fresh=True)
+    fill_version(root, out_of_sync, 8, lexical_count=7)
+    report = validate_version(root, out_of_sync)
+    assert not report['valid']
+    assert report['problems'] == ["the BM25 index has 7 chunks, Chroma 8"]
+    assert read_version_info(root, out_of_sync)['validation']['valid'] is False
+
+    shrunk = create_version(root, fresh=True)
+    fill_version(root, shrunk, 3)
+    report = validate_version(root, shrunk)
+    assert report['problems'] == [f"3 chunks against 8 in the active version {valid}"]
+    with pytest.raises(ValueError):
+        activate_version(root, shrunk)
+    assert current_version(root) == valid
@@ -0,0 +1,49 @@
+import os  # Import os to change the modification time of the files
+from ingest_manifest import IngestManifest, file_sha256, make_chunk_id  # Import the manifest under test
+
+SPLITTER_PARAMS = {'splitter': 'test', 'chunk_size': 1000}
+
+# Function to open a manifest in a temporary directory
+def open_manifest(tmp_path, params=SPLITTER_PARAMS):
+    return IngestManifest(str(tmp_path / 'manifest.sqlite3'), params)
+
+# A new file is ingested, a recorded one is skipped until its content changes
+def test_check_reports_new_and_modified_files(tmp_path):
+    manifest = open_manifest(tmp_path)
+    path = tmp_path / 'report.pdf'
+    path.write_bytes(b'first version')
+    content_hash = manifest.check(str(path))
+    assert content_hash == file_sha256(str(path))
+    manifest.record(str(path), content_hash, [make_chunk_id(str(path), content_hash, 0)])
+    assert manifest.check(str(path)) is None
+    # Touched but not modified: still skipped
+    os.utime(path, ns=(1, 1))
+    assert manifest.check(str(path)) is None
+    path.write_bytes(b'second version')
+    assert manifest.check(str(path)) == file_sha256(str(path))
+    manifest.close()
+
+# Files no longer on disk are reported, with the chunks only they reference
+def test_removed_files_and_exclusive_chunks(tmp_path):
+    manifest = open_manifest(tmp_path)
+    first, second = tmp_path / 'a.pdf', tmp_path / 'b.pdf'
+    first.write_bytes(b'a')
+    second.write_bytes(b'b')
+    manifest.record(str(first), 'hash-a', ['shared', 'only-a'])
+    manifest.record(str(second), 'hash-b', ['shared'])
+    assert manifest.removed_paths({str(second)}) == [str(first)]
+    assert manifest.exclusive_chunk_ids(str(first)) == ['only-a']
+    assert manifest.chunk_sources(['shared', 'missing']) == {'shared': sorted([str(first), str(second)])}
+    manifest.close()
+
+# The same content always gets the same chunk IDs, another content or path other ones
+def test_chunk_ids_are_deterministic():
+    assert make_chunk_id('a.pdf', 'hash', 0) == make_chunk_id('a.pdf', 'hash', 0)
+    assert make_chunk_id('a.pdf', 'hash', 0) != make_chunk_id('a.pdf', 'other', 0)
+    assert make_chunk_id('a.pdf', 'hash', 0) != make_chunk_id('b.pdf', 'hash', 0)
+
+# Other splitter parameters invalidate every chunk of the manifest
+def test_changed_params_are_detected(tmp_path):
+    open_manifest(tmp_path).close()
+    assert not open_manifest(tmp_path).params_changed
+    assert open_manifest(tmp_path, {**SPLITTER_PARAMS, 'chunk_size': 500}).params_changed
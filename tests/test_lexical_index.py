@@ -0,0 +1,45 @@
+from langchain_core.documents import Document  # Import Document to index the chunks
+from lexical_index import LexicalIndex  # Import the BM25 index under test
+
+CHUNKS = [
+    ('reports/report-0001.pdf', None, "Circular Economy Report 1. Report code OH-0001. Remanufacturing can reduce "
+                                      "costs for manufacturers of engines and plastics packaging."),
+    ('reports/report-0002.pdf', None, "Remanufacturing programmes reduce the costs of manufacturers. Plastics "
+                                      "recycling and repair reduce the costs of materials."),
+    ('reports/report-0003.pdf', None, "Manufacturers reduce their costs with remanufacturing, plastics are "
+                                      "sorted and recycled. WEEE collection targets are met."),
+    ('reports/report-0004.pdf', None, "Plastics and textiles: the costs of collection, manufacturers and "
+                                      "remanufacturing of components."),
+    ('html/passport.json', 'Digital Product Passport', "The passport stores the materials, repair and "
+                                                       "recycling information of a product."),
+]
+
+# Function to build an index with the chunks above
+def make_index(tmp_path):
+    index = LexicalIndex(str(tmp_path / 'lexical.sqlite3'))
+    docs = [Document(page_content=text, metadata={'source': source, **({'title': title} if title else {})})
+            for source, title, text in CHUNKS]
+    index.upsert([f"chunk-{number}" for number in range(len(docs))], docs)
+    index.commit()
+    return index
+
+# A question in plain words, or about a single word, goes through the hybrid search
+def test_natural_language_questions_skip_the_fast_path(tmp_path):
+    index = make_index(tmp_path)
+    assert index.keyword_search("How can remanufacturing reduce costs for manufacturers?") == []
+    assert index.keyword_search("What about plastics?") == []
+    assert index.keyword_search("Digital") == []
+
+# A product code or a title is answered from the index alone
+def test_codes_and_titles_take_the_fast_path(tmp_path):
+    index = make_index(tmp_path)
+    docs = index.keyword_search("OH-0001")
+    assert [doc.metadata['source'] for doc in docs] == ['reports/report-0001.pdf']
+    docs = index.keyword_search("Digital product passport")
+    assert [doc.metadata['source'] for doc in docs] == ['html/passport.json']
+    assert index.keyword_search("WEEE")[0].metadata['source'] == 'reports/report-0003.pdf'
+
+# The hybrid search still ranks the chunks with any of the terms
+def test_search_ranks_any_term(tmp_path):
+    index = make_index(tmp_path)
+    assert len(index.search("What about plastics?", k=10)) == 4
@@ -0,0 +1,46 @@
+import robots  # Import the module to move its clock
+from robots import RobotsPolicy, parse_robots  # Import the robots.txt policy under test
+
+ROBOTS_TXT = """User-agent: *
+Disallow: /private/
+Crawl-delay: 2
+Request-rate: 1/5
+"""
+
+# Function to replace the monotonic clock of the policy with a settable one
+def fake_clock(monkeypatch, start=1000.0):
+    clock = {'now': start}
+    monkeypatch.setattr(robots.time, 'monotonic', lambda: clock['now'])
+    return clock
+
+# The answer status decides the rules: 2xx parsed, 4xx allows everything, 5xx or no answer blocks everything
+def test_rules_follow_the_answer_status():
+    url = 'https://example.com/private/page'
+    assert not parse_robots(200, ROBOTS_TXT, 'https://example.com/robots.txt').can_fetch('*', url)
+    assert parse_robots(404, '', 'https://example.com/robots.txt').can_fetch('*', url)
+    assert not parse_robots(503, '', 'https://example.com/robots.txt').can_fetch('*', 'https://example.com/')
+    assert not parse_robots(None, '', 'https://example.com/robots.txt').can_fetch('*', 'https://example.com/')
+
+# The rules of a host are cached for the TTL, an unreachable robots.txt only for the shorter error TTL
+def test_cached_rules_expire_after_their_ttl(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    policy = RobotsPolicy(ttl_seconds=100, error_ttl_seconds=10)
+    policy.store('https://example.com/a', 200, ROBOTS_TXT)
+    policy.store('https://down.example.com/a', None)
+    clock['now'] += 50
+    assert policy.cached_rules('https://example.com/other') is not None
+    assert policy.cached_rules('https://down.example.com/other') is None
+    clock['now'] += 51
+    assert policy.cached_rules('https://example.com/other') is None
+    assert policy.cached_rules('https://other.example.com/') is None
+
+# The delay of a host is the largest of Crawl-delay and the period of Request-rate, None once the rules expire
+def test_crawl_delay_uses_the_slowest_rule(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    policy = RobotsPolicy(ttl_seconds=100)
+    policy.store('https://example.com/', 200, ROBOTS_TXT)
+    policy.store('https://fast.example.com/', 200, "User-agent: *\nDisallow:\n")
+    assert policy.crawl_delay('https://example.com/page') == 5.0
+    assert policy.crawl_delay('https://fast.example.com/page') is None
+    clock['now'] += 101
+    assert policy.crawl_delay('https://example.com/page') is None
@@ -0,0 +1,47 @@
+import io  # Import io to feed the cleaned stream from memory
+import gzip  # Import gzip to write a compressed sitemap
+import sitemap  # Import the sitemap reader under test
+
+URLS = [f"https://example.com/reports/r{i}?a=1&b={i}&amp;c=2" for i in range(50)]
+
+# Function to write a sitemap on a single line (minified), with a notice before the first tag
+def minified_sitemap(urls):
+    entries = ''.join(f"<url><loc>{url}</loc><lastmod>2021-0{1 + i % 9}-01</lastmod></url>" for i, url in enumerate(urls))
+    return f'Saved from the browser <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'.encode()
+
+# Stream recording the largest amount of data returned by a single call
+class RecordingStream(io.BytesIO):
+    largest_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.largest_read = max(self.largest_read, len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = super().readline(size)
+        self.largest_read = max(self.largest_read, len(data))
+        return data
+
+# Entities split between two blocks are escaped correctly, and every read is bounded by the block size
+def test_cleaned_stream_never_splits_an_entity(monkeypatch, tmp_path):
+    data = minified_sitemap(URLS)
+    path = tmp_path / 'sitemap.xml'
+    path.write_bytes(data)
+    expected = [url.replace('&amp;', '&') for url in URLS]
+    for block_size in (5, 7, 13, 64):
+        monkeypatch.setattr(sitemap, 'BLOCK_SIZE', block_size)
+        raw = RecordingStream(data)
+        cleaned = b''.join(iter(sitemap._CleanedXmlStream(raw).read, b''))
+        # A minified sitemap is one line: the stream must never read more than a block at a time
+        assert raw.largest_read <= block_size
+        assert cleaned.startswith(b'<urlset')
+        assert b'&c' not in cleaned and b'&b' not in cleaned
+        assert [url for url, _ in sitemap.iter_sitemap(str(path))] == expected
+
+# Gzip sitemaps are read too, and the lastmod filter keeps only the recent URLs
+def test_gzip_and_lastmod_filter(tmp_path):
+    path = tmp_path / 'sitemap.xml.gz'
+    path.write_bytes(gzip.compress(minified_sitemap(URLS[:9])))
+    urls = list(sitemap.iter_sitemap_urls(str(path), '/reports/', lastmod_since='2021-05-01'))
+    assert len(urls) == 5
@@ -0,0 +1,36 @@
+from ingest_manifest import IngestManifest  # Import the manifest the ingest keeps
+from update_embeddings import prepare_files  # Import the stage removing the previous chunks of a file
+
+# Class standing for the Chroma collection, it stores the source of every chunk
+class FakeCollection:
+    def __init__(self, sources):
+        self.sources = sources
+
+    def get(self, where, include):
+        return {'ids': [chunk_id for chunk_id, source in self.sources.items() if source == where['source']]}
+
+# Class standing for the Chroma store and the BM25 index, it records the deleted chunks
+class FakeStore:
+    def __init__(self, sources=None):
+        self._collection = FakeCollection(sources or {})
+        self.deleted = []
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+# A file new to the manifest loses the chunks stored with its source, except those another file references
+def test_new_file_keeps_the_chunks_other_files_reference(tmp_path):
+    other_path = tmp_path / 'other.pdf'
+    other_path.write_bytes(b'other')
+    manifest = IngestManifest(str(tmp_path / 'manifest.sqlite3'), {'chunk_size': 1000})
+    manifest.record(str(other_path), 'hash', ['shared'])
+    vectordb = FakeStore({'stale': 'new.pdf', 'shared': 'new.pdf', 'kept': str(other_path)})
+    lexical_index = FakeStore()
+    shared_chunk_ids = set()
+
+    prepared = list(prepare_files([('new.pdf', 'hash', [({'page': 0}, 'text')], None)],
+                                  vectordb, lexical_index, manifest, shared_chunk_ids))
+    assert vectordb.deleted == ['stale']
+    assert lexical_index.deleted == ['stale']
+    assert shared_chunk_ids == {'shared'}
+    assert prepared[0][2][0].metadata == {'source': 'new.pdf', 'page': 0}
@@ -0,0 +1,285 @@
+import os  # Import the OS module to read the configuration and write the exports
+import sys  # Import sys to name the service after the running script
+import json  # Import json to write the spans as JSON lines
+import time  # Import time module to time the spans
+import atexit  # Import atexit to write the last spans and metrics when the process ends
+import random  # Import random to generate the trace and span IDs
+import functools  # Import functools to keep the name of the traced functions
+import threading  # Import threading to share the tracer between threads
+import contextvars  # Import contextvars to follow the current span across threads and asyncio tasks
+
+# Lightweight tracing: nested timed spans and counters, exported as JSON lines (one span per line)
+# and as a Prometheus text snapshot. Turned on with TRACING=1; when it is off, span() returns a shared
+# no-op object and count() returns at once, so the instrumented code pays a function call.
+#   with tracing.span('chat.llm', model='gpt-4') as span:
+#       ...
+#       span.set('tokens_out', 120)
+#   tracing.count('crawl_bytes_total', len(body), kind='page')
+
+# -------------- TRACING CONFIGURATION --------------
+TRACING_ENABLED = os.getenv('TRACING', '0').lower() in ('1', 'true', 'yes')  # Record spans and counters
+TRACE_DIRECTORY = os.getenv('TRACE_DIRECTORY', './traces')  # Directory of the exports
+TRACE_FILE = 'spans.jsonl'  # Spans of every service, appended
+FLUSH_EVERY = 256  # Finished spans kept in memory before being appended to the trace file
+# Upper bounds (seconds) of the histogram buckets of the span durations
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = contextvars.ContextVar('current_span', default=None)  # Innermost open span
+
+# Function to generate a random hexadecimal ID
+def _new_id(bits=64):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+# Function to get the name of the running script, used as service name by default
+def _default_service():
+    return os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else 'python'))[0] or 'python'
+
+# -------------- SPANS --------------
+# Class doing nothing, returned by span() when tracing is off
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, key, value):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+# Class timing a block of code, child of the span open when it starts (in the same thread or task)
+# The parent is restored explicitly on exit, so a span may stay open across the yields of a generator
+class Span:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self.trace_id = self.parent.trace_id if self.parent is not None else _new_id(128)
+        self.span_id = _new_id()
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._start
+        _current_span.set(self.parent)
+        record = {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'start': round(self.start_time, 6),
+            'duration_ms': round(duration * 1000, 3),
+            'attributes': self.attributes,
+        }
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.tracer.finish(record)
+        return False
+
+    # Function to add an attribute to the span (tokens, bytes, status code...)
+    def set(self, key, value):
+        self.attributes[key] = value
+
+# -------------- TRACER --------------
+# Class collecting the finished spans and the counters of the process
+class Tracer:
+    def __init__(self, enabled=TRACING_ENABLED, directory=TRACE_DIRECTORY, service=None):
+        self.enabled = enabled
+        self.directory = directory
+        self.service = service or _default_service()
+        self._pending = []  # Finished spans not written yet
+        self._durations = {}  # Span name -> [bucket counts, sum of seconds, count]
+        self._counters = {}  # (metric name, sorted labels) -> value
+        self._lock = threading.Lock()
+        self._exit_hook = False
+        if enabled:
+            self._register_exit_hook()
+
+    def _register_exit_hook(self):
+        if not self._exit_hook:
+            atexit.register(self.flush)
+            self._exit_hook = True
+
+    # Function to record a finished span and add its duration to the histogram of its name
+    def finish(self, record):
+        record['service'] = self.service
+        record['pid'] = os.getpid()
+        seconds = record['duration_ms'] / 1000
+        with self._lock:
+            self._pending.append(record)
+            histogram = self._durations.get(record['name'])
+            if histogram is None:
+                histogram = self._durations[record['name']] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            flush_now = len(self._pending) >= FLUSH_EVERY
+        if flush_now:
+            self.write_spans()
+
+    # Function to record a span already timed by the caller (e.g. the rerun of the Streamlit script)
+    def record(self, name, seconds, attributes):
+        parent = _current_span.get()
+        self.finish({
+            'name': name,
+            'trace_id': parent.trace_id if parent is not None else _new_id(128),
+            'span_id': _new_id(),
+            'parent_id': parent.span_id if parent is not None else None,
+            'start': round(time.time() - seconds, 6),
+            'duration_ms': round(seconds * 1000, 3),
+            'attributes': attributes,
+        })
+
+    # Function to add a value to a counter with labels
+    def count(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # Function to take the finished spans not written yet, to send them to another process
+    def drain(self):
+        with self._lock:
+            spans, self._pending = self._pending, []
+        return spans
+
+    # Function to record spans finished in another process (the parser workers of the ingest),
+    # their root spans become children of the span open here
+    def adopt(self, spans):
+        parent = _current_span.get()
+        for record in spans:
+            if parent is not None:
+                record['trace_id'] = parent.trace_id
+                if record['parent_id'] is None:
+                    record['parent_id'] = parent.span_id
+            self.finish({**record, 'attributes': {**record['attributes'], 'worker_pid': record.get('pid')}})
+
+    # Function to append the finished spans to the trace file
+    def write_spans(self):
+        spans = self.drain()
+        if not spans:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # One write call per flush, the lines of concurrent processes do not interleave
+        with open(os.path.join(self.directory, TRACE_FILE), 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, default=str) + '\n' for record in spans))
+
+    # Function to build the Prometheus text snapshot of the span durations and the counters
+    def prometheus_text(self):
+        with self._lock:
+            durations = {name: (list(buckets), total, count) for name, (buckets, total, count) in self._durations.items()}
+            counters = dict(self._counters)
+        lines = []
+        if durations:
+            lines += ['# HELP span_duration_seconds Duration of the traced spans',
+                      '# TYPE span_duration_seconds histogram']
+            for name in sorted(durations):
+                buckets, total, count = durations[name]
+                labels = f'service="{_escape(self.service)}",span="{_escape(name)}"'
+                for bound, value in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'span_duration_seconds_bucket{{{labels},le="{bound}"}} {value}')
+                lines.append(f'span_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'span_duration_seconds_sum{{{labels}}} {total:.6f}')
+                lines.append(f'span_duration_seconds_count{{{labels}}} {count}')
+        for metric in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE {metric} counter')
+            for (name, label_items), total in sorted(counters.items(), key=lambda item: str(item[0])):
+                if name == metric:
+                    labels = ','.join(f'{key}="{_escape(value)}"' for key, value in (('service', self.service),) + label_items)
+                    lines.append(f'{metric}{{{labels}}} {total}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    # Function to write the Prometheus snapshot of this service, replaced atomically
+    def write_metrics(self):
+        text = self.prometheus_text()
+        if not text:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"metrics-{self.service}.prom")
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(f"{path}.tmp", path)
+
+    # Function to write the pending spans and the metrics snapshot
+    def flush(self):
+        if self.enabled:
+            self.write_spans()
+            self.write_metrics()
+
+# Function to escape a Prometheus label value
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# -------------- MODULE API --------------
+_tracer = Tracer()  # Tracer of the process
+
+# Function to turn tracing on or off, and name the service of the exports (e.g. 'app', 'ingest')
+# The setting is passed to the child processes through the environment
+def configure(enabled=None, service=None, directory=None):
+    if enabled is not None:
+        _tracer.enabled = enabled
+        os.environ['TRACING'] = '1' if enabled else '0'
+        if enabled:
+            _tracer._register_exit_hook()
+    if service is not None:
+        _tracer.service = service
+    if directory is not None:
+        _tracer.directory = directory
+        os.environ['TRACE_DIRECTORY'] = directory
+
+# Function to check whether tracing is on, to skip the work only done for the traces
+def enabled():
+    return _tracer.enabled
+
+# Function to open a timed span: `with span('ingest.embed', chunks=128):`
+def span(name, **attributes):
+    if not _tracer.enabled:
+        return _NOOP_SPAN
+    return Span(_tracer, name, attributes)
+
+# Decorator running every call of a function in a span: `@traced('ingest.run')`
+def traced(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Function to record a span whose duration was already measured: `record('app.rerun', seconds)`
+def record(name, seconds, **attributes):
+    if _tracer.enabled:
+        _tracer.record(name, seconds, attributes)
+
+# Function to add a value to a counter: `count('crawl_responses_total', status=200)`
+def count(name, value=1, **labels):
+    if _tracer.enabled:
+        _tracer.count(name, value, labels)
+
+# Function to take the spans finished in this process and not written yet (parser workers)
+def drain():
+    if not _tracer.enabled:
+        return []
+    return _tracer.drain()
+
+# Function to record the spans finished in another process
+def adopt(spans):
+    if _tracer.enabled and spans:
+        _tracer.adopt(spans)
+
+# Function to write the pending spans and the metrics snapshot now
+def flush():
+    _tracer.flush()
+
+# Function to get the Prometheus text snapshot of the process
+def prometheus_text():
+    return _tracer.prometheus_text()
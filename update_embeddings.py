@@ -1,11 +1,18 @@
-from langchain_community.document_loaders import PyPDFLoader  # Import PDF loader from LangChain community
 from langchain_openai import OpenAIEmbeddings  # Import OpenAI embeddings function from LangChain
 from langchain_chroma import Chroma  # Import Chroma for the vector database
-from langchain.text_splitter import RecursiveCharacterTextSplitter  # Import text splitter from LangChain
+from langchain_core.documents import Document  # Import Document to rebuild the chunks returned by the parsers
 import os  # Import OS module to interact with the operating system
 import logging  # Import logging module to capture logs
 from dotenv import load_dotenv  # Import function to load environment variables from a .env file
 import time  # Import time module to measure time taken
+from ingest_manifest import IngestManifest, MANIFEST_NAME  # Import the content-hash manifest
+from pdf_parsing import parse_files_parallel, parse_files_sequential  # Import the PDF parsing stage
+from embedding_scheduler import EmbeddingScheduler  # Import the batched, rate-limited embedding scheduler
+import chunk_dedup  # Import the boilerplate and duplicate chunk removal
+from vector_index import refresh_index, DEFAULT_INDEX_DIRECTORY  # Import the export of the memory-mapped index
+from chat_cache import chroma_fingerprint  # Import the fingerprint of the Chroma collection
+from lexical_index import LexicalIndex, DEFAULT_LEXICAL_INDEX_PATH  # Import the BM25 index of the chunks
+import tracing  # Import the spans and counters of the ingest (turned on with TRACING=1)
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -13,69 +20,311 @@ load_dotenv()
 # Ensure to set your API key correctly
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-# List of folder paths containing PDFs
-folders_paths = ['pdf_news_insights', 'pdf_reports']
+# List of folder paths containing PDFs, and JSON articles extracted from HTML pages
+folders_paths = ['pdf_news_insights', 'pdf_reports', 'html_news_insights']
+# Extensions of the files ingested from those folders
+document_extensions = ('.pdf', '.json')
 # Directory where the Chroma database will be stored
 persist_directory = './chroma_db'
+# Directory of the memory-mapped index used by the app, exported again after every change when it exists
+vector_index_directory = DEFAULT_INDEX_DIRECTORY
+# BM25 index of the chunks used by the hybrid search of the app, kept in sync with Chroma
+lexical_index_path = DEFAULT_LEXICAL_INDEX_PATH
+# Embedding model and splitter parameters, changing any of them re-embeds every file
+embedding_model = 'text-embedding-ada-002'
+chunk_size = 1000
+chunk_overlap = 50
+# Estimated similarity above which two chunks are collapsed into one (1.0 keeps only the exact duplicates)
+near_duplicate_threshold = chunk_dedup.NEAR_DUPLICATE_THRESHOLD
+# Number of chunks embedded and stored at a time, it bounds the data in flight
+batch_size = 512
+# Number of processes parsing and splitting PDFs in parallel (0 parses in this process)
+parser_workers = int(os.getenv('INGEST_WORKERS', os.cpu_count() or 1))
+# Seconds after which a PDF that hangs the parser is abandoned
+parse_timeout = 120
+# Embedding requests: size of each request, concurrent requests and account rate limits
+embed_batch_chunks = 128
+embed_batch_tokens = 50000
+embed_concurrency = int(os.getenv('EMBED_CONCURRENCY', '4'))
+embed_requests_per_minute = int(os.getenv('EMBED_REQUESTS_PER_MINUTE', '3000'))
+embed_tokens_per_minute = int(os.getenv('EMBED_TOKENS_PER_MINUTE', '1000000'))
 
 # Configure logging to capture errors and info messages
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+tracing.configure(service='ingest')
 
-# Function to update embeddings
-def update_embeddings(folders_paths, persist_directory):
-    all_docs = []  # List to hold all documents
+# -------------- PIPELINE STAGES --------------
+# Every stage is a generator, so only one file and one batch of chunks are in memory at a time:
+# discover -> select changed -> load + split (process pool) -> dedup -> batch -> embed (scheduler) + upsert
 
-    # List all PDF files in the specified folders
+# Stage 1: discover the files of the folders (the paths seen are collected to detect removed files)
+def discover_files(folders_paths, seen_paths):
     for folder_path in folders_paths:
-        pdf_files = [f for f in os.listdir(folder_path) if f.endswith('.pdf')]
-        logger.info(f"Number of PDF files found in {folder_path}: {len(pdf_files)}")
-
-        # Load each PDF file
-        for pdf_file in pdf_files:
-            path_pdf = os.path.join(folder_path, pdf_file)
-            try:
-                loader = PyPDFLoader(path_pdf)
-                docs = loader.load()
-                all_docs.extend(docs)
-            except Exception as e:
-                logger.error(f"Error loading {path_pdf}: {e}")
-
-    logger.info(f"Total number of documents loaded: {len(all_docs)}")
-
-    # If no documents are loaded, exit the function
-    if not all_docs:
-        logger.info("No new documents to add.")
-        return
+        if not os.path.isdir(folder_path):
+            logger.info(f"Folder {folder_path} does not exist, skipping it")
+            continue
+        files = sorted(f for f in os.listdir(folder_path) if f.endswith(document_extensions))
+        logger.info(f"Number of files found in {folder_path}: {len(files)}")
+        for file_name in files:
+            path = os.path.join(folder_path, file_name)
+            seen_paths.add(path)
+            yield path
+
+# Stage 2: keep only the new or modified files, with their content hash
+def select_changed(paths, manifest):
+    for path_pdf in paths:
+        content_hash = manifest.check(path_pdf)
+        if content_hash is not None:
+            yield path_pdf, content_hash
+
+# Stage 3: load and split the files, in a pool of worker processes when parser_workers > 0
+def parse_files(changed_files, workers):
+    if workers > 0:
+        return parse_files_parallel(changed_files, workers, chunk_size, chunk_overlap, timeout=parse_timeout)
+    return parse_files_sequential(changed_files, chunk_size, chunk_overlap)
+
+# Stage 4: rebuild the chunks of each parsed file, a file that failed is logged and skipped
+# The chunks the previous version shares with other files are kept and collected in `shared_chunk_ids`
+def prepare_files(parsed_files, vectordb, lexical_index, manifest, shared_chunk_ids):
+    for path_pdf, content_hash, chunks, error in parsed_files:
+        if error is not None:
+            logger.error(f"Error loading {path_pdf}: {error}")
+            tracing.count('ingest_file_errors_total')
+            continue
+        # Remove the chunks of the previous version of the file before storing the new ones
+        if manifest.is_new(path_pdf):
+            # Chunks added before the manifest existed have random IDs (and chunks of an interrupted
+            # first ingest are not recorded yet), remove them by source; a chunk another file references
+            # through the deduplication stays, its sources are refreshed at the end of the run
+            stored = vectordb._collection.get(where={'source': path_pdf}, include=[])
+            referenced = manifest.chunk_sources(stored['ids'])
+            shared_chunk_ids.update(referenced)
+            delete_chunks(vectordb, lexical_index, manifest,
+                          [chunk_id for chunk_id in stored['ids'] if chunk_id not in referenced])
+        else:
+            exclusive_ids = manifest.exclusive_chunk_ids(path_pdf)
+            shared_chunk_ids.update(set(manifest.chunk_ids(path_pdf)) - set(exclusive_ids))
+            delete_chunks(vectordb, lexical_index, manifest, exclusive_ids)
+        docs = [Document(page_content=text, metadata={'source': path_pdf, **metadata}) for metadata, text in chunks]
+        yield path_pdf, content_hash, docs
+
+# Stage 5: strip the lines repeated on every page and collapse the duplicate chunks
+# Only the new chunks go on to be embedded, a duplicate is a reference to the chunk already stored
+def deduplicate_files(split_files, deduplicator):
+    for path_pdf, content_hash, docs in split_files:
+        with tracing.span('ingest.dedup', path=path_pdf, chunks=len(docs)) as span:
+            chunk_ids, new_chunks = deduplicator.process(path_pdf, content_hash, docs)
+            span.set('new_chunks', len(new_chunks))
+        yield path_pdf, content_hash, chunk_ids, new_chunks
+
+# Stage 6: group the new chunks in fixed-size batches with their deterministic IDs
+# Every batch carries the files whose last chunk is in it, they are complete once the batch is stored
+def batch_chunks(deduplicated_files, batch_size):
+    batch, batch_ids, completed_files = [], [], []
+    for path_pdf, content_hash, chunk_ids, new_chunks in deduplicated_files:
+        for chunk_id, chunk in new_chunks:
+            batch.append(chunk)
+            batch_ids.append(chunk_id)
+            if len(batch) >= batch_size:
+                yield batch, batch_ids, completed_files
+                batch, batch_ids, completed_files = [], [], []
+        completed_files.append((path_pdf, content_hash, chunk_ids))
+    if batch or completed_files:
+        yield batch, batch_ids, completed_files
+
+# Stage 7: embed a batch with the scheduler and upsert it with its deterministic IDs, in Chroma and in the BM25 index
+def embed_and_upsert(vectordb, lexical_index, scheduler, docs, chunk_ids):
+    with tracing.span('ingest.embed', chunks=len(docs)):
+        vectors = scheduler.embed([doc.page_content for doc in docs])
+    with tracing.span('ingest.upsert', chunks=len(docs)):
+        vectordb._collection.upsert(
+            ids=chunk_ids,
+            embeddings=vectors,
+            documents=[doc.page_content for doc in docs],
+            metadatas=[doc.metadata for doc in docs],
+        )
+        lexical_index.upsert(chunk_ids, docs)
+    tracing.count('ingest_chunks_total', len(docs))
+
+# Function to delete chunks from Chroma and the BM25 index by ID, with their deduplication signatures
+def delete_chunks(vectordb, lexical_index, manifest, chunk_ids):
+    if chunk_ids:
+        vectordb.delete(ids=chunk_ids)
+        lexical_index.delete(chunk_ids)
+        manifest.forget_signatures(chunk_ids)
 
-    # Split the documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50)
-    chunked_documents = text_splitter.split_documents(all_docs)
+# Function to update the shared chunks: every chunk lists the files it was found in ('sources'),
+# a chunk whose first file is gone is cited from the next one, and a chunk no file references is deleted
+def refresh_shared_chunks(vectordb, lexical_index, manifest, chunk_ids):
+    chunk_ids = sorted(chunk_ids)
+    for start in range(0, len(chunk_ids), batch_size):
+        batch = chunk_ids[start:start + batch_size]
+        sources = manifest.chunk_sources(batch)
+        delete_chunks(vectordb, lexical_index, manifest, [chunk_id for chunk_id in batch if chunk_id not in sources])
+        if not sources:
+            continue
+        stored = vectordb._collection.get(ids=list(sources), include=['metadatas', 'documents', 'embeddings'])
+        updated, moved = [], []
+        for index, (chunk_id, metadata) in enumerate(zip(stored['ids'], stored['metadatas'])):
+            paths = sources[chunk_id]
+            shared = {'sources': '\n'.join(paths), 'source_count': len(paths)}
+            if metadata.get('source') in paths:
+                updated.append((chunk_id, shared))
+            else:
+                # The page, URL, title... described the location in the file that is gone
+                moved.append((index, {'source': paths[0], **shared}))
+        if updated:
+            vectordb._collection.update(ids=[chunk_id for chunk_id, _ in updated],
+                                        metadatas=[metadata for _, metadata in updated])
+            lexical_index.update_metadata([chunk_id for chunk_id, _ in updated], [metadata for _, metadata in updated])
+        if moved:
+            # Chroma merges the metadata on update, the chunk is stored again to drop the old keys
+            moved_ids = [stored['ids'][index] for index, _ in moved]
+            vectordb._collection.delete(ids=moved_ids)
+            vectordb._collection.add(
+                ids=moved_ids,
+                embeddings=[stored['embeddings'][index] for index, _ in moved],
+                documents=[stored['documents'][index] for index, _ in moved],
+                metadatas=[metadata for _, metadata in moved],
+            )
+            lexical_index.upsert(moved_ids, [Document(page_content=stored['documents'][index], metadata=metadata)
+                                             for index, metadata in moved])
 
-    logger.info(f"Total number of document chunks: {len(chunked_documents)}")
+# Function to update embeddings, only new or modified files are embedded
+# The BM25 index and the vector index are the ones next to the Chroma database (index_versions.py
+# passes the paths of the version it builds)
+# Returns a summary of the run: files, chunks, seconds, embedding throughput and deduplication savings
+@tracing.traced('ingest.run')
+def update_embeddings(folders_paths, persist_directory, batch_size=batch_size, workers=parser_workers,
+                      lexical_index_path=lexical_index_path, vector_index_directory=vector_index_directory):
+    splitter_params = {
+        'splitter': 'RecursiveCharacterTextSplitter',
+        'chunk_size': chunk_size,
+        'chunk_overlap': chunk_overlap,
+        'embedding_model': embedding_model,
+        'dedup': {
+            'near_duplicate_threshold': near_duplicate_threshold,
+            'shingle_words': chunk_dedup.SHINGLE_WORDS,
+            'minhash_permutations': chunk_dedup.MINHASH_PERMUTATIONS,
+            'lsh_bands': chunk_dedup.LSH_BANDS,
+            'boilerplate_min_pages': chunk_dedup.BOILERPLATE_MIN_PAGES,
+            'boilerplate_page_ratio': chunk_dedup.BOILERPLATE_PAGE_RATIO,
+        },
+    }
+    manifest = IngestManifest(os.path.join(persist_directory, MANIFEST_NAME), splitter_params)
 
-    # Create embeddings using OpenAI
-    embeddings = OpenAIEmbeddings(model='text-embedding-ada-002', api_key=OPENAI_API_KEY)
+    # Create embeddings using OpenAI and open the existing vector database (it is created if it doesn't exist)
+    embeddings = OpenAIEmbeddings(model=embedding_model, api_key=OPENAI_API_KEY)
+    vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    lexical_index = LexicalIndex(lexical_index_path)
+    scheduler = EmbeddingScheduler(
+        embedding_model,
+        api_key=OPENAI_API_KEY,
+        max_batch_chunks=embed_batch_chunks,
+        max_batch_tokens=embed_batch_tokens,
+        concurrency=embed_concurrency,
+        requests_per_minute=embed_requests_per_minute,
+        tokens_per_minute=embed_tokens_per_minute,
+    )
+
+    # Chunks built with other splitter parameters are deleted and every file is ingested again
+    if manifest.params_changed:
+        for chunk_ids in list(manifest.iter_chunk_id_batches(batch_size)):
+            delete_chunks(vectordb, lexical_index, manifest, chunk_ids)
+        manifest.clear()
+        logger.info("Splitter parameters changed, all the documents will be embedded again")
+
+    deduplicator = chunk_dedup.ChunkDeduplicator(manifest, scheduler.count_tokens, near_threshold=near_duplicate_threshold)
+    shared_chunk_ids = deduplicator.shared_chunk_ids  # Chunks whose sources change in this run
+
+    seen_paths = set()
+    changed_files = select_changed(discover_files(folders_paths, seen_paths), manifest)
+    prepared_files = prepare_files(parse_files(changed_files, workers), vectordb, lexical_index, manifest, shared_chunk_ids)
+    pipeline = batch_chunks(deduplicate_files(prepared_files, deduplicator), batch_size)
 
     # Record the start time for API calls
     start_time = time.time()
 
-    # Load the existing vector database or create a new one if it doesn't exist
-    try:
-        vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-        vectordb.add_documents(chunked_documents)
-    except ValueError as e:
-        if 'tenant default_tenant' in str(e):
-            vectordb = Chroma.from_documents(chunked_documents, embeddings, persist_directory=persist_directory)
-        else:
-            raise e
+    # Embed and store each batch, then checkpoint the files completed by it
+    total_chunks = 0
+    total_files = 0
+    for docs, chunk_ids, completed_files in pipeline:
+        if docs:
+            embed_and_upsert(vectordb, lexical_index, scheduler, docs, chunk_ids)
+        with tracing.span('ingest.checkpoint', files=len(completed_files)):
+            for path_pdf, content_hash, file_chunk_ids in completed_files:
+                manifest.record(path_pdf, content_hash, file_chunk_ids)
+            lexical_index.commit()
+            manifest.commit()
+        tracing.count('ingest_files_total', len(completed_files))
+        total_chunks += len(docs)
+        total_files += len(completed_files)
+        logger.info(f"Stored {total_chunks} chunks from {total_files} files")
 
     # Record the total time taken for API calls
     end_time = time.time()
     total_time = end_time - start_time
 
+    # Delete the chunks of the files that no longer exist
+    removed_paths = manifest.removed_paths(seen_paths)
+    with tracing.span('ingest.cleanup', removed_files=len(removed_paths), shared_chunks=len(shared_chunk_ids)):
+        for path_pdf in removed_paths:
+            exclusive_ids = manifest.exclusive_chunk_ids(path_pdf)
+            shared_chunk_ids.update(set(manifest.chunk_ids(path_pdf)) - set(exclusive_ids))
+            delete_chunks(vectordb, lexical_index, manifest, exclusive_ids)
+            manifest.forget(path_pdf)
+        refresh_shared_chunks(vectordb, lexical_index, manifest, shared_chunk_ids)
+        lexical_index.commit()
+    manifest.close()
+    # The BM25 index is built from Chroma the first time, or again if a run stopped between the two stores
+    if lexical_index.count() != vectordb._collection.count():
+        with tracing.span('ingest.lexical_rebuild'):
+            lexical_index.rebuild(vectordb._collection)
+        logger.info(f"Lexical index rebuilt from Chroma: {lexical_index.count()} chunks")
+    lexical_index.close()
+    scheduler.close()
+    logger.info(f"Files embedded: {total_files}, files removed: {len(removed_paths)}")
+    if deduplicator.stats['chunks']:
+        logger.info(deduplicator.summary(embed_batch_chunks, embed_batch_tokens))
+
+    # Keep the exported index of the app in sync with the collection
+    if (total_files or removed_paths) and vectordb._collection.count():
+        with tracing.span('ingest.export_index'):
+            info = refresh_index(vectordb._collection, vector_index_directory,
+                                 fingerprint=chroma_fingerprint(persist_directory))
+        if info is not None:
+            logger.info(f"Vector index exported again: {info['count']} chunks ({info['dtype']}, {info['ivf_lists']} IVF lists)")
+
+    # Summary of the run, returned for the benchmarks
+    stats = scheduler.throughput()
+    summary = {
+        'files': total_files,
+        'removed_files': len(removed_paths),
+        'chunks': total_chunks,
+        'seconds': total_time,
+        'embedding': stats,
+        'dedup': deduplicator.report(embed_batch_chunks, embed_batch_tokens),
+    }
+
+    # If no documents were added, there is nothing else to report
+    if not total_chunks:
+        logger.info("No new documents to add.")
+        return summary
+
     logger.info(f"Total time to add documents to Chroma: {total_time} seconds")
+    logger.info(
+        f"Embedding throughput: {stats['chunks_per_second']} chunks/s, {stats['tokens_per_second']} tokens/s "
+        f"({stats['requests']} requests, {stats['retries']} retries)"
+    )
     logger.info("Embedding update process completed successfully.")
+    return summary
 
 # Execute the function to update embeddings
-update_embeddings(folders_paths, persist_directory)
+# (guarded: the parser processes import this module when they start)
+if __name__ == '__main__':
+    from index_versions import current_version  # Import the pointer of the blue-green index versions
+    if current_version() is not None:
+        logger.warning("The app reads the active index version, build a new one with: python index_versions.py build")
+    update_embeddings(folders_paths, persist_directory)
+    tracing.flush()
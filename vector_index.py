@@ -0,0 +1,338 @@
+import os  # Import the OS module to manage the index files
+import json  # Import json to store the index description and the chunk metadata
+import time  # Import time module to date the exports
+import shutil  # Import shutil to remove the previous index after a swap
+import sqlite3  # Import sqlite3 for the metadata sidecar
+import threading  # Import threading to share the sidecar connection between Streamlit sessions
+import numpy as np  # Import NumPy for the memory-mapped embeddings and the vectorized search
+
+# -------------- INDEX CONFIGURATION --------------
+DEFAULT_INDEX_DIRECTORY = './vector_index'  # Directory of the exported index
+INDEX_FILE = 'index.json'  # Description of the index: dtype, size, IVF lists, fingerprint of the source
+EMBEDDINGS_FILE = 'embeddings.npy'  # Normalized embeddings, float16 or int8, one row per chunk
+SCALES_FILE = 'scales.npy'  # Scale of every int8 row (float32)
+CENTROIDS_FILE = 'centroids.npy'  # Centroids of the IVF lists (float32)
+LIST_OFFSETS_FILE = 'list_offsets.npy'  # First row of every IVF list, the rows are sorted by list
+METADATA_FILE = 'metadata.sqlite3'  # Sidecar with the ID, text and metadata of every row
+DTYPES = ('float16', 'int8')  # Storage types of the embeddings
+EXPORT_BATCH = 5000  # Chunks read from Chroma at a time during the export
+SEARCH_BLOCK_ROWS = 4096  # Rows scored at a time, it bounds the memory of a search (about 25 MB at 1536 dimensions)
+DEFAULT_NPROBE = 8  # IVF lists scanned per query
+KMEANS_SAMPLE = 50000  # Rows used to train the IVF centroids
+KMEANS_ITERATIONS = 20  # Iterations of the k-means training
+
+# Function to scale the rows of a matrix to unit length, the dot product is then the cosine similarity
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+# Function to quantize unit vectors to int8 with one scale per row
+def quantize_int8(vectors):
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+# Function to train the IVF centroids with spherical k-means (cosine similarity)
+def train_centroids(sample, lists, iterations=KMEANS_ITERATIONS, seed=0):
+    generator = np.random.default_rng(seed)
+    centroids = sample[generator.choice(len(sample), size=lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=lists)
+        # An empty list restarts from a random row
+        empty = counts == 0
+        sums[empty] = sample[generator.choice(len(sample), size=int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+# Function to select `k` rows with Maximal Marginal Relevance among candidates (unit vectors)
+def maximal_marginal_relevance(query, vectors, k, lambda_mult=0.5):
+    if not len(vectors):
+        return []
+    relevance = vectors @ query
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(vectors)):
+        redundancy = (vectors @ vectors[selected].T).max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+# -------------- EXPORT --------------
+# Function to read the chunks of a Chroma collection in batches: (ids, embeddings, documents, metadatas)
+def _iter_collection(collection, batch_size):
+    for offset in range(0, collection.count(), batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=['embeddings', 'documents', 'metadatas'])
+        if not batch['ids']:
+            break
+        yield batch['ids'], normalize_rows(batch['embeddings']), batch['documents'], batch['metadatas']
+
+# Function to store rows of unit vectors with the storage type of the index
+def _write_rows(embeddings, scales, start, vectors):
+    if scales is None:
+        embeddings[start:start + len(vectors)] = vectors.astype(np.float16)
+    else:
+        embeddings[start:start + len(vectors)], scales[start:start + len(vectors)] = quantize_int8(vectors)
+
+# Function to read rows as float32 unit vectors, from any storage type
+def _read_rows(embeddings, scales, rows):
+    vectors = np.asarray(embeddings[rows], dtype=np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales[rows], dtype=np.float32)[:, None]
+    return vectors
+
+# Function to export a Chroma collection to a compact read-only index in `output_dir`:
+# float16 or int8 embeddings in a memory-mapped .npy file, an optional IVF partition (`ivf_lists` > 0)
+# and a SQLite sidecar with the text and metadata. The index is built next to `output_dir` and
+# swapped in at the end, so the app never sees a half-written index
+def export_index(collection, output_dir=DEFAULT_INDEX_DIRECTORY, dtype='float16', ivf_lists=0, fingerprint=None,
+                 batch_size=EXPORT_BATCH):
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+    count = collection.count()
+    if not count:
+        raise ValueError("The collection is empty, there is nothing to export")
+    build_dir = f"{output_dir.rstrip(os.sep)}.build-{os.getpid()}"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    try:
+        conn = sqlite3.connect(os.path.join(build_dir, METADATA_FILE))
+        conn.execute("CREATE TABLE chunks (position INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL, "
+                     "document TEXT, metadata TEXT)")
+        # With IVF the rows are first written in collection order, then sorted by list
+        stage_path = os.path.join(build_dir, 'stage.npy' if ivf_lists else EMBEDDINGS_FILE)
+        embeddings = scales = None
+        rows = 0
+        for ids, vectors, documents, metadatas in _iter_collection(collection, batch_size):
+            if embeddings is None:
+                shape = (count, vectors.shape[1])
+                embeddings = np.lib.format.open_memmap(stage_path, mode='w+', dtype=dtype, shape=shape)
+                if dtype == 'int8':
+                    scales = np.zeros(count, dtype=np.float32)
+            _write_rows(embeddings, scales, rows, vectors)
+            conn.executemany("INSERT INTO chunks (position, chunk_id, document, metadata) VALUES (?, ?, ?, ?)",
+                             [(rows + index, chunk_id, document, json.dumps(metadata or {}, ensure_ascii=False))
+                              for index, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))])
+            rows += len(ids)
+        ivf_lists = min(ivf_lists, count)
+
+        if ivf_lists:
+            embeddings, scales = _partition(build_dir, conn, embeddings, scales, count, ivf_lists)
+        embeddings.flush()
+        del embeddings
+        if scales is not None:
+            np.save(os.path.join(build_dir, SCALES_FILE), scales[:count])
+        conn.commit()
+        conn.close()
+
+        info = {'count': count, 'dim': shape[1], 'dtype': dtype, 'metric': 'cosine', 'ivf_lists': ivf_lists,
+                'source_fingerprint': fingerprint, 'exported_at': time.time()}
+        with open(os.path.join(build_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(info, f, indent=2)
+        _swap_directory(build_dir, output_dir)
+        return info
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+# Function to sort the staged rows by IVF list: train the centroids on a sample, assign every row,
+# write the rows list after list and renumber the sidecar to the new positions
+def _partition(build_dir, conn, stage, scales, count, lists):
+    generator = np.random.default_rng(0)
+    sample_rows = np.sort(generator.choice(count, size=min(count, KMEANS_SAMPLE), replace=False))
+    centroids = train_centroids(_read_rows(stage, scales, sample_rows), lists)
+    assignments = np.empty(count, dtype=np.int32)
+    for start in range(0, count, SEARCH_BLOCK_ROWS):
+        block = _read_rows(stage, scales, slice(start, min(count, start + SEARCH_BLOCK_ROWS)))
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    order = np.argsort(assignments, kind='stable')
+
+    embeddings = np.lib.format.open_memmap(os.path.join(build_dir, EMBEDDINGS_FILE), mode='w+',
+                                           dtype=stage.dtype, shape=(count, stage.shape[1]))
+    for start in range(0, count, SEARCH_BLOCK_ROWS):
+        rows = order[start:start + SEARCH_BLOCK_ROWS]
+        embeddings[start:start + len(rows)] = stage[rows]
+    sorted_scales = scales[order] if scales is not None else None
+    del stage
+    os.remove(os.path.join(build_dir, 'stage.npy'))
+
+    conn.execute("CREATE TEMP TABLE moves (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO moves (old, new) VALUES (?, ?)",
+                     ((int(old), new) for new, old in enumerate(order)))
+    conn.execute("ALTER TABLE chunks RENAME TO staged_chunks")
+    conn.execute("CREATE TABLE chunks (position INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL, "
+                 "document TEXT, metadata TEXT)")
+    conn.execute("INSERT INTO chunks (position, chunk_id, document, metadata) SELECT moves.new, chunk_id, document, "
+                 "metadata FROM staged_chunks JOIN moves ON moves.old = staged_chunks.position")
+    conn.execute("DROP TABLE staged_chunks")
+    conn.commit()
+    conn.execute("VACUUM")
+
+    np.save(os.path.join(build_dir, CENTROIDS_FILE), centroids)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=lists))]).astype(np.int64)
+    np.save(os.path.join(build_dir, LIST_OFFSETS_FILE), offsets)
+    return embeddings, sorted_scales
+
+# Function to replace a directory with a new one, the previous one is removed once the new one is in place
+def _swap_directory(new_dir, target_dir):
+    old_dir = None
+    if os.path.exists(target_dir):
+        old_dir = f"{target_dir.rstrip(os.sep)}.old-{os.getpid()}"
+        os.rename(target_dir, old_dir)
+    os.rename(new_dir, target_dir)
+    if old_dir is not None:
+        # Processes that still map the old files keep reading them until they reopen the index
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+# Function to export the index again with the settings of the existing export, None if there is none
+def refresh_index(collection, output_dir=DEFAULT_INDEX_DIRECTORY, fingerprint=None):
+    info_path = os.path.join(output_dir, INDEX_FILE)
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    return export_index(collection, output_dir, dtype=info['dtype'], ivf_lists=info['ivf_lists'], fingerprint=fingerprint)
+
+# Function to check whether an index was exported to a directory
+def index_exists(directory=DEFAULT_INDEX_DIRECTORY):
+    return os.path.exists(os.path.join(directory, INDEX_FILE))
+
+# -------------- SEARCH --------------
+# Class querying an exported index without loading it: the embeddings are memory-mapped and scored
+# in blocks, so only the pages a search touches are read; an IVF index scans only `nprobe` lists
+# It answers the same search calls as the LangChain Chroma store used by retrieval.py
+class VectorIndex:
+    def __init__(self, directory=DEFAULT_INDEX_DIRECTORY, nprobe=DEFAULT_NPROBE):
+        self.directory = directory
+        self.nprobe = nprobe
+        self._info_path = os.path.join(directory, INDEX_FILE)
+        self._info_mtime = os.stat(self._info_path).st_mtime_ns
+        with open(self._info_path, 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self._exported_info = self.info  # Description of the export on disk, read again when index.json changes
+        self.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode='r')
+        self.scales = np.load(os.path.join(directory, SCALES_FILE), mmap_mode='r') if self.info['dtype'] == 'int8' else None
+        self.centroids = self.list_offsets = None
+        if self.info['ivf_lists']:
+            self.centroids = np.load(os.path.join(directory, CENTROIDS_FILE))
+            self.list_offsets = np.load(os.path.join(directory, LIST_OFFSETS_FILE))
+        uri = f"file:{os.path.abspath(os.path.join(directory, METADATA_FILE))}?mode=ro"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    # Function to get the number of chunks in the index
+    def count(self):
+        return self.info['count']
+
+    # Function to get the description of the export currently on disk (update_embeddings.py exports
+    # again in place), index.json is only read again when its modification time changed
+    def exported_info(self):
+        try:
+            mtime = os.stat(self._info_path).st_mtime_ns
+            if mtime != self._info_mtime:
+                with open(self._info_path, 'r', encoding='utf-8') as f:
+                    self._exported_info = json.load(f)
+                self._info_mtime = mtime
+        except (OSError, ValueError):
+            # Between the two renames of an export, the previous description is kept
+            pass
+        return self._exported_info
+
+    # Function to check whether the index was exported again since it was opened
+    def is_stale(self):
+        return self.exported_info()['exported_at'] != self.info['exported_at']
+
+    # Function to get a fingerprint of the index on disk, it changes with every export
+    def fingerprint(self):
+        info = self.exported_info()
+        return f"index:{info['count']}:{info['exported_at']}:{info.get('source_fingerprint')}"
+
+    # Function to get the row ranges to scan for a query: the whole index, or the `nprobe` closest IVF lists
+    def _row_ranges(self, query, nprobe):
+        if self.centroids is None:
+            return [(0, self.info['count'])]
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return [(int(self.list_offsets[i]), int(self.list_offsets[i + 1])) for i in sorted(lists)]
+
+    # Function to find the `k` rows closest to a query embedding, as (rows, cosine similarities) best first
+    def search(self, query_embedding, k=6, nprobe=None):
+        query = normalize_rows(query_embedding)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start, end in self._row_ranges(query, nprobe):
+            for block_start in range(start, end, SEARCH_BLOCK_ROWS):
+                block_end = min(end, block_start + SEARCH_BLOCK_ROWS)
+                scores = _read_rows(self.embeddings, self.scales, slice(block_start, block_end)) @ query
+                if len(scores) > k:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    scores, rows = scores[top], top + block_start
+                else:
+                    rows = np.arange(block_start, block_end)
+                best_rows = np.concatenate([best_rows, rows])
+                best_scores = np.concatenate([best_scores, scores])
+                if len(best_scores) > k:
+                    top = np.argpartition(-best_scores, k - 1)[:k]
+                    best_rows, best_scores = best_rows[top], best_scores[top]
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    # Function to get the stored chunk IDs of some rows
+    def chunk_ids(self, rows):
+        records = self._records(rows)
+        return [records[int(row)][0] for row in rows]
+
+    # Function to get the (chunk_id, document, metadata) of some rows from the sidecar
+    def _records(self, rows):
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        placeholders = ', '.join('?' * len(rows))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT position, chunk_id, document, metadata FROM chunks WHERE position IN ({placeholders})", rows)
+            return {position: (chunk_id, document, json.loads(metadata)) for position, chunk_id, document, metadata in cursor}
+
+    # Function to build the LangChain documents of some rows, in the same order
+    def documents(self, rows):
+        from langchain_core.documents import Document  # Import Document to return the same results as Chroma
+        records = self._records(rows)
+        return [Document(page_content=records[int(row)][1] or '', metadata=records[int(row)][2]) for row in rows]
+
+    # Function to get the `k` chunks closest to an embedding (same call as the Chroma store)
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        rows, _ = self.search(embedding, k)
+        return self.documents(rows)
+
+    # Function to get `k` relevant and diverse chunks among the `fetch_k` closest (same call as the Chroma store)
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        rows, _ = self.search(embedding, max(fetch_k, k))
+        vectors = _read_rows(self.embeddings, self.scales, rows)
+        selected = maximal_marginal_relevance(normalize_rows(embedding), vectors, k, lambda_mult)
+        return self.documents(rows[selected])
+
+    # Function to close the sidecar
+    def close(self):
+        self._conn.close()
+
+if __name__ == '__main__':
+    import argparse  # Import argparse to read the command line options
+    parser = argparse.ArgumentParser(description="Export the Chroma collection to a memory-mapped vector index")
+    parser.add_argument('--persist-directory', default='./chroma_db', help="Chroma database to export")
+    parser.add_argument('--output', default=DEFAULT_INDEX_DIRECTORY, help="Directory of the exported index")
+    parser.add_argument('--dtype', choices=DTYPES, default='float16', help="Storage type of the embeddings")
+    parser.add_argument('--ivf-lists', type=int, default=0,
+                        help="Number of IVF lists (0 for an exact search, about the square root of the chunks otherwise)")
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma  # Import Chroma to read the collection
+    from chat_cache import chroma_fingerprint  # Import the fingerprint of the Chroma collection
+    vectordb = Chroma(persist_directory=args.persist_directory)
+    start_time = time.perf_counter()
+    info = export_index(vectordb._collection, args.output, dtype=args.dtype, ivf_lists=args.ivf_lists,
+                        fingerprint=chroma_fingerprint(args.persist_directory))
+    size_mb = sum(os.path.getsize(os.path.join(args.output, name)) for name in os.listdir(args.output)) / 1e6
+    print(f"Exported {info['count']} chunks ({info['dtype']}, {info['ivf_lists']} IVF lists, {size_mb:.1f} MB) "
+          f"to {args.output} in {time.perf_counter() - start_time:.1f} seconds")
@@ -1,58 +1,34 @@
 import os  # Import the OS module to interact with the operating system
 import re  # Import the regular expression module for string manipulation
+import json  # Import json to save the extracted articles
+import time  # Import time module to measure the crawl
+import hashlib  # Import hashlib to detect unchanged pages
 import asyncio  # Import asyncio for asynchronous programming
-from pyppeteer import launch  # Import pyppeteer for controlling headless browsers
-from lxml import etree  # Import lxml for XML and HTML parsing
-import time  # Import time module to handle delays
-import random  # Import random module for generating random numbers
+from sitemap import get_filtered_sitemap_urls  # Import the shared streaming sitemap parser
+from page_renderer import PageRenderer  # Import the pooled headless-browser renderer
+from html_extraction import extract_article  # Import the main-content extraction from HTML
+from robots import RobotsPolicy  # Import the cached robots.txt policy
+from http_cache import HttpMetadataCache  # Import the persistent HTTP metadata cache for conditional requests
+from frontier import CrawlFrontier, CrawlError, run_crawl  # Import the persistent crawl frontier
+import tracing  # Import the spans and counters of the crawl (turned on with TRACING=1)
+from crawler import HostScheduler, create_session, fetch, is_retryable_status, RETRY_ERRORS  # Import the shared asynchronous crawler helpers
 
 # Configuration
-sitemap_file_path = 'sitemap.xml'  # Path to the sitemap file
+sitemap_file_path = os.getenv('SITEMAP_SOURCE', 'sitemap.xml')  # Path or URL of the sitemap (.xml, .xml.gz or sitemap index)
+sitemap_lastmod_since = os.getenv('SITEMAP_SINCE')  # Only crawl the URLs modified since this date (YYYY-MM-DD)
+sitemap_path_prefixes = ['/news-insights/']  # Only crawl the URLs under these paths
+# 'html' extracts the article text straight from the HTML (no browser), 'pdf' renders every page to PDF
+extraction_mode = os.getenv('NEWS_EXTRACTION_MODE', 'html')
 output_dir_pdfs = "pdf_news_insights"  # Directory to save the PDFs
+output_dir_html = "html_news_insights"  # Directory to save the articles extracted from HTML (JSON)
+http_cache_path = 'http_cache.sqlite3'  # Path to the ETag/Last-Modified cache of the crawled URLs
+max_concurrency = int(os.getenv('CRAWL_CONCURRENCY', '8'))  # Maximum number of requests in flight (html mode)
+host_delay = float(os.getenv('CRAWL_HOST_DELAY', '1.0'))  # Seconds between two requests to a host whose robots.txt sets no Crawl-delay
 error_log_path = 'errores.txt'  # Path to the error log file
-os.makedirs(output_dir_pdfs, exist_ok=True)  # Create the output directory if it doesn't exist
-
-# Function to clean the content of the XML file
-def clean_xml_content(content):
-    # Remove any invalid entity references
-    content = re.sub(r'&(?!(amp|lt|gt|quot|apos);)', '&amp;', content)
-    return content
-
-# Function to extract URLs from the sitemap
-def get_filtered_sitemap_urls(file_path):
-    try:
-        cleaned_content = ""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                if line.strip().startswith("<"):
-                    cleaned_content += line
-        
-        cleaned_content = clean_xml_content(cleaned_content)
-        
-        # Print the first 500 characters of the cleaned sitemap content
-        print(f"Cleaned sitemap file content:\n{cleaned_content[:500]}...")
-        
-        # Parse the cleaned content with lxml
-        root = etree.fromstring(cleaned_content.encode('utf-8'))
-        
-        # Define the XML namespaces
-        namespaces = {
-            'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9',
-            'image': 'http://www.google.com/schemas/sitemap-image/1.1',
-            'xhtml': 'http://www.w3.org/1999/xhtml'
-        }
-        
-        # Find <loc> tags within the specified namespace
-        loc_tags = root.xpath('//ns:loc', namespaces=namespaces)
-        print(f"Number of <loc> tags found: {len(loc_tags)}")
-        
-        # Filter URLs containing '/news-insights/'
-        urls = [loc.text for loc in loc_tags if '/news-insights/' in loc.text]
-        print(f"Filtered URLs extracted from sitemap: {len(urls)}")
-        return urls
-    except Exception as e:
-        print(f"Error reading the sitemap: {e}")
-        return []
+empty_log_path = 'sin_articulo.txt'  # Path to the log of the pages where no article text was found
+render_tabs = int(os.getenv('RENDER_TABS', '4'))  # Number of browser tabs rendering pages at the same time
+page_timeout = int(os.getenv('RENDER_PAGE_TIMEOUT', '60'))  # Seconds allowed to load and print one page
+os.makedirs(output_dir_html if extraction_mode == 'html' else output_dir_pdfs, exist_ok=True)  # Create the output directory if it doesn't exist
 
 # Function to log errors
 def log_error(url, error_message):
@@ -60,55 +36,168 @@ def log_error(url, error_message):
         f.write(f"{url}: {error_message}\n")
     print(f"Logged error: {url} - {error_message}")
 
-# Asynchronous function to save a web page as a PDF
-async def save_page_as_pdf(url):
+# Function to log the pages where the extraction found no article text, kept apart from the crawl errors
+# so a page layout the extractor misses can be reviewed (the page is extracted again once it changes)
+def log_empty_article(url):
+    with open(empty_log_path, 'a') as f:
+        f.write(f"{url}\n")
+    print(f"No article content found: {url}")
+
+# Script run in every page before printing it: remove logos from the header and mobile view
+REMOVE_LOGOS_SCRIPT = '''() => {
+    const headerLogo = document.querySelector('header .Header-branding-logo');
+    if (headerLogo) {
+        headerLogo.remove();
+    }
+    const mobileLogo = document.querySelector('.Mobile-bar-branding-logo');
+    if (mobileLogo) {
+        mobileLogo.remove();
+    }
+}'''
+
+# Asynchronous function to save a web page as a PDF with an already open tab
+async def save_page_as_pdf(page, url):
+    print(f"Processing URL: {url}")
+    await page.goto(url, {'waitUntil': 'networkidle2', 'timeout': page_timeout * 1000})
+    await page.evaluate(REMOVE_LOGOS_SCRIPT)
+
+    # Generate the PDF file name by replacing non-alphanumeric characters with underscores
+    pdf_name = re.sub(r'\W+', '_', url) + '.pdf'
+    output_path = os.path.join(output_dir_pdfs, pdf_name)
+    part_path = f"{output_path}.part"
+
+    # Save the page as a PDF with custom margins, renamed atomically so a failed page leaves no partial file
+    await page.pdf({
+        'path': part_path,
+        'format': 'A4',
+        'printBackground': True,
+        'scale': 0.6,
+    })
+    os.replace(part_path, output_path)
+    print(f"Saved PDF: {output_path}")
+
+# -------------- HTML EXTRACTION --------------
+# Asynchronous function to fetch a page and save its main article as a JSON document for the ingest pipeline
+# Pages answering 304 Not Modified, or with the same content as last time, are not extracted again
+# Failures raise CrawlError so the frontier retries them later
+async def save_page_as_article(session, scheduler, http_cache, url, stats):
+    doc_path = os.path.join(output_dir_html, re.sub(r'\W+', '_', url) + '.json')
+    has_copy = os.path.exists(doc_path)
     try:
-        # Configure pyppeteer to launch a headless browser
-        browser = await launch(headless=True)
-        page = await browser.newPage()
-        await page.goto(url, {'waitUntil': 'networkidle2'})
-        
-        # Remove logos from the header and mobile view
-        await page.evaluate('''() => {
-            const headerLogo = document.querySelector('header .Header-branding-logo');
-            if (headerLogo) {
-                headerLogo.remove();
-            }
-            const mobileLogo = document.querySelector('.Mobile-bar-branding-logo');
-            if (mobileLogo) {
-                mobileLogo.remove();
-            }
-        }''')
-
-        # Generate the PDF file name by replacing non-alphanumeric characters with underscores
-        pdf_name = re.sub(r'\W+', '_', url) + '.pdf'
-        output_path = os.path.join(output_dir_pdfs, pdf_name)
-        
-        # Save the page as a PDF with custom margins
-        await page.pdf({
-            'path': output_path,
-            'format': 'A4',
-            'printBackground': True,
-            'scale': 0.6,
-        })
-        print(f"Saved PDF: {output_path}")
-        
-        await browser.close()
-    except Exception as e:
-        log_error(url, str(e))
-
-# Get all the URLs from the sitemap
-filtered_sitemap_urls = get_filtered_sitemap_urls(sitemap_file_path)
-
-print(f"Extracted URLs from sitemap: {len(filtered_sitemap_urls)}")
-
-# Process each URL and save as PDF
-async def main():
-    for url in filtered_sitemap_urls:
-        print(f"Processing URL: {url}")
-        await save_page_as_pdf(url)
-        # Introduce a random delay between 3 and 7 seconds
-        time.sleep(random.uniform(3, 7))
-
-# Run the main function asynchronously
-asyncio.get_event_loop().run_until_complete(main())
+        status, headers, content = await fetch(session, scheduler, url,
+                                               headers=http_cache.conditional_headers(url) if has_copy else None)
+    except RETRY_ERRORS as e:
+        raise CrawlError(str(e) or type(e).__name__)
+    if status == 304:
+        http_cache.record_not_modified(url)
+        stats['unchanged'] += 1
+        return
+    if status != 200:
+        raise CrawlError(f"Status Code: {status}", retryable=is_retryable_status(status))
+    unchanged = http_cache.record_response(url, headers, hashlib.sha256(content).hexdigest(), len(content))
+    if unchanged and has_copy:
+        stats['unchanged'] += 1
+        return
+
+    # Parse the HTML in a thread so the event loop keeps serving the other requests
+    with tracing.span('crawl.parse', url=url) as span:
+        article = await asyncio.to_thread(extract_article, content, url)
+        span.set('sections', len(article['sections']))
+    if not article['sections']:
+        # Not a crawl failure: the fetch worked, nothing is written so the next crawl extracts the page again
+        log_empty_article(url)
+        stats['empty'] += 1
+        return
+    article['fetched_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    # Written to a temporary file and renamed, the ingest never reads a half-written article
+    with open(f"{doc_path}.part", 'w', encoding='utf-8') as f:
+        json.dump(article, f, ensure_ascii=False, indent=1)
+    os.replace(f"{doc_path}.part", doc_path)
+    stats['articles'] += 1
+    print(f"Saved article: {doc_path}")
+
+# Function to extract the articles of the frontier URLs with the pooled HTTP client
+async def extract_articles(session, scheduler, frontier, robots_policy):
+    http_cache = HttpMetadataCache(http_cache_path)
+    stats = {'articles': 0, 'unchanged': 0, 'empty': 0}
+    start_time = time.perf_counter()
+
+    # Function crawling one URL of the frontier
+    async def handle(url, kind, output_path):
+        # Disallowed URLs are skipped before any request goes out
+        if not await robots_policy.allowed(session, scheduler, url):
+            print(f"Disallowed by robots.txt: {url}")
+            return
+        await save_page_as_article(session, scheduler, http_cache, url, stats)
+
+    await run_crawl(frontier, handle, log_error, concurrency=max_concurrency)
+    elapsed = time.perf_counter() - start_time
+    print(f"Extracted {stats['articles']} articles ({stats['unchanged']} unchanged, {stats['empty']} without "
+          f"article content, see {empty_log_path}) in {elapsed:.1f} seconds")
+    print(http_cache.summary())
+    http_cache.close()
+    return {'pages': stats['articles'] + stats['unchanged'] + stats['empty'], **stats, 'seconds': elapsed}
+
+# -------------- PDF RENDERING --------------
+# Function to render the frontier URLs to PDF with the tabs of one browser
+async def render_pdfs(session, scheduler, frontier, robots_policy):
+    start_time = time.perf_counter()
+    async with PageRenderer(tabs=render_tabs, page_timeout=page_timeout) as renderer:
+
+        # Function rendering one URL of the frontier
+        async def handle(url, kind, output_path):
+            if not await robots_policy.allowed(session, scheduler, url):
+                print(f"Disallowed by robots.txt: {url}")
+                return
+            delay = robots_policy.crawl_delay(url)
+            delay = host_delay if delay is None else delay
+            # Every tab pauses `tabs` times the host delay after each page, so the site gets one page per delay
+            renderer.delay_range = (delay * render_tabs, delay * render_tabs * 1.25)
+            try:
+                await renderer.render(url, save_page_as_pdf)
+            except Exception as e:
+                raise CrawlError(str(e) or type(e).__name__)
+
+        await run_crawl(frontier, handle, log_error, concurrency=render_tabs)
+        stats = renderer.stats
+    elapsed = time.perf_counter() - start_time
+    print(f"Rendered {stats['pages']} pages with {render_tabs} tabs in {elapsed:.1f} seconds "
+          f"({stats['pages'] / elapsed if elapsed else 0:.2f} pages/s), {stats['errors']} errors, "
+          f"{stats['recycled_tabs']} tabs recycled, {stats['browser_launches']} browser launches")
+    return {**stats, 'seconds': elapsed}
+
+# Process each URL: extract its article from the HTML, or render it to PDF with the tabs of one browser
+# Returns the counters of the run (pages, articles or rendering errors, seconds)
+async def main(restart=False, retry_failed=False):
+    tracing.configure(service='crawl-news-insights')
+    frontier = CrawlFrontier('news-insights')
+    if retry_failed:
+        print(f"Failed URLs queued again: {frontier.retry_failed()}")
+    if frontier.begin(restart=restart):
+        print(f"Resuming the crawl: {frontier.summary()}")
+    else:
+        # Get all the URLs from the sitemap
+        filtered_sitemap_urls = get_filtered_sitemap_urls(sitemap_file_path, sitemap_path_prefixes, sitemap_lastmod_since)
+        print(f"Extracted URLs from sitemap: {len(filtered_sitemap_urls)}")
+        frontier.add_many(filtered_sitemap_urls, kind='page')
+    robots_policy = RobotsPolicy()
+
+    async with create_session(max_connections=max_concurrency * 2, limit_per_host=max_concurrency) as session:
+        # The scheduler enforces the global concurrency limit and the per-host politeness delay,
+        # the robots.txt Crawl-delay or Request-rate of each host replaces the default delay
+        scheduler = HostScheduler(max_concurrency=max_concurrency, host_delay=host_delay)
+        with tracing.span('crawl.run', crawl='news-insights', mode=extraction_mode):
+            if extraction_mode == 'html':
+                stats = await extract_articles(session, scheduler, frontier, robots_policy)
+            else:
+                stats = await render_pdfs(session, scheduler, frontier, robots_policy)
+
+    print(frontier.summary())
+    print(robots_policy.summary())
+    frontier.close()
+    tracing.flush()
+    return stats
+
+# Run the main function asynchronously (crawl.py also resumes or retries this crawl)
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,94 +1,63 @@
 import os  # Import the OS module to interact with the operating system
-import requests  # Import requests module for making HTTP requests
-from lxml import etree  # Import lxml for XML parsing
-import re  # Import the regular expression module for string manipulation
+import asyncio  # Import asyncio for asynchronous programming
+import time  # Import time module to measure the crawl
+import hashlib  # Import hashlib to detect unchanged pages
 from urllib.parse import urljoin  # Import urljoin for URL parsing and joining
-from requests.adapters import HTTPAdapter  # Import HTTPAdapter for configuring HTTP sessions
-from urllib3.util.retry import Retry  # Import Retry for handling retries in HTTP requests
-import time  # Import time module to handle delays
-import random  # Import random module for generating random numbers
 from bs4 import BeautifulSoup  # Import BeautifulSoup for parsing HTML
 from dotenv import load_dotenv  # Import function to load environment variables from a .env file
+from sitemap import get_filtered_sitemap_urls  # Import the shared streaming sitemap parser
+from robots import RobotsPolicy  # Import the cached robots.txt policy
+from http_cache import HttpMetadataCache  # Import the persistent HTTP metadata cache for conditional requests
+from frontier import CrawlFrontier, CrawlError, run_crawl  # Import the persistent crawl frontier
+import tracing  # Import the spans and counters of the crawl (turned on with TRACING=1)
+from crawler import HostScheduler, create_session, fetch, download_file, is_retryable_status, DownloadError, RETRY_ERRORS  # Import the shared asynchronous crawler helpers
 
 # Load environment variables from a .env file
 load_dotenv()
 
 # Configuration
-sitemap_file_path = 'sitemap.xml'  # Path to the sitemap file
+sitemap_file_path = os.getenv('SITEMAP_SOURCE', 'sitemap.xml')  # Path or URL of the sitemap (.xml, .xml.gz or sitemap index)
+sitemap_lastmod_since = os.getenv('SITEMAP_SINCE')  # Only crawl the URLs modified since this date (YYYY-MM-DD)
+sitemap_path_prefixes = ['/reports/']  # Only crawl the URLs under these paths
 domain = os.getenv('URL_DOMAIN')  # Get the domain URL from environment variables
 output_dir = "pdf_reports"  # Directory to save the PDFs
 error_log_path = 'errores.txt'  # Path to the error log file
+http_cache_path = 'http_cache.sqlite3'  # Path to the ETag/Last-Modified cache of the crawled URLs
+max_concurrency = int(os.getenv('CRAWL_CONCURRENCY', '8'))  # Maximum number of requests in flight
+host_delay = float(os.getenv('CRAWL_HOST_DELAY', '1.0'))  # Seconds between two requests to a host whose robots.txt sets no Crawl-delay
 os.makedirs(output_dir, exist_ok=True)  # Create the output directory if it doesn't exist
 
-# List of User-Agents for rotation
-user_agents = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
-    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:89.0) Gecko/20100101 Firefox/89.0"
-]
+# Function to check that a downloaded file is a complete PDF
+def is_pdf_file(path):
+    with open(path, 'rb') as f:
+        header = f.read(5)
+        f.seek(max(0, os.path.getsize(path) - 1024))
+        trailer = f.read()
+    return header == b'%PDF-' and b'%%EOF' in trailer
 
-# Function to clean the XML content
-def clean_xml_content(content):
-    # Remove any invalid entity references
-    content = re.sub(r'&(?!(amp|lt|gt|quot|apos);)', '&amp;', content)
-    return content
-
-# Function to extract URLs from the sitemap
-def get_filtered_sitemap_urls(file_path):
-    try:
-        cleaned_content = ""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                if line.strip().startswith("<"):
-                    cleaned_content += line
-        
-        cleaned_content = clean_xml_content(cleaned_content)
-        
-        # Print the first 500 characters of the cleaned sitemap content
-        print(f"Cleaned sitemap file content:\n{cleaned_content[:500]}...")
-        
-        # Parse the cleaned content with lxml
-        root = etree.fromstring(cleaned_content.encode('utf-8'))
-        
-        # Define the XML namespaces
-        namespaces = {
-            'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9',
-            'image': 'http://www.google.com/schemas/sitemap-image/1.1',
-            'xhtml': 'http://www.w3.org/1999/xhtml'
-        }
-        
-        # Find <loc> tags within the specified namespace
-        loc_tags = root.xpath('//ns:loc', namespaces=namespaces)
-        print(f"Number of <loc> tags found: {len(loc_tags)}")
-        
-        # Filter URLs containing '/reports/'
-        urls = [loc.text for loc in loc_tags if '/reports/' in loc.text]
-        print(f"Filtered URLs extracted from sitemap: {len(urls)}")
-        return urls
-    except Exception as e:
-        print(f"Error reading the sitemap: {e}")
-        return []
-
-# Function to download PDF with SSL verification
-def download_pdf(url, output_path):
+# Function to download a PDF (SSL certificates are verified by default)
+# The file is streamed to a temporary file, resumed if interrupted, verified and renamed atomically;
+# when a copy is already on disk the request is conditional and a 304 skips the download
+# Failures raise CrawlError so the frontier retries them later
+async def download_pdf(session, scheduler, url, output_path):
     try:
-        # Configure the HTTP session with retries
-        session = requests.Session()
-        retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504])
-        session.mount('https://', HTTPAdapter(max_retries=retries))
-        headers = {'User-Agent': random.choice(user_agents)}
-        response = session.get(url, headers=headers, verify=True)
-        if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            print(f"Downloaded PDF: {output_path}")
-        else:
-            log_error(url, f"Status Code: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        log_error(url, str(e))
-    except requests.exceptions.SSLError as ssl_e:
-        log_error(url, f"SSL Error: {ssl_e}")
+        has_copy = os.path.exists(output_path) and not os.path.exists(f"{output_path}.part")
+        headers = http_cache.conditional_headers(url) if has_copy else None
+        status, content_hash, response_headers = await download_file(
+            session, scheduler, url, output_path, validate=is_pdf_file, headers=headers
+        )
+    except DownloadError as e:
+        raise CrawlError(f"Download Error: {e}")
+    except RETRY_ERRORS as e:
+        raise CrawlError(str(e) or type(e).__name__)
+    if status == 304:
+        http_cache.record_not_modified(url)
+        print(f"Unchanged PDF: {output_path}")
+    elif status in (200, 206):
+        http_cache.record_response(url, response_headers, content_hash, os.path.getsize(output_path))
+        print(f"Downloaded PDF: {output_path}")
+    else:
+        raise CrawlError(f"Status Code: {status}", retryable=is_retryable_status(status))
 
 # Function to log errors
 def log_error(url, error_message):
@@ -96,36 +65,118 @@ def log_error(url, error_message):
         f.write(f"{url}: {error_message}\n")
     print(f"Logged error: {url} - {error_message}")
 
-# Function to scrape and download PDFs from a page
-def scrape_and_download_pdfs(page_url):
+# Function to extract the links to PDF files of a page
+def extract_pdf_links(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    links = soup.find_all('a', href=True)
+    return len(links), [link['href'] for link in links if link['href'].endswith('.pdf')]
+
+# Function to queue the download of the PDFs linked from a page
+def queue_pdf_downloads(frontier, pdf_hrefs):
+    for href in pdf_hrefs:
+        pdf_url = urljoin(domain, href)
+        pdf_name = pdf_url.split('/')[-1]
+        output_path = os.path.join(output_dir, pdf_name)
+        # A PDF linked from several report pages is downloaded only once per run (the frontier
+        # ignores URLs already queued, this set catches different URLs with the same file name)
+        if output_path in scheduled_outputs:
+            continue
+        if frontier.add(pdf_url, kind='pdf', priority=PDF_PRIORITY, output_path=output_path):
+            scheduled_outputs.add(output_path)
+
+# Function to scrape a page and queue the download of its PDFs
+# Unchanged pages (304, or same content hash) are not parsed again: the links stored last time are reused
+# The ETag / Last-Modified of a page are only recorded together with its links, so a 304 always has links to reuse
+async def scrape_and_download_pdfs(session, scheduler, frontier, page_url, conditional=True):
+    entry = http_cache.get(page_url)
+    stored_links = (entry or {}).get('links')
     try:
-        headers = {'User-Agent': random.choice(user_agents)}
-        response = requests.get(page_url, headers=headers)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            pdf_links = soup.find_all('a', href=True)
-            if not pdf_links:
-                log_error(page_url, "No PDF links found")
-            for link in pdf_links:
-                href = link['href']
-                if href.endswith('.pdf'):
-                    pdf_url = urljoin(domain, href)
-                    pdf_name = pdf_url.split('/')[-1]
-                    output_path = os.path.join(output_dir, pdf_name)
-                    download_pdf(pdf_url, output_path)
-        else:
-            log_error(page_url, f"Status Code: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        log_error(page_url, str(e))
+        status, headers, content = await fetch(session, scheduler, page_url,
+                                               headers=http_cache.conditional_headers(page_url) if conditional else None)
+    except RETRY_ERRORS as e:
+        raise CrawlError(str(e) or type(e).__name__)
+    if status == 304:
+        if stored_links is None:
+            # Validators recorded without links (older cache entries): fetch the page in full
+            await scrape_and_download_pdfs(session, scheduler, frontier, page_url, conditional=False)
+            return
+        http_cache.record_not_modified(page_url)
+        queue_pdf_downloads(frontier, stored_links)
+    elif status == 200:
+        content_hash = hashlib.sha256(content).hexdigest()
+        if stored_links is not None and entry['content_hash'] == content_hash:
+            http_cache.record_response(page_url, headers, content_hash, len(content))
+            queue_pdf_downloads(frontier, stored_links)
+            return
+        # Parse the HTML in a thread so the event loop keeps serving the other requests
+        with tracing.span('crawl.parse', url=page_url) as span:
+            links_found, pdf_hrefs = await asyncio.to_thread(extract_pdf_links, content)
+            span.set('pdf_links', len(pdf_hrefs))
+        http_cache.record_response(page_url, headers, content_hash, len(content), links=pdf_hrefs)
+        if not links_found:
+            log_error(page_url, "No PDF links found")
+        queue_pdf_downloads(frontier, pdf_hrefs)
+    else:
+        raise CrawlError(f"Status Code: {status}", retryable=is_retryable_status(status))
+
+# -------------- CRAWL --------------
+# PDFs are served before pending pages, so downloads overlap with page fetches instead of piling up
+PDF_PRIORITY, PAGE_PRIORITY = 0, 1
+scheduled_outputs = set()  # PDF output paths already queued in this process
+http_cache = HttpMetadataCache(http_cache_path)  # ETag, Last-Modified and content hash of every URL
+robots_policy = RobotsPolicy()  # robots.txt rules of every host, they also set the delay of each host
+
+# Function to crawl the report pages and download their PDFs with one pooled HTTP client
+# The URLs live in the crawl frontier: an interrupted crawl resumes where it stopped, `restart`
+# starts a new run from the sitemap and `retry_failed` retries every failed URL now
+# Returns the counters of the run (pages, PDFs, disallowed URLs, seconds)
+async def main(restart=False, retry_failed=False):
+    tracing.configure(service='crawl-reports')
+    frontier = CrawlFrontier('reports')
+    if retry_failed:
+        print(f"Failed URLs queued again: {frontier.retry_failed()}")
+    if frontier.begin(restart=restart):
+        print(f"Resuming the crawl: {frontier.summary()}")
+    else:
+        # Get all the URLs from the sitemap
+        filtered_sitemap_urls = get_filtered_sitemap_urls(sitemap_file_path, sitemap_path_prefixes, sitemap_lastmod_since)
+        print(f"Extracted URLs from sitemap: {len(filtered_sitemap_urls)}")
+        frontier.add_many(filtered_sitemap_urls, kind='page', priority=PAGE_PRIORITY)
+
+    stats = {'pages': 0, 'pdfs': 0, 'disallowed': 0}
+    start_time = time.perf_counter()
+    async with create_session(max_connections=max_concurrency * 2, limit_per_host=max_concurrency) as session:
+        # The scheduler enforces the global concurrency limit and the per-host politeness delay,
+        # the robots.txt Crawl-delay or Request-rate of each host replaces the default delay
+        scheduler = HostScheduler(max_concurrency=max_concurrency, host_delay=host_delay)
+
+        # Function crawling one URL of the frontier
+        async def handle(url, kind, output_path):
+            # Disallowed URLs are skipped before any request goes out
+            if not await robots_policy.allowed(session, scheduler, url):
+                print(f"Disallowed by robots.txt: {url}")
+                stats['disallowed'] += 1
+            elif kind == 'page':
+                print(f"Processing URL: {url}")
+                await scrape_and_download_pdfs(session, scheduler, frontier, url)
+                stats['pages'] += 1
+            else:
+                await download_pdf(session, scheduler, url, output_path)
+                stats['pdfs'] += 1
 
-# Get all the URLs from the sitemap
-filtered_sitemap_urls = get_filtered_sitemap_urls(sitemap_file_path)
+        with tracing.span('crawl.run', crawl='reports'):
+            await run_crawl(frontier, handle, log_error, concurrency=max_concurrency)
 
-print(f"Extracted URLs from sitemap: {len(filtered_sitemap_urls)}")
+    elapsed = time.perf_counter() - start_time
+    print(f"Crawled {stats['pages']} pages and {stats['pdfs']} PDFs in {elapsed:.1f} seconds "
+          f"({stats['pages'] / elapsed if elapsed else 0:.2f} pages/s)")
+    print(frontier.summary())
+    print(http_cache.summary())
+    print(robots_policy.summary())
+    frontier.close()
+    tracing.flush()
+    return {**stats, 'seconds': elapsed}
 
-# Process each URL and download the PDFs
-for url in filtered_sitemap_urls:
-    print(f"Processing URL: {url}")
-    scrape_and_download_pdfs(url)
-    # Introduce a random delay between 3 and 7 seconds
-    time.sleep(random.uniform(3, 7))
+# Process each URL and download the PDFs (crawl.py also resumes or retries this crawl)
+if __name__ == '__main__':
+    asyncio.run(main())